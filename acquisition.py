@@ -0,0 +1,260 @@
+#acquisition.py ver 0.5.0
+#bounded hand-off queues between the network reader, the acquisition worker and the GUI
+import threading
+import time
+import numpy as np
+from telemetry import SAMPLE_DTYPE
+
+# What a stage does when more samples are queued than its capacity:
+POLICY_BLOCK = "block"# never drop: put() waits for space (or reports over_capacity() if it may not wait)
+POLICY_COALESCE = "coalesce"# keep the newest `capacity` samples, drop the oldest (display: latest view)
+POLICY_DECIMATE = "decimate"# thin pending 2:1 until it fits, later puts alike (display: whole trace, less detail)
+POLICIES = (POLICY_BLOCK, POLICY_COALESCE, POLICY_DECIMATE)
+
+
+def block_length(block):
+    # Blocks are structured arrays or dicts of equal-length column arrays
+    if isinstance(block, dict):
+        return len(next(iter(block.values()))) if block else 0
+    return len(block)
+
+
+def concat_blocks(blocks):
+    if len(blocks) == 1:
+        return blocks[0]
+    if isinstance(blocks[0], dict):
+        return {name: np.concatenate([b[name] for b in blocks]) for name in blocks[0]}
+    return np.concatenate(blocks)
+
+
+def slice_block(block, index):
+    if isinstance(block, dict):
+        return {name: column[index] for name, column in block.items()}
+    return block[index]
+
+
+def thin_block(block, step=2, peak_columns=()):
+    """
+    Keeps every step-th sample. Columns in peak_columns keep the largest value of
+    each group, so one-sample markers (fraction marks) survive decimation.
+    """
+    thinned = slice_block(block, slice(None, None, step))
+    if isinstance(block, dict) and peak_columns:
+        for name in peak_columns:
+            if name in block:
+                column = block[name]
+                thinned[name] = np.maximum.reduceat(column, np.arange(0, len(column), step)) if len(column) else column
+    return thinned
+
+
+class StageQueue:
+    """
+    Bounded queue of sample blocks between two pipeline stages.
+
+    Capacity is counted in samples. get() returns everything pending merged into
+    one block, so a slow consumer catches up in one step instead of draining a
+    backlog of small blocks. notify() fires when the queue goes from empty to
+    non-empty (one cross-thread dispatch however many puts follow), and
+    space_callback() when a queue that went over capacity has been drained.
+    Depth and drop counters are available from stats().
+    """
+
+    def __init__(self, name, capacity, policy=POLICY_BLOCK, notify=None, peak_columns=()):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown queue policy {policy!r}")
+        self.name = name
+        self.capacity = capacity
+        self.policy = policy
+        self.peak_columns = peak_columns
+        self._notify = notify
+        self.space_callback = None
+        self._cond = threading.Condition()
+        self._blocks = []
+        self._depth = 0
+        self._notified = False
+        self._was_full = False
+        self._closed = False
+        self._stride = 1# POLICY_DECIMATE: current thinning of everything pending
+        self.max_depth = 0
+        self.samples_in = 0
+        self.samples_out = 0
+        self.dropped = 0
+        self.blocked_seconds = 0.0
+        self.gets = 0
+
+    def put(self, block, wait=True, timeout=None):
+        """
+        Adds a block. With POLICY_BLOCK and wait=True this waits for space (returns
+        False on timeout or close, block not added); with wait=False the block is
+        always accepted and over_capacity() tells the producer to back off.
+        """
+        count = block_length(block)
+        if not count:
+            return True
+        with self._cond:
+            if self.policy == POLICY_BLOCK and wait and self._depth and self._depth + count > self.capacity:
+                started = time.monotonic()
+                deadline = None if timeout is None else started + timeout
+                while self._depth and self._depth + count > self.capacity and not self._closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self.blocked_seconds += time.monotonic() - started
+                if self._closed or (self._depth and self._depth + count > self.capacity):
+                    return False
+            self.samples_in += count
+            if self._stride > 1:
+                # Keep one resolution across the backlog: thin new blocks like the pending ones
+                block = thin_block(block, self._stride, self.peak_columns)
+                self.dropped += count - block_length(block)
+                count = block_length(block)
+            self._blocks.append(block)
+            self._depth += count
+            if self._depth > self.capacity:
+                self._was_full = True
+                if self.policy != POLICY_BLOCK:
+                    self._shed()
+            self.max_depth = max(self.max_depth, self._depth)
+            notify = not self._notified
+            self._notified = True
+            self._cond.notify_all()
+        if notify and self._notify is not None:
+            self._notify()
+        return True
+
+    def get(self, timeout=0.0):
+        """
+        Returns everything pending as one block, or None if nothing arrived within
+        timeout (0 = don't wait, None = wait until data or close()).
+        """
+        space = False
+        with self._cond:
+            if not self._blocks and timeout != 0.0:
+                self._cond.wait_for(lambda: self._blocks or self._closed, timeout)
+            self._notified = False
+            if not self._blocks:
+                return None
+            blocks, self._blocks = self._blocks, []
+            count, self._depth = self._depth, 0
+            self._stride = 1
+            self.samples_out += count
+            self.gets += 1
+            if self._was_full:
+                self._was_full = False
+                space = True
+            self._cond.notify_all()
+        if space and self.space_callback is not None:
+            self.space_callback()
+        return concat_blocks(blocks)
+
+    def over_capacity(self):
+        return self._depth > self.capacity
+
+    def depth(self):
+        return self._depth
+
+    def clear(self):
+        with self._cond:
+            self._blocks = []
+            self._depth = 0
+            self._notified = False
+            self._was_full = False
+            self._stride = 1
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        with self._cond:
+            self._closed = False
+
+    def stats(self):
+        return {
+            "name": self.name, "policy": self.policy, "capacity": self.capacity, "depth": self._depth,
+            "max_depth": self.max_depth, "samples_in": self.samples_in, "samples_out": self.samples_out,
+            "dropped": self.dropped, "blocked_s": round(self.blocked_seconds, 3), "gets": self.gets
+        }
+
+    def _shed(self):
+        # Called with the lock held and depth over capacity
+        merged = concat_blocks(self._blocks)
+        before = block_length(merged)
+        if self.policy == POLICY_COALESCE:
+            merged = slice_block(merged, slice(before - self.capacity, None))
+        else:
+            while block_length(merged) > self.capacity:
+                merged = thin_block(merged, 2, self.peak_columns)
+                self._stride *= 2
+        after = block_length(merged)
+        self.dropped += before - after
+        self._blocks = [merged]
+        self._depth = after
+
+
+class SampleBuffer(StageQueue):
+    """
+    Input stage of the acquisition pipeline, filled on the FPLCServerLoop thread.
+
+    Never drops samples: pushes are always accepted, and while over_capacity()
+    the server stops reading the instrument's socket so TCP flow control holds
+    the client back until the worker catches up. Samples pushed while the buffer
+    is inactive (no acquisition running) are discarded.
+    """
+
+    def __init__(self, notify, capacity=1 << 18):
+        super().__init__("acquisition", capacity, POLICY_BLOCK, notify)
+        self.active = False
+        self._rows = []
+        self._rows_lock = threading.Lock()
+
+    def push_block(self, samples):
+        """
+        Adds a SAMPLE_DTYPE array (e.g. a decoded binary frame).
+        """
+        if not self.active:
+            return
+        self._flush_rows()
+        self.put(samples, wait=False)
+
+    def push_sample(self, sample):
+        """
+        Adds one messages.DataSample (CSV text path). Rows are batched and
+        moved into the queue when the listener finishes a recv() chunk (end_batch).
+        """
+        if not self.active:
+            return
+        with self._rows_lock:
+            self._rows.append((
+                sample.chan1_counts, sample.chan2_counts, sample.elapsed_time,
+                sample.eluate_volume, sample.frac_mark, sample.pumpB_percent
+            ))
+
+    def end_batch(self):
+        self._flush_rows()
+
+    def drain(self):
+        """
+        Returns everything buffered so far as one SAMPLE_DTYPE array (possibly empty).
+        """
+        self._flush_rows()
+        samples = self.get()
+        return samples if samples is not None else np.empty(0, dtype=SAMPLE_DTYPE)
+
+    def clear(self):
+        with self._rows_lock:
+            self._rows = []
+        super().clear()
+
+    def _flush_rows(self):
+        with self._rows_lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            self.put(np.array(rows, dtype=SAMPLE_DTYPE), wait=False)
+
+    @property
+    def blocks_out(self):
+        return self.gets
@@ -0,0 +1,201 @@
+#alarm_rules.py ver 0.5.0
+#rules checked on every acquired block: thresholds, rate of change, flatline, saturation, missing samples
+#
+#A rule is a dict: {"name", "kind", "action", and per kind "channel", "limit", "below", "duration"}.
+#"channel" is an expression like a derived channel's (default Chan1_AU280), so a rule can
+#watch a ratio or a derived channel too. Rules are compiled once per run (AlarmEngine);
+#each block is checked with NumPy, and only state changes become AlarmEvents. Threshold and
+#saturation rules on the same channel are checked together as one 2-D comparison, so adding
+#more of them costs next to nothing per block.
+import json
+from dataclasses import dataclass
+import numpy as np
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
+from derived_channels import compile_expression, FUNCTIONS, STATEFUL_FUNCTIONS, Derivative
+from link_monitor import ACTION_WARN, ACTION_PAUSE, ACTION_STOP
+
+RULE_THRESHOLD = "threshold"# channel above limit (below it with "below": true)
+RULE_RATE = "rate"# |d channel / dt| above limit per second
+RULE_FLATLINE = "flatline"# channel moves less than limit over duration seconds (stuck signal)
+RULE_SATURATION = "saturation"# channel at limit (fraction, default 0.98) of the AUFS ceiling
+RULE_GAP = "gap"# elapsed time jumps by more than limit seconds (missing samples)
+RULE_KINDS = (RULE_THRESHOLD, RULE_RATE, RULE_FLATLINE, RULE_SATURATION, RULE_GAP)
+ALARM_ACTIONS = (ACTION_WARN, ACTION_PAUSE, ACTION_STOP)# warn = highlight the plot and log
+
+DEFAULT_ALARM_RULES = (
+    {"name": "AUFS saturation", "kind": RULE_SATURATION, "action": ACTION_WARN},
+    {"name": "Missing samples", "kind": RULE_GAP, "action": ACTION_WARN},
+)
+DEFAULT_HOLD = 10.0# seconds before a rule that cleared may raise again (no alarm storms on a noisy edge)
+
+
+@dataclass(slots=True)
+class AlarmEvent:
+    rule: str
+    action: str
+    raised: bool# False: the condition has cleared
+    x: float# eluate volume
+    value: float# channel value (seconds of gap for RULE_GAP)
+    message: str
+
+
+def load_rule_file(path):
+    # JSON list of rule dicts
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError(f"{path}: expected a list of rules")
+    return rules
+
+
+class _Rule:
+    def __init__(self, spec, known_names, aufs, sample_rate):
+        self.name = spec.get("name") or spec.get("kind", "rule")
+        self.kind = spec.get("kind")
+        self.action = spec.get("action", ACTION_WARN)
+        if self.kind not in RULE_KINDS:
+            raise ValueError(f"Alarm rule {self.name}: unknown kind {self.kind!r}")
+        if self.action not in ALARM_ACTIONS:
+            raise ValueError(f"Alarm rule {self.name}: unknown action {self.action!r}")
+        self.channel = spec.get("channel", "Chan1_AU280")
+        self.below = bool(spec.get("below", False))
+        self.hold = float(spec.get("hold", DEFAULT_HOLD))
+        limit = spec.get("limit")
+        if self.kind == RULE_SATURATION:
+            limit = (0.98 if limit is None else limit) * aufs
+        elif self.kind == RULE_GAP:
+            limit = 5.0 / sample_rate if limit is None else limit
+        elif limit is None:
+            raise ValueError(f"Alarm rule {self.name}: {self.kind} needs a limit")
+        self.limit = float(limit)
+        self.window = max(2, round(float(spec.get("duration", 10.0)) * sample_rate))# flatline samples
+        self.code, free_names, sites = compile_expression(self.channel)
+        self.stateless = not sites
+        missing = free_names - set(known_names)
+        if missing:
+            raise ValueError(f"Alarm rule {self.name}: unknown name(s) {', '.join(sorted(missing))}")
+        self.namespace = {"__builtins__": {}, **FUNCTIONS}
+        self.namespace.update((site, STATEFUL_FUNCTIONS[kind]()) for site, kind in sites)
+        self.rate = Derivative()
+        self.active = False# condition true at the end of the last block
+        self.announced = False# a raise was reported and not yet cleared
+        self.pending = False# condition true but held back by hold: raised once the hold has passed
+        self.last_raised = None# elapsed time
+        self.last_time = None
+        self._tail = np.empty(0)
+        self._seen = 0
+
+    def condition(self, block, values):
+        time = block["elapsed_time"]
+        if self.kind == RULE_GAP:
+            last = self.last_time if self.last_time is not None else time[0]
+            gaps = np.diff(time, prepend=last)
+            return gaps > self.limit, gaps
+        value = np.empty(len(time))
+        value[:] = eval(self.code, self.namespace, values)# code passed compile_expression
+        if self.kind == RULE_RATE:
+            return np.abs(self.rate(value, time)) > self.limit, value
+        if self.kind == RULE_FLATLINE:
+            data = np.concatenate((self._tail, value))
+            self._tail = data[-(self.window - 1):]
+            origin = (self.window - 1) // 2# trailing window, as in StreamingBaseline
+            spread = (maximum_filter1d(data, self.window, origin=origin, mode='nearest')
+                      - minimum_filter1d(data, self.window, origin=origin, mode='nearest'))[-len(value):]
+            seen = self._seen + np.arange(1, len(value) + 1)
+            self._seen += len(value)
+            return (spread < self.limit) & (seen >= self.window), value
+        if self.kind == RULE_THRESHOLD and self.below:
+            return value < self.limit, value
+        return value >= self.limit if self.kind == RULE_SATURATION else value > self.limit, value
+
+    @property
+    def comparison(self):
+        # Plain value-vs-limit rules, checked in groups by AlarmEngine
+        return self.kind in (RULE_THRESHOLD, RULE_SATURATION) and self.stateless
+
+    def events(self, block, values):
+        mask, value = self.condition(block, values)
+        return self.edge_events(block, mask, value)
+
+    def edge_events(self, block, mask, value, edges=None):
+        time = block["elapsed_time"]
+        if edges is None:
+            edges = np.flatnonzero(np.diff(mask.astype(np.int8), prepend=np.int8(self.active)))
+        self.active = bool(mask[-1])
+        self.last_time = time[-1]
+        events = []
+        # A held-back raise carries over while the condition stays true (no edge at 0 then)
+        points = [0, *edges] if self.pending and mask[0] else list(edges)
+        for n, i in enumerate(points):
+            if not mask[i]:
+                self.pending = False
+                if self.announced:
+                    self.announced = False
+                    events.append(self._event(False, block, value, i))
+                continue
+            if self.announced:
+                continue
+            stop = points[n + 1] if n + 1 < len(points) else len(mask)
+            ready = i
+            if self.last_raised is not None:
+                ready = i + int(np.searchsorted(time[i:stop], self.last_raised + self.hold))
+            if ready >= stop:
+                self.pending = True# still within hold of the last raise
+                continue
+            self.pending = False
+            self.announced = True
+            self.last_raised = time[ready]
+            events.append(self._event(True, block, value, ready))
+        return events
+
+    def _event(self, raised, block, value, i):
+        x = float(block["eluate_volume"][i])
+        if self.kind == RULE_GAP:
+            message = f"{self.name}: {value[i]:.2f} s without samples before {x:.3f} ml"
+        else:
+            message = f"{self.name}: {self.channel} = {value[i]:.4g} at {x:.3f} ml"
+        return AlarmEvent(self.name, self.action, raised, x, float(value[i]), message if raised else f"{self.name} cleared at {x:.3f} ml")
+
+
+class AlarmEngine:
+    """
+    One run's alarm rules. known_names are the block columns rule channels may use;
+    aufs and sample_rate (Hz of the blocks given to evaluate) set the saturation ceiling
+    and the default gap and flatline windows. Raises ValueError for a bad rule.
+    """
+
+    def __init__(self, rules, known_names, aufs=1.0, sample_rate=10.0):
+        self.rules = [_Rule(spec, known_names, aufs, sample_rate) for spec in rules]
+        self._groups = {}# channel expression -> comparison rules, their limits and senses
+        for rule in self.rules:
+            if rule.comparison:
+                self._groups.setdefault(rule.channel, []).append(rule)
+        self._groups = {
+            channel: (group, np.array([[r.limit] for r in group]), np.array([[r.below] for r in group]),
+                      np.array([[r.kind == RULE_SATURATION] for r in group]))
+            for channel, group in self._groups.items()
+        }
+        self._single = [rule for rule in self.rules if not rule.comparison]
+
+    def evaluate(self, block):
+        if not self.rules or not len(block["elapsed_time"]):
+            return []
+        values = dict(block)
+        events = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for group, limits, below, inclusive in self._groups.values():
+                value = np.empty(len(block["elapsed_time"]))
+                value[:] = eval(group[0].code, group[0].namespace, values)# code passed compile_expression
+                # One row per rule: value against each limit in one pass
+                masks = np.where(below, value < limits, np.where(inclusive, value >= limits, value > limits))
+                active = np.array([[rule.active] for rule in group], dtype=np.int8)
+                changes = np.diff(masks.astype(np.int8), axis=1, prepend=active)
+                waiting = np.array([rule.pending for rule in group])
+                for row in np.flatnonzero(changes.any(axis=1) | waiting):
+                    events.extend(group[row].edge_events(block, masks[row], value, np.flatnonzero(changes[row])))
+                for rule, last in zip(group, masks[:, -1]):
+                    rule.active = bool(last)
+            for rule in self._single:
+                events.extend(rule.events(block, values))
+        events.sort(key=lambda event: event.x)
+        return events
@@ -0,0 +1,194 @@
+#capture.py ver 0.5.0
+#wire-traffic capture for one instrument link and replay into ReceiveClientSignalsAndData
+#
+#  python capture.py info Scanning_log_files/captures/FPLC_20250101_120000.fcap
+#  python capture.py replay FPLC_20250101_120000.fcap --speed 10
+#  python capture.py replay FPLC_20250101_120000.fcap --speed max
+#
+#File layout: FILE_HEADER, a length-prefixed JSON info block, then records of
+#RECORD_HEADER (monotonic ns since capture start, kind, length) + payload bytes.
+#Inbound records are raw recv() chunks, exactly as fed to the listener, so replay
+#reproduces framing splits; outbound records are whole messages as written to the socket.
+import argparse
+import json
+import struct
+import time
+from collections import Counter
+
+FILE_MAGIC = b"FCAP"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<4sBQI")# magic, version, wall-clock start (ns), info length
+RECORD_HEADER = struct.Struct("<QBI")# ns since start, kind, payload length
+
+KIND_IN = 0
+KIND_OUT = 1
+KIND_CONNECT = 2
+KIND_DISCONNECT = 3
+KIND_NAMES = {KIND_IN: "in", KIND_OUT: "out", KIND_CONNECT: "connect", KIND_DISCONNECT: "disconnect"}
+
+
+class CaptureWriter:
+    """
+    Appends timestamped records for one client connection. Used only from the
+    FPLCServerLoop thread; the file is buffered and flushed by the server loop.
+    """
+
+    def __init__(self, path, info=None):
+        self.path = path
+        self._start = time.monotonic_ns()
+        self.records = 0
+        self.bytes = 0
+        info_bytes = json.dumps(info or {}).encode('utf-8')
+        self._file = open(path, "wb", buffering=1 << 16)
+        self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, time.time_ns(), len(info_bytes)))
+        self._file.write(info_bytes)
+
+    def record(self, kind, payload=b""):
+        if self._file is None:
+            return
+        self._file.write(RECORD_HEADER.pack(time.monotonic_ns() - self._start, kind, len(payload)))
+        self._file.write(payload)
+        self.records += 1
+        self.bytes += len(payload)
+
+    def inbound(self, data):
+        self.record(KIND_IN, data)
+
+    def outbound(self, data):
+        self.record(KIND_OUT, data)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CaptureReader:
+    """
+    Iterates (ns since start, kind, payload) records of a capture file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, self.started_ns, info_len = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != FILE_MAGIC or version != FILE_VERSION:
+                raise ValueError(f"{path} is not a version {FILE_VERSION} capture file")
+            self.info = json.loads(f.read(info_len) or b"{}")
+            self._data_offset = f.tell()
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            f.seek(self._data_offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return# end of file, or a capture cut off mid-record
+                t_ns, kind, length = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+                yield t_ns, kind, payload
+
+
+def replay(path, listener, speed=1.0, on_outbound=None, idle_flush_after=None):
+    """
+    Feeds a capture into a listener on the calling thread.
+
+    speed: 1.0 for real time, N for N times faster, None for as fast as possible.
+    Inbound chunks go to listener.feed() exactly as captured; a connect record resets
+    the listener as FPLCServer does, and a gap of idle_flush_after (capture time,
+    default network.IDLE_FLUSH_AFTER) flushes an unterminated line like the server's idle check. Replies the listener
+    tries to send (e.g. FORMAT) are accepted and dropped. Captured outbound messages
+    are passed to on_outbound(t_ns, payload). Returns a stats dict.
+    """
+    if idle_flush_after is None:
+        from network import IDLE_FLUSH_AFTER# here: network imports this module
+        idle_flush_after = IDLE_FLUSH_AFTER
+    listener.send_message = lambda message: True
+    listener.start()
+    stats = Counter()
+    wall_start = time.monotonic()
+    last_in_ns = None
+    for t_ns, kind, payload in CaptureReader(path):
+        if speed is not None:
+            delay = t_ns / 1e9 / speed - (time.monotonic() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+        if last_in_ns is not None and (t_ns - last_in_ns) / 1e9 >= idle_flush_after:
+            listener.flush_idle()
+            last_in_ns = None
+        if kind == KIND_IN:
+            listener.feed(payload)
+            last_in_ns = t_ns
+            stats["bytes_in"] += len(payload)
+        elif kind == KIND_OUT:
+            if on_outbound is not None:
+                on_outbound(t_ns, payload)
+        elif kind == KIND_CONNECT:
+            listener.reset()
+        stats[KIND_NAMES.get(kind, "unknown")] += 1
+    listener.flush_idle()
+    stats["wall_seconds"] = time.monotonic() - wall_start
+    return dict(stats)
+
+
+def describe(path):
+    reader = CaptureReader(path)
+    kinds = Counter()
+    sizes = Counter()
+    last_ns = 0
+    for t_ns, kind, payload in reader:
+        kinds[KIND_NAMES.get(kind, "unknown")] += 1
+        sizes[KIND_NAMES.get(kind, "unknown")] += len(payload)
+        last_ns = t_ns
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(reader.started_ns / 1e9))
+    return {"info": reader.info, "started": started, "duration_s": round(last_ns / 1e9, 3),
+            "records": dict(kinds), "bytes": dict(sizes)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or replay FPLC wire captures.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="summarise a capture file")
+    info.add_argument("path")
+    rep = sub.add_parser("replay", help="feed a capture into a listener")
+    rep.add_argument("path")
+    rep.add_argument("--speed", default="1", help="replay speed factor, or 'max'")
+    rep.add_argument("--show-outbound", action="store_true", help="print captured server->client messages")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        print(json.dumps(describe(args.path), indent=2))
+        return
+
+    import threading
+    from PySide6.QtCore import QCoreApplication
+    from listener import ReceiveClientSignalsAndData
+
+    app = QCoreApplication([])
+    listener = ReceiveClientSignalsAndData()
+    listener.sample_buffer.active = True
+    samples = Counter()
+    listener.samples_ready_signal.connect(lambda: samples.update(samples=len(listener.sample_buffer.drain())))
+    speed = None if args.speed == "max" else float(args.speed)
+    show = (lambda t_ns, payload: print(f"{t_ns / 1e9:10.3f} -> {payload.decode('utf-8', 'replace')}")) \
+        if args.show_outbound else None
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(replay(args.path, listener, speed, show)), daemon=True)
+    worker.start()
+    while worker.is_alive():
+        app.processEvents()
+        worker.join(0.01)
+    app.processEvents()
+    result["samples_delivered"] = samples["samples"]
+    result["messages"] = dict(listener.message_counts)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#commands.py ver 0.5.0
+#outbound command queue with correlation IDs, client acknowledgements and round-trip latency
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_ACK_TIMEOUT = 2.0# seconds
+
+
+class Command:
+    __slots__ = ("cmd_id", "name", "payload", "message", "timeout",
+                 "submitted", "sent", "acked", "status")
+
+    def __init__(self, cmd_id, name, payload, timeout):
+        self.cmd_id = cmd_id
+        self.name = name
+        self.payload = payload
+        self.timeout = timeout
+        if payload is None:
+            # Plain commands (PAUSE_ADC, RESUME_ADC) go out unchanged; acks match them by name
+            self.message = name.encode('utf-8')
+        else:
+            self.message = f"{name}:{json.dumps(dict(payload, CMD_ID=cmd_id))}".encode('utf-8')
+        self.submitted = time.monotonic()
+        self.sent = None
+        self.acked = None
+        self.status = "queued"
+
+    def round_trip(self):
+        """
+        Seconds from submission to acknowledgement, or None.
+        """
+        if self.acked is None:
+            return None
+        return self.acked - self.submitted
+
+
+class LatencyStats:
+    __slots__ = ("count", "timeouts", "last", "minimum", "maximum", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.timeouts = 0
+        self.last = None
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.last = seconds
+        self.total += seconds
+        self.minimum = seconds if self.minimum is None else min(self.minimum, seconds)
+        self.maximum = seconds if self.maximum is None else max(self.maximum, seconds)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def as_dict(self):
+        to_ms = lambda s: None if s is None else round(s * 1000.0, 2)
+        return {
+            "count": self.count, "timeouts": self.timeouts, "last_ms": to_ms(self.last),
+            "min_ms": to_ms(self.minimum), "mean_ms": to_ms(self.mean()), "max_ms": to_ms(self.maximum)
+        }
+
+
+class CommandQueue:
+    """
+    Commands submitted from any thread wait here until the server loop writes
+    them (take_outgoing). JSON commands carry a CMD_ID; the client answers
+    'ACK:<id>' (or 'ACK:<command name>' for plain commands) and the round trip
+    is recorded per command name in `stats`. Commands not acknowledged within
+    their timeout are returned by expire(). Timeouts are only reported once the
+    client has shown it sends acks, so older clients are not flagged.
+    """
+
+    def __init__(self, ack_timeout=DEFAULT_ACK_TIMEOUT):
+        self.ack_timeout = ack_timeout
+        self.client_acks = False
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._outgoing = deque()
+        self._pending = OrderedDict()# cmd_id -> Command, oldest first
+
+    def submit(self, name, payload=None, timeout=None):
+        with self._lock:
+            command = Command(self._next_id, name, payload, timeout or self.ack_timeout)
+            self._next_id += 1
+            self._outgoing.append(command)
+        return command
+
+    def take_outgoing(self):
+        """
+        Returns queued commands in submission order and marks them sent.
+        """
+        now = time.monotonic()
+        with self._lock:
+            commands = list(self._outgoing)
+            self._outgoing.clear()
+            for command in commands:
+                command.sent = now
+                command.status = "sent"
+                self._pending[command.cmd_id] = command
+        return commands
+
+    def acknowledge(self, ref):
+        """
+        Matches an ACK by command ID (int) or name (str). Returns the Command or None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.client_acks = True
+            command = None
+            if isinstance(ref, int):
+                command = self._pending.pop(ref, None)
+            else:
+                for cmd_id, pending in self._pending.items():
+                    if pending.name == ref:
+                        command = self._pending.pop(cmd_id)
+                        break
+            if command is None:
+                return None
+            command.acked = now
+            command.status = "acked"
+            self.stats.setdefault(command.name, LatencyStats()).add(command.round_trip())
+        return command
+
+    def expire(self, now=None):
+        """
+        Drops commands whose ack is overdue; returns them if the client sends acks.
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            for cmd_id, command in list(self._pending.items()):
+                if now - command.sent >= command.timeout:
+                    del self._pending[cmd_id]
+                    command.status = "timeout"
+                    if self.client_acks:
+                        self.stats.setdefault(command.name, LatencyStats()).timeouts += 1
+                        expired.append(command)
+        return expired
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending) + len(self._outgoing)
+
+    def clear(self):
+        with self._lock:
+            self._outgoing.clear()
+            self._pending.clear()
+
+    def latency_report(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self.stats.items()}
+
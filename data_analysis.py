@@ -6,6 +6,8 @@ import pandas as pd
 from PySide6.QtWidgets import QFileDialog
 from scipy.signal import savgol_filter, find_peaks
 from pybaselines.whittaker import asls
+from plotting import step_marker
+from step_index import read_step_index
 
 
 def extract_metadata_from_csv(csv_path):
@@ -101,6 +103,10 @@ def replot_from_csv(basepath, plot_widget, run_volume, max_y_value, update_plot,
         max_y_value=max_y_value,
         pumpB_percent_data=pumpB_percent_data
     )
+    steps = read_step_index(csv_path)
+    if steps is not None:
+        for number, volume in zip(steps["Step"].iloc[1:], steps["Start_Volume (ml)"].iloc[1:]):
+            plot_widget.addItem(step_marker(number, volume), ignoreBounds=True)
 
     
 def apply_savgol_smoothing_with_frac_marks(csv_path, window_length=51, polyorder=3):
@@ -4,10 +4,17 @@ import csv
 from datetime import datetime
 import pyqtgraph as pg
 from pyqtgraph import exporters
+from fplc_logging import get_logger
+from step_index import steps_path
+
+log = get_logger("data")
 
 class DataLogger:
-    def __init__(self, basepath, metadata_fieldnames, data_fieldnames):
+    def __init__(self, basepath, metadata_fieldnames, data_fieldnames, instrument_name=None):
         self.basepath = basepath
+        # Several instruments can log side by side: keep their files apart
+        self.file_prefix = f"{instrument_name}_" if instrument_name else ""
+        self.temp_path = os.path.join(basepath, 'Scanning_log_files', f"{self.file_prefix}data_temp.csv")
         self.metadata_fieldnames = metadata_fieldnames
         self.data_fieldnames = data_fieldnames
         self.metadata_written = False
@@ -18,24 +25,35 @@ class DataLogger:
         if not os.path.exists(mypath):
             os.makedirs(mypath)
         os.chdir(mypath)
-        with open('data_temp.csv', 'w', encoding='utf-8') as csvfile:
+        with open(self.temp_path, 'w', encoding='utf-8') as csvfile:
             csvwriter = csv.DictWriter(csvfile, fieldnames=self.data_fieldnames + self.metadata_fieldnames)
             csvwriter.writeheader()
 
     def write_metadata(self, metadata):
-        with open('data_temp.csv', 'a', encoding='utf-8') as csvfile:
+        with open(self.temp_path, 'a', encoding='utf-8') as csvfile:
             csvwriter = csv.DictWriter(csvfile, fieldnames=self.data_fieldnames + self.metadata_fieldnames)
             if not self.metadata_written:
                 csvwriter.writerow(metadata)
                 self.metadata_written = True
 
-    def append_data_row(self, data_row):
-        with open('data_temp.csv', 'a', encoding='utf-8') as csvfile:
-            csvwriter = csv.DictWriter(csvfile, fieldnames=self.data_fieldnames + self.metadata_fieldnames)
-            csvwriter.writerow(data_row)
-            
+    def append_data_columns(self, columns):
+        """
+        Writes rows from equal-length arrays given in data_fieldnames order;
+        the metadata fields are left empty.
+        """
+        if not len(columns[0]):
+            return
+        padding = ("",) * len(self.metadata_fieldnames)
+        with open(self.temp_path, 'a', encoding='utf-8') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerows(row + padding for row in zip(*(column.tolist() for column in columns)))
+
+    def tell(self):
+        # Byte offset the next row is written at (each write closes the file, so this is exact)
+        return os.path.getsize(self.temp_path)
+
     def write_run_notes(self, notes_dict, timestamp):
-        notes_path = os.path.join(self.basepath, 'Scanning_log_files', f"{timestamp}_run_notes.csv")
+        notes_path = os.path.join(self.basepath, 'Scanning_log_files', f"{self.file_prefix}{timestamp}_run_notes.csv")
 
         # Separate Run Method from Other Notes
         other_notes = notes_dict.get("Other_Notes", "")
@@ -53,26 +71,30 @@ class DataLogger:
                 writer.writerow([key, value])
                 if key == "Other_Notes":
                     writer.writerow([])
-        print(f"Run notes written to {notes_path}")
+        log.info("Run notes written to %s", notes_path)
 
-    def save_final_csv_and_plot(self, plot_widget, timestamp):
-        if os.path.exists('data_temp.csv'):
+    def save_final_csv_and_plot(self, plot_widget, timestamp, steps=None):
+        # steps: step_index.StepIndex of the run, saved as <run>_steps.csv
+        if os.path.exists(self.temp_path):
             #fileDateTime = datetime.strftime(datetime.now(), "%Y_%B_%d_%H%M%S") + ".csv"
             #plotDateTime = datetime.strftime(datetime.now(), "%Y_%B_%d_%H%M%S") + ".png"        
             
-            fileDateTime = timestamp + ".csv"
-            plotDateTime = timestamp + ".png"
+            fileDateTime = self.file_prefix + timestamp + ".csv"
+            plotDateTime = self.file_prefix + timestamp + ".png"
             
             mypath = os.path.join(self.basepath, 'Scanning_log_files')
-            os.rename('data_temp.csv', os.path.join(mypath, fileDateTime))
-            print('CSV File saved as', os.path.join(mypath, fileDateTime))
+            os.rename(self.temp_path, os.path.join(mypath, fileDateTime))
+            log.info('CSV File saved as %s', os.path.join(mypath, fileDateTime))
+            if steps is not None and steps.records:
+                steps.write(steps_path(os.path.join(mypath, fileDateTime)))
+                log.info("Step index saved as %s", steps_path(os.path.join(mypath, fileDateTime)))
             exporter = pg.exporters.ImageExporter(plot_widget.scene())
             exporter.export(os.path.join(mypath, plotDateTime))
-            print(f"Plot saved as {os.path.join(mypath, plotDateTime)}")
+            log.info("Plot saved as %s", os.path.join(mypath, plotDateTime))
         else:
-            print("Error: data_temp.csv not found.")
+            log.error("%s not found.", self.temp_path)
 
     def clear_data(self):
         self.metadata_written = False
         self.setup_csv()
-        print('Data cleared. Ready for next acquisition.')
+        log.info('Data cleared. Ready for next acquisition.')
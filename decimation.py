@@ -0,0 +1,163 @@
+#decimation.py ver 0.5.0
+#host-side decimation: the client oversamples, the acquisition worker filters down to the logging and display rates
+from dataclasses import dataclass
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from acquisition import block_length, concat_blocks, slice_block
+
+FILTER_BOXCAR = "boxcar"
+FILTER_CIC = "cic"
+DECIMATION_FILTERS = (FILTER_BOXCAR, FILTER_CIC)
+CIC_STAGES = 3
+DEFAULT_SCAN_RATE = 10.0# Hz: what the client has always sent, logged 1:1
+
+
+def decimation_kernel(factor, stages=1):
+    """
+    FIR equivalent of a `stages`-order CIC decimator (differential delay 1), normalised
+    to unit DC gain: the length-`factor` boxcar convolved with itself. stages=1 is the
+    plain boxcar average.
+    """
+    kernel = np.ones(1)
+    for _ in range(stages):
+        kernel = np.convolve(kernel, np.ones(factor))
+    return kernel / kernel.sum()
+
+
+class BlockDecimator:
+    """
+    Decimates a stream of column blocks (dicts of equal-length arrays) by an integer
+    factor. Every column goes through the same kernel, so time and volume carry the
+    filter's group delay exactly like the signals do. Columns in peak_columns keep the
+    largest value of the `factor` samples at the centre of each window instead, so
+    one-sample markers (fraction marks) survive without being repeated.
+
+    The stream is led in by an odd reflection of its first samples (what would have come
+    before them if the signal carried on the same way), so the first window's centre starts
+    at the first sample: no leading samples are lost and time and volume stay exact on a ramp.
+
+    The CIC response is computed as its FIR equivalent, so there are no integrator
+    registers to overflow or lose float precision over a long run.
+    """
+
+    def __init__(self, factor, stages=1, peak_columns=()):
+        self.factor = max(1, int(factor))
+        self.stages = stages
+        self.kernel = decimation_kernel(self.factor, stages)
+        self.peak_columns = tuple(peak_columns)
+        self.reset()
+
+    def reset(self):
+        self._pending = None# input samples from the start of the next window on
+        self._started = False# at least one output made (the first window has no overlap)
+        self._primed = False# lead-in prepended to the first input
+
+    @property
+    def centre(self):
+        # offset of the `factor` samples a window's peak columns are taken from
+        return (len(self.kernel) - self.factor) // 2
+
+    @property
+    def delay(self):
+        # group delay in input samples
+        return (len(self.kernel) - 1) / 2
+
+    def process(self, block):
+        if self.factor == 1:
+            return block
+        data = block if self._pending is None else concat_blocks([self._pending, block])
+        if not self._primed:
+            if block_length(data) <= self.centre:
+                self._pending = data
+                return slice_block(data, slice(0, 0))
+            data = self._lead_in(data)
+        length = block_length(data)
+        window = len(self.kernel)
+        count = (length - window) // self.factor + 1 if length >= window else 0
+        if not count:
+            self._pending = data
+            return slice_block(data, slice(0, 0))
+        centre = self.centre
+        out = {}
+        for name, column in data.items():
+            windows = sliding_window_view(column, window)[::self.factor][:count]
+            if name in self.peak_columns:
+                out[name] = windows[:, centre:centre + self.factor].max(axis=1)
+            else:
+                out[name] = windows @ self.kernel
+        self._pending = slice_block(data, slice(count * self.factor, None))
+        self._started = True
+        return out
+
+    def flush(self):
+        """
+        Returns one last sample averaged from the input not yet represented in an
+        output (None if there is none), e.g. at the end of a run.
+        """
+        if self._pending is None or self.factor == 1:
+            return None
+        # Skip what the last window already covered (its centre, for the peak columns), or the lead-in
+        if self._started:
+            overlap = len(self.kernel) - self.factor
+            peak_overlap = overlap // 2
+        else:
+            overlap = peak_overlap = self.centre if self._primed else 0
+        pending = self._pending
+        self.reset()
+        if block_length(pending) <= overlap:
+            return None
+        out = {}
+        for name, column in pending.items():
+            if name in self.peak_columns:
+                out[name] = np.array([column[peak_overlap:].max()])
+            else:
+                out[name] = np.array([column[overlap:].mean()])
+        return out
+
+    def _lead_in(self, data):
+        # centre samples before data[0]: 2*x[0] - x[centre..1], so the first window is centred on data[:factor]
+        self._primed = True
+        centre = self.centre
+        if not centre:
+            return data
+        lead = {}
+        for name, column in data.items():
+            if name in self.peak_columns:
+                lead[name] = np.full(centre, column[0], dtype=column.dtype)# never inside a window's centre
+            else:
+                lead[name] = (2 * column[0] - column[centre:0:-1]).astype(column.dtype)
+        return concat_blocks([lead, data])
+
+
+@dataclass(slots=True)
+class DecimationConfig:
+    acquisition_rate: float = DEFAULT_SCAN_RATE# Hz the client is asked to sample at
+    log_rate: float = DEFAULT_SCAN_RATE# Hz written to the run CSV
+    display_rate: float = None# Hz plotted (boxcar from the logged samples); None plots every logged sample
+    filter: str = FILTER_BOXCAR
+
+    @property
+    def log_factor(self):
+        return max(1, round(self.acquisition_rate / self.log_rate))
+
+    @property
+    def effective_log_rate(self):
+        return self.acquisition_rate / self.log_factor
+
+    @property
+    def display_factor(self):
+        return max(1, round(self.effective_log_rate / self.display_rate)) if self.display_rate else 1
+
+    def describe(self):
+        # Archived with the run: which filter made the logged samples
+        if self.log_factor == 1:
+            return "none"
+        name = f"cic{CIC_STAGES}" if self.filter == FILTER_CIC else FILTER_BOXCAR
+        return f"{name} x{self.log_factor} from {self.acquisition_rate:g} Hz"
+
+    def log_decimator(self, peak_columns=()):
+        stages = CIC_STAGES if self.filter == FILTER_CIC else 1
+        return BlockDecimator(self.log_factor, stages, peak_columns)
+
+    def display_decimator(self, peak_columns=()):
+        return BlockDecimator(self.display_factor, 1, peak_columns)
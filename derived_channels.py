@@ -0,0 +1,172 @@
+#derived_channels.py ver 0.5.0
+#channels computed from the acquired ones on the live stream (ratios, derivatives, corrections)
+#
+#A derived channel is an expression over the block columns (INPUT_COLUMNS), its own params,
+#channels listed before it and the functions below, e.g. "au(Chan2) / Chan1_AU280". It is
+#evaluated with NumPy on each sample block; the stateful functions (ddx, ema) carry their
+#state from block to block, so the result doesn't depend on how the stream was split.
+#More channels come from register_channel() or a JSON file of {name: spec} (load_channel_file).
+import ast
+import json
+import numpy as np
+from scipy.signal import lfilter
+
+INPUT_COLUMNS = ("elapsed_time", "eluate_volume", "Chan1", "Chan1_AU280", "Chan2", "pumpB_percent")
+
+# name: expression, units (CSV header), params (constants the expression may use)
+DERIVED_CHANNEL_SPECS = {
+    # Chan2 wired to a second (260 nm) monitor output on the same AUFS setting
+    "A260_A280": {"expr": "au(Chan2) / Chan1_AU280", "units": "ratio"},
+    "dA280_dV": {"expr": "ddx(ema(Chan1_AU280, 5), eluate_volume)", "units": "AU/ml"},
+    # Subtracts buffer B's own absorbance (blank_au AU at 100% B) along the gradient
+    "A280_gradient_corrected": {"expr": "Chan1_AU280 - blank_au * pumpB_percent / 100", "units": "AU",
+                                "params": {"blank_au": 0.0}},
+}
+
+FUNCTIONS = {
+    "abs": np.abs, "sqrt": np.sqrt, "exp": np.exp, "log10": np.log10,
+    "minimum": np.minimum, "maximum": np.maximum, "clip": np.clip,
+}
+
+
+class Derivative:
+    # ddx(y, x): dy/dx against the previous sample (NaN where x didn't move)
+    def __init__(self):
+        self._last = None
+
+    def __call__(self, y, x):
+        y, x = np.broadcast_arrays(np.asarray(y, np.float64), np.asarray(x, np.float64))
+        out = np.full(len(y), np.nan)
+        if not len(y):
+            return out
+        last_y, last_x = self._last if self._last is not None else (y[0], x[0])
+        dy = np.diff(y, prepend=last_y)
+        dx = np.diff(x, prepend=last_x)
+        self._last = (y[-1], x[-1])
+        np.divide(dy, dx, out=out, where=dx != 0)
+        return out
+
+
+class ExponentialAverage:
+    # ema(y, span): exponential moving average, span in samples
+    def __init__(self):
+        self._state = None
+
+    def __call__(self, y, span):
+        y = np.asarray(y, np.float64)
+        if not len(y):
+            return y
+        alpha = 2.0 / (span + 1)
+        if self._state is None:
+            self._state = np.array([(1 - alpha) * y[0]])
+        out, self._state = lfilter([alpha], [1, alpha - 1], y, zi=self._state)
+        return out
+
+
+STATEFUL_FUNCTIONS = {"ddx": Derivative, "ema": ExponentialAverage}
+RUN_FUNCTIONS = ("au",)# bound per run: au(volts) is the UV monitor's transfer at the run's AUFS
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+)
+
+
+def compile_expression(expr):
+    """
+    Checks expr and compiles it. Returns (code, free_names, stateful_sites): each call
+    to a stateful function gets its own site name, so every use has its own state.
+    Raises ValueError for anything but arithmetic, names and whitelisted calls.
+    """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Derived channel expression {expr!r}: {e.msg}") from None
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Derived channel expression {expr!r}: {type(node).__name__} not allowed")
+        if isinstance(node, ast.Call):
+            name = getattr(node.func, "id", None)
+            if name not in FUNCTIONS and name not in STATEFUL_FUNCTIONS and name not in RUN_FUNCTIONS:
+                raise ValueError(f"Derived channel expression {expr!r}: unknown function {name or '?'}")
+            if node.keywords:
+                raise ValueError(f"Derived channel expression {expr!r}: keyword arguments not allowed")
+    sites = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and node.func.id in STATEFUL_FUNCTIONS:
+            site = f"_{node.func.id}_{len(sites)}"
+            sites.append((site, node.func.id))
+            node.func = ast.Name(id=site, ctx=ast.Load())
+    called = {node.func.id for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    free_names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} - called
+    return compile(ast.fix_missing_locations(tree), "<derived channel>", "eval"), free_names, sites
+
+
+_specs = {}
+
+
+def register_channel(name, expr, units="", params=None):
+    if not name.isidentifier():
+        raise ValueError(f"Derived channel name {name!r} must be an identifier")
+    compile_expression(expr)
+    _specs[name] = {"expr": expr, "units": units, "params": dict(params or {})}
+
+
+def load_channel_file(path):
+    # JSON {name: {"expr": ..., "units": ..., "params": {...}}}; replaces built-ins of the same name
+    with open(path, encoding="utf-8") as f:
+        for name, spec in json.load(f).items():
+            register_channel(name, spec["expr"], spec.get("units", ""), spec.get("params"))
+
+
+def channel_names():
+    return list(_specs)
+
+
+def channel_header(name):
+    # CSV column name, e.g. "dA280_dV (AU/ml)"
+    units = _specs[name]["units"]
+    return f"{name} ({units})" if units else name
+
+
+class DerivedChannels:
+    """
+    One run's derived channels, in the order given: each may use the ones before it.
+    evaluate(block) returns {name: float64 array} for a block of INPUT_COLUMNS.
+    """
+
+    def __init__(self, names, uv_driver=None, aufs=1.0):
+        self.names = list(names)
+        if uv_driver is not None and uv_driver.transfer is not None:
+            au = lambda volts: uv_driver.transfer(np.asarray(volts), aufs, uv_driver.recorder_full_scale)
+        else:
+            au = lambda volts: np.asarray(volts, np.float64)
+        self._channels = []
+        known = set(INPUT_COLUMNS)
+        for name in self.names:
+            if name not in _specs:
+                raise ValueError(f"Unknown derived channel {name!r}")
+            spec = _specs[name]
+            code, free_names, sites = compile_expression(spec["expr"])
+            missing = free_names - known - set(spec["params"])
+            if missing:
+                raise ValueError(f"Derived channel {name}: unknown name(s) {', '.join(sorted(missing))}")
+            namespace = {"__builtins__": {}, **FUNCTIONS, "au": au, **spec["params"]}
+            namespace.update((site, STATEFUL_FUNCTIONS[kind]()) for site, kind in sites)
+            self._channels.append((name, code, namespace))
+            known.add(name)
+
+    def evaluate(self, block):
+        count = len(block["elapsed_time"])
+        values = {name: block[name] for name in INPUT_COLUMNS if name in block}
+        out = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for name, code, namespace in self._channels:
+                column = np.empty(count)
+                column[:] = eval(code, namespace, values)# code passed compile_expression
+                values[name] = out[name] = column
+        return out
+
+
+for _name, _spec in DERIVED_CHANNEL_SPECS.items():
+    register_channel(_name, **_spec)
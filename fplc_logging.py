@@ -0,0 +1,189 @@
+#fplc_logging.py ver 0.5.0
+#levelled per-subsystem loggers plus an in-memory ring buffer for the sample path
+#
+#Categories are children of the "fplc" logger: fplc.net, fplc.listener, fplc.gui, fplc.data.
+#Per-message and per-sample events go to `ring` only (ring.trace), stored unformatted and
+#written out by ring.dump() - on demand (SIGUSR1, or the call) and automatically when an
+#ERROR is logged, so the lines leading up to a fault are kept without console I/O per sample.
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+ROOT_LOGGER = "fplc"
+DEFAULT_RING_CAPACITY = 20000
+DUMP_QUEUE_SIZE = 4# automatic dumps waiting to be written; more are dropped
+CONSOLE_FORMAT = "%(asctime)s %(levelname)-7s [%(name)s] %(message)s"
+
+
+def get_logger(category):
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+class RingBuffer:
+    """
+    Fixed-size log of recent events. Each entry is (time, level, category, format, args);
+    nothing is formatted until dump(), and nothing is stored below `level`.
+    """
+
+    def __init__(self, capacity=DEFAULT_RING_CAPACITY, level=TRACE):
+        self.entries = deque(maxlen=capacity)
+        self.level = level
+        self.dump_path = None# None writes dumps to stderr
+        self._dump_lock = threading.Lock()
+
+    def trace(self, category, msg, *args):
+        # Hot path: one comparison when off, one tuple and deque append when on
+        if self.level <= TRACE:
+            self.entries.append((time.time(), TRACE, category, msg, args))
+
+    def log(self, level, category, msg, *args):
+        if level >= self.level:
+            self.entries.append((time.time(), level, category, msg, args))
+
+    def resize(self, capacity):
+        self.entries = deque(self.entries, maxlen=capacity)
+
+    def clear(self):
+        self.entries.clear()
+
+    def lines(self, entries=None):
+        for created, level, category, msg, args in list(self.entries) if entries is None else entries:
+            try:
+                text = msg % args if args else msg
+            except (TypeError, ValueError):
+                text = f"{msg} {args}"
+            stamp = time.strftime("%H:%M:%S", time.localtime(created))
+            yield f"{stamp}.{int(created * 1000) % 1000:03d} {logging.getLevelName(level):<7} [{category}] {text}"
+
+    def snapshot(self):
+        return list(self.entries)
+
+    def dump(self, path=None, reason="", entries=None):
+        """
+        Writes the buffered entries (or a snapshot() taken earlier), oldest first.
+        Returns the path written, or None for stderr.
+        """
+        path = path or self.dump_path
+        entries = self.snapshot() if entries is None else entries
+        with self._dump_lock:
+            header = f"--- ring buffer dump ({len(entries)} entries){': ' + reason if reason else ''} ---"
+            if path is None:
+                print(header, file=sys.stderr)
+                for line in self.lines(entries):
+                    print(line, file=sys.stderr)
+                return None
+            with open(path, "a") as f:
+                f.write(header + "\n")
+                for line in self.lines(entries):
+                    f.write(line + "\n")
+            return path
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Copies fplc.* log records into the ring so dumps show them in context,
+    and dumps the ring when a record at or above dump_level arrives.
+
+    The thread logging the error only snapshots the ring; formatting and writing
+    happen on a dumper thread, so an ERROR on FPLCServerLoop or the acquisition
+    worker doesn't stall it on file I/O. flush() (called by logging.shutdown at
+    exit) waits for queued dumps.
+    """
+
+    def __init__(self, ring, level=logging.DEBUG, dump_level=logging.ERROR):
+        super().__init__(level)
+        self.ring = ring
+        self.dump_level = dump_level
+        self.dumps_dropped = 0
+        self._dumps = queue.Queue(maxsize=DUMP_QUEUE_SIZE)
+        self._dumper = None
+
+    def emit(self, record):
+        category = record.name[len(ROOT_LOGGER) + 1:] or ROOT_LOGGER
+        self.ring.entries.append((record.created, record.levelno, category, record.msg, record.args))
+        if self.dump_level is not None and record.levelno >= self.dump_level:
+            self._queue_dump(record, f"{record.levelname} in {category}")
+
+    def flush(self):
+        if self._dumper is not None and threading.current_thread() is not self._dumper:
+            self._dumps.join()
+
+    def _queue_dump(self, record, reason):
+        try:
+            self._dumps.put_nowait((record, reason, self.ring.snapshot()))
+        except queue.Full:
+            self.dumps_dropped += 1
+            return
+        if self._dumper is None:
+            self._dumper = threading.Thread(target=self._write_dumps, name="RingDump", daemon=True)
+            self._dumper.start()
+
+    def _write_dumps(self):
+        while True:
+            record, reason, entries = self._dumps.get()
+            try:
+                self.ring.dump(reason=reason, entries=entries)
+            except OSError:
+                self.handleError(record)
+            finally:
+                self._dumps.task_done()
+
+
+ring = RingBuffer()
+_ring_handler = None
+
+
+def _as_level(level):
+    if isinstance(level, str):
+        return logging.getLevelName(level.upper()) if level.upper() != "TRACE" else TRACE
+    return level
+
+
+def configure(console_level=logging.INFO, ring_level=TRACE, ring_capacity=DEFAULT_RING_CAPACITY,
+              dump_path=None, categories=None):
+    """
+    Sets up console output and the ring buffer for all fplc.* loggers.
+    categories: optional {category: level} overrides, e.g. {"listener": "DEBUG"}.
+    The FPLC_LOG_LEVEL environment variable overrides console_level.
+    """
+    global _ring_handler
+    console_level = _as_level(os.environ.get("FPLC_LOG_LEVEL", console_level))
+    ring_level = _as_level(ring_level)
+    ring.level = ring_level
+    ring.resize(ring_capacity)
+    ring.dump_path = os.path.abspath(dump_path) if dump_path else None
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(min(console_level, max(ring_level, logging.DEBUG)))
+    root.propagate = False
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    root.addHandler(console)
+    _ring_handler = RingBufferHandler(ring, level=max(ring_level, logging.DEBUG))
+    root.addHandler(_ring_handler)
+
+    for category, level in (categories or {}).items():
+        get_logger(category).setLevel(_as_level(level))
+    return root
+
+
+def install_dump_signal(signum=getattr(signal, "SIGUSR1", None)):
+    """
+    Dumps the ring on `kill -USR1 <pid>` (POSIX only).
+    """
+    if signum is None:
+        return False
+    signal.signal(signum, lambda *_: ring.dump(reason="on demand"))
+    return True
@@ -0,0 +1,130 @@
+#fraction_controller.py ver 0.5.0
+#peak-triggered fraction collection: collect while a detected peak passes the collector
+import threading
+import time
+from collections import deque
+from commands import LatencyStats
+from fplc_logging import get_logger
+from peak_detector import StreamingPeakDetector, PEAK_START, PEAK_END
+
+FRAC_CONTROL_COMMAND = "FRAC_CONTROL_JSON"# {"COLLECT": true} -> new tube, {"COLLECT": false} -> waste
+DEFAULT_DELAY_VOLUME = None# ml of tubing between the UV flow cell and the collector outlet: measure it, no default fits
+DEFAULT_LATENCY_BUDGET = 0.05# seconds a fraction change may be sent after its due time
+
+log = get_logger("frac")
+
+
+def detection_lag(flowrate, sample_rate, smoothing_window):
+    """
+    Least volume (ml) the flow moves on between a peak edge reaching the flow cell and
+    the controller seeing it: the smoothed trace's group delay (smoothing_window // 2
+    samples). The detector's hysteresis adds to this, by how fast the peak rises.
+    """
+    if sample_rate <= 0:
+        return 0.0
+    return (smoothing_window // 2) / sample_rate * flowrate / 60.0
+
+
+class PeakFractionController:
+    """
+    Runs on the acquisition worker. update() takes the (smoothed) AU280 trace against
+    eluate volume and decides when a peak starts and ends:
+
+    - level: a StreamingPeakDetector with `threshold` (start, valley and end rules)
+    - slope: a start only counts if the trace rose at least `slope_threshold` AU/ml
+      over the last `slope_span` samples, so slow baseline drift never collects
+
+    Each edge is due at the collector `delay_volume` ml later. At the current flowrate
+    that is a wall-clock deadline, and a timer sends the command then. A command that
+    is due already (delay volume smaller than the detection lag) goes out at once.
+    How late each command is submitted relative to its edge's deadline is kept in
+    `lateness` (commands.LatencyStats); anything over `budget` is logged and counted.
+    There is no usable default delay volume: it must be given.
+    """
+
+    def __init__(self, send_command, threshold, slope_threshold=None, delay_volume=DEFAULT_DELAY_VOLUME,
+                 budget=DEFAULT_LATENCY_BUDGET, slope_span=25):
+        if delay_volume is None:
+            raise ValueError("Peak fraction collection needs the delay volume from UV flow cell to collector")
+        self.send_command = send_command# network.InstrumentLink.send_command (thread-safe)
+        self.detector = StreamingPeakDetector(threshold)
+        self.slope_threshold = slope_threshold if slope_threshold is not None else threshold / 0.5
+        self.delay_volume = delay_volume
+        self.budget = budget
+        self.lateness = LatencyStats()
+        self.over_budget = 0
+        self.collecting = False
+        self._history = deque(maxlen=slope_span)
+        self._rejected = set()# peak numbers whose start failed the slope rule
+        self._timers = []
+        self._lock = threading.Lock()
+
+    def update(self, volumes, values, flowrate, current_volume):
+        """
+        volumes/values: the trace (NaN entries skipped). current_volume: eluate volume of
+        the newest sample, i.e. where the flow is now.
+        """
+        now = time.monotonic()
+        for x, y in zip(volumes, values):
+            if x != x or y != y:
+                continue# NaN before the smoothing filter's first full window
+            self._history.append((x, y))
+            ended = None
+            for kind, peak in self.detector.update(x, y):
+                if kind == PEAK_END:
+                    ended = peak if peak.number not in self._rejected else None
+                elif kind == PEAK_START:
+                    if self._slope() < self.slope_threshold:
+                        self._rejected.add(peak.number)
+                        log.debug("Peak %d at %.3f ml: rise too slow for fraction collection", peak.number, peak.start_x)
+                        continue
+                    # At a valley the next peak's collect is the tube change: no waste in between
+                    ended = None
+                    self._schedule(True, peak, peak.start_x, flowrate, current_volume, now)
+            if ended is not None:
+                self._schedule(False, ended, ended.end_x, flowrate, current_volume, now)
+
+    def stop(self):
+        with self._lock:
+            timers, self._timers = self._timers, []
+        for timer in timers:
+            timer.cancel()
+
+    def report(self):
+        with self._lock:
+            return dict(self.lateness.as_dict(), over_budget=self.over_budget, budget_ms=self.budget * 1000.0)
+
+    def _slope(self):
+        (x0, y0), (x1, y1) = self._history[0], self._history[-1]
+        return (y1 - y0) / (x1 - x0) if x1 > x0 else 0.0
+
+    def _schedule(self, collect, peak, edge_volume, flowrate, current_volume, now):
+        remaining = edge_volume + self.delay_volume - current_volume
+        wait = remaining / (flowrate / 60.0) if flowrate > 0 else 0.0
+        due = now + wait# when the edge reaches the collector, in the past if detection was too late
+        if wait <= 0:
+            log.warning("Peak %d: %s %.3f ml late (detection lag exceeds the delay volume)",
+                        peak.number, "collect" if collect else "waste", -remaining)
+            self._fire(collect, peak, due)
+            return
+        timer = threading.Timer(wait, self._fire, (collect, peak, due))
+        timer.daemon = True
+        with self._lock:
+            self._timers = [t for t in self._timers if t.is_alive()]
+            self._timers.append(timer)
+        timer.start()
+
+    def _fire(self, collect, peak, due):
+        command = self.send_command(FRAC_CONTROL_COMMAND, {"COLLECT": collect, "PEAK": peak.number})
+        late = time.monotonic() - due
+        with self._lock:
+            self.lateness.add(late)
+            if late > self.budget:
+                self.over_budget += 1
+        if command is None:
+            log.error("Peak %d: fraction %s not sent (client not connected)", peak.number, "collect" if collect else "waste")
+            return
+        self.collecting = collect
+        log.info("Peak %d: fraction %s (%.1f ms after due)", peak.number, "collect" if collect else "waste", late * 1000.0)
+        if late > self.budget:
+            log.warning("Peak %d: fraction change %.1f ms late, budget %.1f ms", peak.number, late * 1000.0, self.budget * 1000.0)
@@ -0,0 +1,135 @@
+#framing.py ver 0.5.0
+#incremental stream framing for the client TCP link
+import struct
+
+LINE_MODE = "line"
+LENGTH_MODE = "length"
+
+LENGTH_PREFIX = struct.Struct(">I")
+
+
+class MessageFramer:
+    """
+    Splits a TCP byte stream back into the messages the client sent.
+
+    TCP gives no guarantee that one recv() returns exactly one message: several
+    samples can arrive in one chunk, or one sample can be split across two.
+    Bytes are appended to a reusable buffer and only complete frames are returned;
+    a partial frame stays buffered until the rest of it arrives.
+
+    LINE_MODE: messages are terminated by b'\\n' (b'\\r\\n' is tolerated).
+    LENGTH_MODE: each message is preceded by a 4-byte big-endian payload length.
+    """
+
+    def __init__(self, mode=LINE_MODE, max_frame_size=1 << 20):
+        self.mode = mode
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+        self._skip_line = False# after discard(): drop bytes up to the next newline
+        self.frames_decoded = 0
+        self.bytes_received = 0
+
+    def feed(self, data):
+        """
+        Appends received bytes and returns a list of complete frames (bytes).
+        """
+        self.bytes_received += len(data)
+        if self._skip_line:
+            end = data.find(b"\n")
+            if end == -1:
+                return []
+            data = data[end + 1:]
+            self._skip_line = False
+        self._buffer += data
+        if self.mode == LENGTH_MODE:
+            frames = self._split_length_prefixed()
+        else:
+            frames = self._split_lines()
+        self.frames_decoded += len(frames)
+        return frames
+
+    def set_mode(self, mode):
+        """
+        Switches framing mode. Bytes already buffered are kept and decoded
+        with the new mode on the next feed().
+        """
+        self.mode = mode
+
+    def drain(self):
+        """
+        Returns complete frames still held in the buffer without new data.
+        """
+        return self.feed(b"")
+
+    def flush(self):
+        """
+        Returns a buffered but unterminated line as a frame (LINE_MODE only).
+        Used when the link goes idle so a client that omits the trailing
+        newline is still delivered, just one idle period later.
+        """
+        if self.mode != LINE_MODE:
+            return []
+        line = bytes(self._buffer).strip()
+        self._buffer.clear()
+        if not line:
+            return []
+        self.frames_decoded += 1
+        return [line]
+
+    def discard(self):
+        """
+        Drops the buffered bytes after a framing error (oversized frame). In LINE_MODE
+        the rest of that line is dropped too as it arrives; LENGTH_MODE can't resync,
+        so later frames may be malformed.
+        """
+        self._buffer.clear()
+        self._skip_line = self.mode == LINE_MODE
+
+    def reset(self):
+        self._buffer.clear()
+        self._skip_line = False
+        self.mode = LINE_MODE
+
+    def pending_bytes(self):
+        return len(self._buffer)
+
+    def _split_lines(self):
+        buf = self._buffer
+        end = buf.rfind(b"\n")
+        if end == -1:
+            if len(buf) > self.max_frame_size:
+                raise ValueError(f"Unterminated frame exceeds {self.max_frame_size} bytes")
+            return []
+        complete = bytes(buf[:end])
+        del buf[:end + 1]
+        frames = []
+        for line in complete.split(b"\n"):
+            line = line.strip()
+            if line:
+                frames.append(line)
+        return frames
+
+    def _split_length_prefixed(self):
+        buf = self._buffer
+        header_size = LENGTH_PREFIX.size
+        frames = []
+        offset = 0
+        while len(buf) - offset >= header_size:
+            (length,) = LENGTH_PREFIX.unpack_from(buf, offset)
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame length {length} exceeds {self.max_frame_size} bytes")
+            end = offset + header_size + length
+            if end > len(buf):
+                break
+            frames.append(bytes(buf[offset + header_size:end]))
+            offset = end
+        if offset:
+            del buf[:offset]
+        return frames
+
+
+def encode_length_prefixed(payload):
+    """
+    Builds a LENGTH_MODE frame from a payload (bytes).
+    """
+    return LENGTH_PREFIX.pack(len(payload)) + payload
@@ -5,6 +5,7 @@ import os
 import csv
 import time
 import threading
+from functools import partial
 import gpiod
 from gpiod.line import Direction, Value
 from datetime import datetime
@@ -20,20 +21,57 @@ from PySide6.QtGui import QFont, QStandardItemModel, QStandardItem, QPalette, QC
 
 import pyqtgraph as pg
 from pyqtgraph.exporters import ImageExporter
-import socket
-import json
 import pandas as pd
 import numpy as np
-from network import FPLCServer
+from network import FPLCServer, DEFAULT_INSTRUMENT
+from fplc_logging import get_logger
+from link_monitor import LINK_OK, ACTION_WARN, ACTION_PAUSE, ACTION_STOP
+from acquisition import StageQueue, POLICY_DECIMATE, slice_block, concat_blocks
+from decimation import DecimationConfig
+from derived_channels import DerivedChannels, channel_header
+from alarm_rules import AlarmEngine, DEFAULT_ALARM_RULES
+from step_index import StepIndex
+from plugins import PluginHost, DEFAULT_BUDGET, STEP_START, STEP_END, STEP_PAUSE, STEP_STOP
+import uv_monitors
+from sample_store import SpillingColumnStore, RUN_COLUMNS, DEFAULT_MEMORY_BUDGET
+from peak_detector import StreamingPeakDetector, PEAK_APEX, PEAK_END
+from streaming_filters import StreamingSavgol, StreamingBaseline
+from fraction_controller import PeakFractionController, DEFAULT_DELAY_VOLUME, detection_lag
 from hardware import set_gpio17, toggle_gpio17
-from plotting import create_plot_widget, update_plot
+from plotting import create_plot_widget, update_plot, step_marker
 from data_logger import DataLogger
 from listener import ReceiveClientSignalsAndData
 from method_editor import MethodEditor
 from data_analysis import replot_from_csv, smooth_and_detect_peaks, extract_metadata_from_csv
 
 import data_analysis
-print("Using data_analysis from:", data_analysis.__file__)
+log = get_logger("gui")
+
+DISPLAY_QUEUE_CAPACITY = 1 << 13# samples waiting to be plotted before they are thinned
+DISPLAY_QUEUE_POLICY = POLICY_DECIMATE
+PEAK_THRESHOLD_FRACTION = 0.02# live peak detection: rise/fall needed, as a fraction of AUFS
+PEAK_MIN_THRESHOLD = 0.002# AU
+FRAC_COLLECT_PEAKS = "PEAKS"# method step Frac Collect mode: the host switches tubes on detected peaks
+LIVE_SMOOTHING_WINDOW = 51# samples; same defaults as the offline Peak_ID smoothing
+LIVE_SMOOTHING_POLYORDER = 3
+LIVE_BASELINE_WINDOW = 2000# samples; wider than any peak, so peaks never lift the baseline
+LIVE_BASELINE_SPAN = 200
+PLOT_COLUMNS = {
+    **RUN_COLUMNS,
+    "smoothed_volume": np.float64,# the live smoothed trace lags by LIVE_SMOOTHING_WINDOW // 2 samples,
+    "Chan1_AU280_smoothed": np.float32,# so it carries its own x
+    "Chan1_AU280_corrected": np.float32,# baseline (drift) subtracted
+    "Chan1_AU280_smoothed_corrected": np.float32,
+}
+# Passed to plugins' on_event as (name, signal args)
+PLUGIN_LISTENER_EVENTS = (
+    "pumpA_wash_completed", "pumpB_wash_completed", "fraction_collector_error", "fraction_collector_error_cleared",
+    "pumpA_error", "pumpA_error_cleared", "pumpB_error", "pumpB_error_cleared", "stop_save",
+    "pumpA_volume", "gradient_volume", "valve_error", "valve_position",
+)
+PLUGIN_LINK_EVENTS = ("connected", "disconnected", "command_acked", "command_timeout", "link_state")
+PLUGIN_WORKER_EVENTS = ("peak", "alarm")
+log.debug("Using data_analysis from: %s", data_analysis.__file__)
                
 
 class SetPumpAVolume_WarningDialog(QDialog):
@@ -133,7 +171,7 @@ class FractionCollectorErrorDialog(QDialog):
 
     def exit_error_dialog(self):
         if self.error_cleared:
-            print("Calling accept()")
+            log.debug("Calling accept()")
             self.accept()# Close the dialog
             #self.parent().stop_save_acquisition()# Activate the Stop and Save function
         else:
@@ -223,10 +261,12 @@ class SolventExchangeDialog(QDialog):
                 self.pumpB_button.setStyleSheet("background-color: green; color: white;")
             self.parent().pumpB_wash_done = False
 
-        if wash_pumps and self.parent().connection:
-            message = f'WASH_PUMPS_JSON:{json.dumps({"WASH_PUMPS": wash_pumps})}'
-            self.parent().connection.sendall(message.encode('utf-8'))
-            print(f"Sent WASH_PUMPS_JSON message: {message}")
+        if wash_pumps and self.parent().link.is_connected():
+            command = self.parent().link.send_command("WASH_PUMPS_JSON", {"WASH_PUMPS": wash_pumps})
+            if command is None:
+                log.warning("Error sending WASH_PUMPS_JSON: client not connected")
+                return
+            log.info("Sent WASH_PUMPS_JSON message: %s", command.message.decode('utf-8'))
 
     def exit_dialog(self):
         self.parent().wash_pumpA = False
@@ -448,16 +488,41 @@ class NotesDialog(QDialog):
         }
 
 #---------- Worker class for background data acquisition----------
+def live_peak_threshold(aufs):
+    return max(PEAK_MIN_THRESHOLD, PEAK_THRESHOLD_FRACTION * aufs)
+
+
 class Worker(QObject):
-    data_signal = Signal(float, float, float, float, float, float)
     finished = Signal()
+    run_end_signal = Signal()# the run volume was reached; nothing more is logged
+    peak_signal = Signal(str, object)# (peak_detector.PEAK_START/APEX/END, Peak) on the live AU280 trace
+    alarm_signal = Signal(object)# alarm_rules.AlarmEvent
+    step_signal = Signal(object)# step_index.StepRecord, once its first row is logged
     error_signal = Signal(str)
     error_cleared_signal = Signal(str)
 
-    def __init__(self, write_to_csv_callback, main_app, selected_uv_monitor, selected_AUFS_value, connection):
+    def __init__(self, data_logger, main_app, selected_uv_monitor, selected_AUFS_value, connection,
+                 sample_buffer=None, display_queue=None, flowrate=0.0, run_volume=0.0, run_metadata=None,
+                 fraction_controller=None, decimation=None, derived_channels=(), alarm_rules=(), plugins=None,
+                 steps=None):
         super().__init__()
+        self.data_logger = data_logger
+        self.sample_buffer = sample_buffer
+        self.display_queue = display_queue
+        self.steps = steps if steps is not None else StepIndex()# method steps this run logs
+        if steps is None:
+            self.steps.begin(1, {"Flowrate (ml/min)": flowrate, "Run Volume (ml)": run_volume})
+        self.last_logged = (0.0, 0.0)# elapsed time and eluate volume of the last logged row
+        self.run_metadata = run_metadata or {}
+        self.fraction_controller = fraction_controller# peak-triggered fraction collection, or None
+        self.plugins = plugins# plugins.PluginHost, or None
+        self.decimation = decimation or DecimationConfig()
+        self.log_decimator = self.decimation.log_decimator(peak_columns=("frac_mark",))
+        self.display_decimator = self.decimation.display_decimator(peak_columns=("frac_mark",))
+        self.client_rate_checked = False
+        self.run_end_reached = False
+        self.samples_logged = 0
         self.is_running = False
-        self.write_to_csv_callback = write_to_csv_callback
         self.stop_event = threading.Event()
         self.pause_event = threading.Event()
         self.pause_event.set()
@@ -465,55 +530,151 @@ class Worker(QObject):
         self.pause_start_time = None
         self.selected_uv_monitor = selected_uv_monitor
         self.selected_AUFS_value = selected_AUFS_value
+        self.uv_driver = uv_monitors.get_driver(selected_uv_monitor)
+        self.uv_driver.au_table(selected_AUFS_value)# build the lookup table before samples arrive
+        self.derived = DerivedChannels(derived_channels, self.uv_driver, selected_AUFS_value)
+        self.alarms = AlarmEngine(alarm_rules, [*PLOT_COLUMNS, *self.derived.names], selected_AUFS_value,
+                                  self.decimation.effective_log_rate)
+        self.smoother = StreamingSavgol(LIVE_SMOOTHING_WINDOW, LIVE_SMOOTHING_POLYORDER)
+        self.baseline = StreamingBaseline(LIVE_BASELINE_WINDOW, LIVE_BASELINE_SPAN)
+        self.peak_detector = StreamingPeakDetector(live_peak_threshold(selected_AUFS_value))
         self.main_app = main_app
         self.connection = connection
         self.error_emitted = False
 
     def run(self):
+        # Acquisition stage (WorkerThread): sample_buffer -> convert -> run CSV, then render-ready
+        # batches to the GUI's display queue. The GUI only plots, so it can't slow capture down.
         self.is_running = True
         while self.is_running and not self.stop_event.is_set():
-            self.pause_event.wait()
-            time.sleep(0.1)
+            if not self.pause_event.wait(0.1):
+                continue
+            samples = self.sample_buffer.get(timeout=0.1)
+            if samples is not None:
+                self.process(samples)
+        samples = self.sample_buffer.get()
+        if samples is not None:
+            self.process(samples)
+        if not self.run_end_reached:
+            self.process(None)# stopped early: the decimators still hold the last partial window
+        self.steps.finish(self.samples_logged, self.data_logger.tell(), *self.last_logged)
+        if self.fraction_controller is not None:
+            self.fraction_controller.stop()
         self.is_running = False
         self.finished.emit()
-            
-            
-    def handle_data_received(self, message):
-        # This is called by the centralized listener
-
-        values = message.split(',')
-        if len(values) == 6:  #changed from 5 to 6 09-27-25
-            try:
-                value1 = int(values[0])
-                value2 = int(values[1])
-                elapsed_time = float(values[2])
-                eluate_volume = float(values[3])
-                frac_mark = float(values[4])
-                pumpB_percent = float(values[5]) #line added 09-27-25
-                #Chan1 = (value1 / 32768.0) * 0.256
-                #Chan2 = (value2 / 32768.0) * 0.256 #replaced with code below 090325
-                
-                # Determine full-scale voltage based on monitor type
-                if self.selected_uv_monitor == "Uvcord SII":
-                    fs_voltage = 1.024
-                else:
-                    fs_voltage = 0.256
 
-                Chan1 = (value1 / 32768.0) * fs_voltage
-                Chan2 = (value2 / 32768.0) * fs_voltage
-                
-                if self.selected_uv_monitor == "Pharmacia UV MII":
-                    Chan1_AU280 = max(0.001, round(Chan1 * (self.selected_AUFS_value / 0.1), 4))
-                elif self.selected_uv_monitor == "Uvcord SII":
-                    Chan1_AU280 = max(0.001, round(Chan1 * (self.selected_AUFS_value / 1.0), 4))
-                else:
-                    Chan1_AU280 = Chan1
-                self.data_signal.emit(elapsed_time, frac_mark, Chan1, Chan1_AU280, Chan2, pumpB_percent)
-            except ValueError: 
-                print("Error parsing acquisition data:", message)
+    def process(self, samples):
+        # samples=None flushes the decimators at the end of an acquisition
+        if self.run_end_reached:
+            return
+        if samples is None:
+            block, run_end = None, None
         else:
-            print("Received malformed data:", message) 
-
+            block = self.convert(samples)
+            self.check_client_rate(block["elapsed_time"])
+            run_end = self.run_end_index(block["eluate_volume"])
+            if run_end is not None:
+                block = slice_block(block, slice(None, run_end))
+        block = self.decimate(self.log_decimator, block, final=samples is None or run_end is not None)
+        if block is None:
+            self.display_queue.put(self.display_decimator.flush() or {})
+            return
+        block.update(self.derived.evaluate(block))
+        block["smoothed_volume"], block["Chan1_AU280_smoothed"] = self.smoother.process(
+            block["Chan1_AU280"], block["eluate_volume"]
+        )
+        # Baseline from the smoothed trace; the raw trace is LIVE_SMOOTHING_WINDOW // 2 samples
+        # ahead of it, which is nothing next to how slowly the baseline drifts
+        baseline = self.baseline.process(block["Chan1_AU280_smoothed"])
+        block["Chan1_AU280_corrected"] = block["Chan1_AU280"] - baseline
+        block["Chan1_AU280_smoothed_corrected"] = block["Chan1_AU280_smoothed"] - baseline
+        if self.fraction_controller is not None and len(block["eluate_volume"]):
+            self.fraction_controller.update(block["smoothed_volume"].tolist(), block["Chan1_AU280_smoothed"].tolist(),
+                                            self.steps.active.flowrate, float(block["eluate_volume"][-1]))
+        self.log_samples(block)
+        if self.plugins:
+            self.plugins.samples(block)# only queued: plugins run on their own threads
+        self.display_queue.put(self.decimate(self.display_decimator, block, final=samples is None or run_end is not None))
+        for kind, peak in self.peak_detector.feed(block["smoothed_volume"].tolist(), block["Chan1_AU280_smoothed"].tolist()):
+            self.peak_signal.emit(kind, peak)
+        for event in self.alarms.evaluate(block):
+            self.alarm_signal.emit(event)
+        if run_end is not None:
+            self.run_end_reached = True
+            self.stop_event.set()
+            self.run_end_signal.emit()
+
+    def decimate(self, decimator, block, final=False):
+        # Oversampled client data down to the logging (or display) rate; final adds the partial last window
+        blocks = [decimator.process(block)] if block is not None else []
+        last = decimator.flush() if final else None
+        if last is not None:
+            blocks.append(last)
+        return concat_blocks(blocks) if blocks else None
+
+    def check_client_rate(self, elapsed_time):
+        # Once per run: the decimation factor assumes the client samples at acquisition_rate
+        if self.client_rate_checked or len(elapsed_time) < 2 or elapsed_time[-1] <= elapsed_time[0]:
+            return
+        self.client_rate_checked = True
+        rate = (len(elapsed_time) - 1) / (elapsed_time[-1] - elapsed_time[0])
+        if abs(rate - self.decimation.acquisition_rate) > 0.1 * self.decimation.acquisition_rate:
+            log.warning("Client samples at %.1f Hz, not the configured %.1f Hz: logged rate is %.2f Hz",
+                        rate, self.decimation.acquisition_rate, rate / self.decimation.log_factor)
+
+    def run_end_index(self, eluate_volume):
+        # Samples past the last step's volume belong to no run: keep up to the first one reaching it
+        run_volume = self.steps.run_end_volume()
+        if run_volume is None:
+            return None
+        reached = np.flatnonzero(eluate_volume >= run_volume)
+        return reached[0] + 1 if len(reached) else None
+
+    def log_samples(self, block):
+        columns = [block["elapsed_time"], block["eluate_volume"], block["frac_mark"], block["Chan1"],
+                   block["Chan1_AU280"], block["Chan2"], block["pumpB_percent"]]# data_fieldnames order
+        columns += [block[name] for name in self.derived.names]
+        # Written in pieces at step starts, so each step's first row has its byte offset
+        start = 0
+        for index, record in self.steps.locate(block["elapsed_time"]):
+            self.write_rows(columns, start, index)
+            self.steps.mark_start(record, self.samples_logged, self.data_logger.tell(),
+                                  float(block["elapsed_time"][index]), float(block["eluate_volume"][index]))
+            self.step_signal.emit(record)
+            start = index
+        self.write_rows(columns, start, len(columns[0]))
+
+    def write_rows(self, columns, start, stop):
+        columns = [column[start:stop] for column in columns]
+        if not len(columns[0]):
+            return
+        if not self.data_logger.metadata_written:
+            # The run metadata rides on the first data row of the file
+            first_row = dict(zip(self.data_logger.data_fieldnames, (float(column[0]) for column in columns)))
+            self.data_logger.write_metadata({**first_row, **self.run_metadata})
+            self.data_logger.append_data_columns([column[1:] for column in columns])
+        else:
+            self.data_logger.append_data_columns(columns)
+        self.samples_logged += len(columns[0])
+        self.last_logged = (float(columns[0][-1]), float(columns[1][-1]))
+
+    def convert(self, samples):
+        # Volts and AU280 come from the monitor driver's per-code lookup tables
+        Chan1, Chan1_AU280, Chan2 = self.uv_driver.convert(
+            samples["chan1_counts"], samples["chan2_counts"], self.selected_AUFS_value
+        )
+        elapsed_time = samples["elapsed_time"].astype(np.float64)
+        if len(elapsed_time):
+            self.steps.activate(elapsed_time[0])# steps sent since the last batch start here
+        return {
+            "elapsed_time": elapsed_time,
+            "eluate_volume": self.steps.volume(elapsed_time),
+            "frac_mark": samples["frac_mark"].astype(np.float64),
+            "Chan1": Chan1,
+            "Chan1_AU280": Chan1_AU280,
+            "Chan2": Chan2,
+            "pumpB_percent": samples["pumpB_percent"].astype(np.float64),
+        }
 
     def pause(self):
         self.pause_start_time = time.time()
@@ -532,9 +693,23 @@ class Worker(QObject):
         
 class FPLCSystemApp(QMainWindow):
     connection_established = Signal()
+    batches_ready_signal = Signal()# display_queue has data
     
-    def __init__(self):
+    def __init__(self, server=None, instrument_name=None, instrument_host=None, link_degraded_action=ACTION_WARN,
+                 capture_dir=None, frac_delay_volume=DEFAULT_DELAY_VOLUME, decimation=None, derived_channels=(),
+                 alarm_rules=DEFAULT_ALARM_RULES, plugins=(), plugin_budget=DEFAULT_BUDGET,
+                 memory_budget=DEFAULT_MEMORY_BUDGET):
         super().__init__()
+        self.instrument_name = instrument_name or DEFAULT_INSTRUMENT
+        self.link_degraded_action = link_degraded_action# warn / pause / stop when the link degrades mid-run
+        self.link_paused = False# acquisition paused by a degraded link, not by the user
+        self.frac_delay_volume = frac_delay_volume# ml from the UV flow cell to the fraction collector; None refuses PEAKS steps
+        self.peak_fraction_mode = False# current step collects fractions on detected peaks
+        self.fraction_controller = None
+        self.decimation = decimation or DecimationConfig()# client sample rate -> logged and plotted rates
+        self.derived_channels = list(derived_channels)# derived_channels names, logged and plotted after the native ones
+        self.alarm_rules = list(alarm_rules)# alarm_rules rule dicts, compiled for each run by the worker
+        self.plugins = PluginHost(plugins, plugin_budget)# (name, create_plugin) pairs from plugins.load_plugin
         self.setWindowFlags(Qt.WindowType.Window | Qt.WindowType.FramelessWindowHint)
         self.setFixedSize(1024, 768)
         
@@ -548,8 +723,10 @@ class FPLCSystemApp(QMainWindow):
         self.worker = None
         self.thread = None
         self.error_dialog_open = False
-        self.scan_rate = 10
-        self.run_volume = 0.0
+        self.scan_rate = self.decimation.effective_log_rate# Hz in the run CSV
+        self.run_volume = 0.0# current step's
+        self.acquisition_volume = 0.0# all the steps the current run logs (plot X range)
+        self.step_record = None# step_index.StepRecord of the last UV-monitored step sent
         self.is_running = False
         self.acquisition_stopped = False #prevent multiple save dialog windows from opening
         self.saved_run_volume = 0.0
@@ -562,7 +739,7 @@ class FPLCSystemApp(QMainWindow):
         self.flowrate = 0.0
         self.uv_monitor_FS_value = 0.1
         self.max_y_value = self.selected_AUFS_value
-        self.selected_uv_monitor = "Pharmacia UV MII"
+        self.selected_uv_monitor = uv_monitors.DEFAULT_MONITOR
         self.metadata_written = False
         self.toggle_pump_calibration_mode = 'OFF'
         self.program_mode = None # Tracks 'Open', 'Create', or None
@@ -593,35 +770,58 @@ class FPLCSystemApp(QMainWindow):
 
 
 
-        # Data storage
-        self.elapsed_time_data = []
-        self.eluate_volume_data = []
-        self.frac_mark_data = []
-        self.chan1_data = []
-        self.chan1_AU280_data = []
-        self.chan2_data = []
-        self.pumpB_percent_data = []
+        self.peak_items = []# live peak labels/regions, re-added after each redraw
+        self.step_items = []# step start markers, likewise
+        self.alarm_items = []# alarm markers, likewise
+        self.alarm_raised_at = {}# rule name -> eluate volume while the alarm is up
+        self.show_smoothed_trace = False
+        self.show_baseline_corrected = False
         self.user_notes = {}
 
         # Setup paths and logger
         self.basepath = '/home/sybednar/FPLC_controller_venv/Measurement_Computing'
         self.mypath = os.path.join(self.basepath, 'Scanning_log_files')
+
+        # Data storage (plotted samples; the run CSV has all of them). Past memory_budget bytes
+        # the oldest are spilled to disk next to the run logs and plotted as a min/max summary.
+        os.makedirs(self.mypath, exist_ok=True)
+        self.run_data = SpillingColumnStore({**PLOT_COLUMNS, **{name: np.float32 for name in self.derived_channels}},
+                                            memory_budget, spill_dir=self.mypath)
         self.metadata_fieldnames = [
         "RUN_VOLUME (ml)", "Year/Date/Time", "Column_type", "AUFS_setting",
-        "UV_monitor", "UV_monitor_FS_value (Volts)", "Flowrate (ml/min)"
+        "UV_monitor", "UV_monitor_FS_value (Volts)", "Flowrate (ml/min)",
+        "Sample_rate (Hz)", "Decimation_filter"
         ]
         self.data_fieldnames = [
         "Elapsed_Time (sec)", "Eluate_Volume (ml)", "Frac_Mark",
-        "Chan1 (volt)", "Chan1_AU280 (AU)", "Chan2", "PumpB_percent"
+        "Chan1 (volt)", "Chan1_AU280 (AU)", "Chan2", "PumpB_percent",
+        *(channel_header(name) for name in self.derived_channels)
         ]
-        self.logger = DataLogger(self.basepath, self.metadata_fieldnames, self.data_fieldnames)
+        self.logger = DataLogger(self.basepath, self.metadata_fieldnames, self.data_fieldnames, instrument_name)
+
+        # Worker -> GUI: render-ready batches (already logged), thinned when the GUI lags
+        self.display_queue = StageQueue("display", DISPLAY_QUEUE_CAPACITY, DISPLAY_QUEUE_POLICY,
+                                        self.batches_ready_signal.emit, peak_columns=("frac_mark",))
+        self.batches_ready_signal.connect(self.handle_batches)
 
         # UI setup
         self.init_ui()
-        self.server = FPLCServer()
-        self.server.start_server()
         self.connection = None
-        self.start_connection_monitor()
+        # A shared server drives several instruments; without one this window runs its own
+        self.owns_server = server is None
+        self.server = server if server is not None else FPLCServer(capture_dir=capture_dir)
+        self.listener = ReceiveClientSignalsAndData()
+        self.connect_listener_signals()
+        self.link = self.server.register_instrument(self.instrument_name, self.listener, instrument_host)
+        self.link.connected_signal.connect(self.handle_connection)
+        self.link.disconnected_signal.connect(self.handle_disconnection)
+        self.link.command_acked_signal.connect(self.handle_command_acked)
+        self.link.command_timeout_signal.connect(self.handle_command_timeout)
+        self.link.link_quality_signal.connect(self.handle_link_quality)
+        self.link.link_state_signal.connect(self.handle_link_state)
+        self.connect_plugin_events()
+        if self.owns_server:
+            self.server.start_server()
 
     def init_ui(self):
         container = QWidget(self)
@@ -678,6 +878,16 @@ class FPLCSystemApp(QMainWindow):
         self.Peak_Processing_button.setGeometry(874, 180, 100, 30)
         self.Peak_Processing_button.clicked.connect(self.Peak_Smoothing_PeakID)
 
+        self.smoothed_trace_button = QPushButton("Smooth Trace", container)
+        self.smoothed_trace_button.setGeometry(874, 340, 100, 30)
+        self.smoothed_trace_button.setCheckable(True)
+        self.smoothed_trace_button.toggled.connect(self.toggle_smoothed_trace)
+
+        self.baseline_button = QPushButton("Baseline Corr", container)
+        self.baseline_button.setGeometry(874, 380, 100, 30)
+        self.baseline_button.setCheckable(True)
+        self.baseline_button.toggled.connect(self.toggle_baseline_correction)
+
         self.run_notes_button = QPushButton("Run Notes", container)
         self.run_notes_button.setGeometry(874, 260, 100, 30)
         self.run_notes_button.clicked.connect(self.open_run_notes_dialog)
@@ -728,9 +938,9 @@ class FPLCSystemApp(QMainWindow):
                 self.update_run_button_state("paused")
 
     def handle_method_run(self):
-        if self.connection is None or self.connection.fileno() == -1:
+        if not self.link.is_connected():
             QMessageBox.critical(self, "Connection Error", "FPLC client is not connected. Please wait for connection.")
-            print("Run_Method clicked but client is not connected. Button will not turn green.")
+            log.warning("Run_Method clicked but client is not connected. Button will not turn green.")
             return
         
         if not self.user_notes:
@@ -806,16 +1016,18 @@ class FPLCSystemApp(QMainWindow):
                 self.method_editor.setGraphicsEffect(None)
 
     def run_next_step(self):
-        if self.connection is None or self.connection.fileno() == -1:
+        if not self.link.is_connected():
             QMessageBox.critical(self, "Connection Error", "FPLC client is not connected. Please wait for connection.")
-            print("run_next_step aborted: No connection to client.")
+            log.warning("run_next_step aborted: No connection to client.")
             return
         
         if self.current_step_index >= len(self.method_sequence):
-            print("All steps completed.")
+            log.info("All steps completed.")
             return
 
         step = self.method_sequence[self.current_step_index]
+        if step.get("Frac Collect", "OFF") == FRAC_COLLECT_PEAKS and not self.check_frac_delay_volume(step):
+            return
 
         # Highlight the current step row
         self.method_editor.highlight_step_row(self.current_step_index)
@@ -828,8 +1040,16 @@ class FPLCSystemApp(QMainWindow):
         self.saved_flowrate = self.flowrate
         self.saved_run_volume = self.run_volume
 
+        # A UV-monitored step that follows on from one still logging joins its run
+        monitored = step.get("Monitor", "UV_OFF") == "UV_ON"
+        continuing = (monitored and self.step_record is not None and not self.step_record.final
+                      and self.worker is not None and self.worker.is_running)
+        if not continuing:
+            chain = self.monitored_steps(self.current_step_index) if monitored else [self.current_step_index]
+            self.acquisition_volume = sum(float(self.method_sequence[i]["Run Volume (ml)"]) for i in chain)
+
         # Update plot
-        self.plot_widget.setXRange(0, self.run_volume)
+        self.plot_widget.setXRange(0, self.acquisition_volume)
         self.update_plot_title()
 
         # Determine pump mode and prepare run packet
@@ -845,29 +1065,64 @@ class FPLCSystemApp(QMainWindow):
         #if self.fraction_collector_mode_enabled: #removed ver 4.6.5
         if step.get("Monitor", "UV_OFF") == "UV_ON": #added ver 4.6.5
             run_packet["START_ADC"] = True
+            run_packet["SCAN_RATE"] = self.decimation.acquisition_rate# the host decimates to self.scan_rate
         if step.get("Frac Collect", "OFF") == "ON":
             run_packet["START_FRAC"] = True
+        self.peak_fraction_mode = step.get("Frac Collect", "OFF") == FRAC_COLLECT_PEAKS
+        if self.peak_fraction_mode:
+            # Collector starts on waste; the acquisition worker switches tubes on detected peaks
+            run_packet["START_FRAC"] = True
+            run_packet["FRAC_MODE"] = FRAC_COLLECT_PEAKS
 
         if pump_mode == "Gradient":
             gradient = step.get("PumpB Gradient", {"Min": 0.0, "Max": 100.0})
             run_packet["PumpB_min_percent"] = gradient.get("Min", 0.0)
             run_packet["PumpB_max_percent"] = gradient.get("Max", 100.0)
-            message = f'GRADIENT_RUN_METHOD_JSON:{json.dumps(run_packet)}'
+            command_name = "GRADIENT_RUN_METHOD_JSON"
         else:
             run_packet["PumpB_min_percent"] = 0.0
             run_packet["PumpB_max_percent"] = 0.0
-            message = f'ISOCRATIC_RUN_METHOD_JSON:{json.dumps(run_packet)}'
+            command_name = "ISOCRATIC_RUN_METHOD_JSON"
 
-        try:
-            self.connection.sendall(message.encode('utf-8'))
-            print(f"Sent step {self.current_step_index + 1}: {message}")
-        except socket.error as e:
-            print(f"Error sending step: {e}")
+        command = self.link.send_command(command_name, run_packet)
+        if command is None:
+            log.warning("Error sending step: client not connected")
             self.handle_disconnection()
             return
+        log.info("Sent step %d: %s", self.current_step_index + 1, command.message.decode('utf-8'))
+        self.plugins.step(self.current_step_index, step, STEP_START)
 
-        if step.get("Monitor", "UV_OFF") == "UV_ON": #addded ver 4.6.5
-            self.run_acquisition()
+        if monitored: #addded ver 4.6.5
+            final = self.current_step_index == self.monitored_steps(self.current_step_index)[-1]
+            if continuing:
+                self.step_record = self.worker.steps.begin(self.current_step_index + 1, step, final)
+            else:
+                steps = StepIndex()
+                self.step_record = steps.begin(self.current_step_index + 1, step, final)
+                self.run_acquisition(steps)
+
+    def check_frac_delay_volume(self, step):
+        # Peak collection switches tubes delay volume after the flow cell; the detector sees an edge late
+        if self.frac_delay_volume is None:
+            QMessageBox.critical(self, "Fraction Collection",
+                                 "Peak fraction collection needs the delay volume from the UV flow cell to the "
+                                 "collector.<br>Start the GUI with --frac-delay-volume ML.")
+            log.error("Step %d not started: no fraction collector delay volume set", self.current_step_index + 1)
+            return False
+        lag = detection_lag(float(step["Flowrate (ml/min)"]), self.scan_rate, LIVE_SMOOTHING_WINDOW)
+        if self.frac_delay_volume < lag:
+            log.warning("Fraction delay volume %.3f ml is less than the peak detection lag (%.3f ml at %s ml/min): "
+                        "every fraction change will be late", self.frac_delay_volume, lag, step["Flowrate (ml/min)"])
+        return True
+
+    def monitored_steps(self, index):
+        # index and the UV-monitored steps that follow on from it ("Continue"): one run logs them all
+        chain = [index]
+        while (self.method_sequence[chain[-1]].get("End Action", "Continue") == "Continue"
+               and chain[-1] + 1 < len(self.method_sequence)
+               and self.method_sequence[chain[-1] + 1].get("Monitor", "UV_OFF") == "UV_ON"):
+            chain.append(chain[-1] + 1)
+        return chain
 
     def handle_next_step(self):
         if self.current_step_index >= len(self.method_sequence):
@@ -878,6 +1133,7 @@ class FPLCSystemApp(QMainWindow):
 
         step = self.method_sequence[self.current_step_index]
         end_action = step.get("End Action", "Continue")
+        self.plugins.step(self.current_step_index, step, STEP_END)
 
         if end_action == "Continue":
             self.current_step_index += 1
@@ -889,19 +1145,21 @@ class FPLCSystemApp(QMainWindow):
 
     def handle_method_pause(self):
         self.update_run_button_state("paused")
-        print("Method Pause clicked")
+        log.info("Method Pause clicked")
+        self.notify_plugins_step(STEP_PAUSE)
         self.open_pause_dialog()
         
     def handle_method_stop(self):
         self.update_run_button_state("default")
-        print("Method Stop clicked")
+        log.info("Method Stop clicked")
+        self.notify_plugins_step(STEP_STOP)
         
         # Reset all method table row colors
         if self.method_editor and hasattr(self.method_editor, "reset_step_row_color"):
             for i in range(len(self.method_sequence)):
                 self.method_editor.reset_step_row_color(i)
         
-        if self.connection:
+        if self.link.is_connected():
             stop_method_packet = {
                 "STOP_PUMPS": True,
                 "System_Valve_Position": "LOAD",
@@ -914,17 +1172,16 @@ class FPLCSystemApp(QMainWindow):
             if self.method_sequence and self.method_sequence[-1].get("Monitor", "UV_OFF") == "UV_ON":
                 stop_method_packet["STOP_ADC"] = True
             
-            if self.method_sequence and self.method_sequence[-1].get("Frac Collect", "OFF") == "ON":
+            if self.method_sequence and self.method_sequence[-1].get("Frac Collect", "OFF") in ("ON", FRAC_COLLECT_PEAKS):
                 stop_method_packet["STOP_FRAC"] = True
 
             if self.divert_valve_mode:
                 stop_method_packet["DIVERTER_VALVE"] = False # could delete as default setting in client when stop is "OFF" 
 
-            try:
-                self.connection.sendall(f'METHOD_STOP_JSON:{json.dumps(stop_method_packet)}'.encode('utf-8'))
-                print(f"Sent METHOD_STOP_JSON: {stop_method_packet}")
-            except socket.error as e:
-                print(f"Error sending METHOD_STOP_JSON: {e}")
+            if self.link.send_command("METHOD_STOP_JSON", stop_method_packet) is not None:
+                log.info("Sent METHOD_STOP_JSON: %s", stop_method_packet)
+            else:
+                log.error("Error sending METHOD_STOP_JSON: client not connected")
                 self.handle_disconnection()
 
             self.reset_progress_bar()
@@ -936,7 +1193,7 @@ class FPLCSystemApp(QMainWindow):
                 self.stop_save_acquisition()
 
     def Regraph_data_file(self, show_exit_dialog=True):
-        print("ReGraph Button clicked")
+        log.info("ReGraph Button clicked")
         try:
             file_dialog = QFileDialog()
             file_dialog.setNameFilter("CSV files (*.csv)")
@@ -972,14 +1229,14 @@ class FPLCSystemApp(QMainWindow):
                         if response == QMessageBox.Close:
                             self.clear_plot_and_reset()
                             self.csv_path = None
-                            print("Plot cleared and system reset after ReGraph.")
+                            log.info("Plot cleared and system reset after ReGraph.")
 
 
         except Exception as e:
-            print(f"Error during replot: {e}")
+            log.warning("Error during replot: %s", e)
  
     def Peak_Smoothing_PeakID(self):
-        print("Peak_Smoothing Button clicked")
+        log.info("Peak_Smoothing Button clicked")
         # Clear plot and reset before analysis
         self.clear_plot_and_reset()
         dialog = PeakSmoothingDialog(self)
@@ -1091,7 +1348,7 @@ class FPLCSystemApp(QMainWindow):
                     dialog.metadata = metadata
 
             except Exception as e:
-                print(f"Error during smoothing: {e}")
+                log.warning("Error during smoothing: %s", e)
 
         dialog.parameters_changed.connect(apply_and_plot)
         apply_and_plot()
@@ -1150,18 +1407,18 @@ class FPLCSystemApp(QMainWindow):
                 exporter = ImageExporter(self.plot_widget.plotItem)
                 exporter.export(processed_png)
 
-                print(f"Saved: {processed_csv}")
-                print(f"Saved: {processed_png}")
+                log.info("Saved: %s", processed_csv)
+                log.info("Saved: %s", processed_png)
             else:
-                print("Save canceled: No directory selected.")
+                log.info("Save canceled: No directory selected.")
         else:
-            print("Dialog closed without saving. Clearing plot.")
+            log.info("Dialog closed without saving. Clearing plot.")
             self.plot_widget.clear()
             self.plot_widget.setTitle("")
             self.csv_path = None            
    
     def toggle_pump_calibration(self):
-        print("Pump_Calibration Button clicked")
+        log.info("Pump_Calibration Button clicked")
         #self.toggle_pump_calibration_mode = 'OFF'
 
     def toggle_divert_valve(self):
@@ -1180,42 +1437,43 @@ class FPLCSystemApp(QMainWindow):
                 self.method_editor.steps[-1]["Diverter"] = self.divert_valve_mode
                 self.method_editor.update_table()
 
-    def start_connection_monitor(self):
-        self.connection_thread = threading.Thread(target=self.monitor_connection, daemon=True)
-        self.connection_thread.start()
-
-    def monitor_connection(self):
-        while True:
-            if self.connection is None or self.connection.fileno() == -1:
-                print("Attempting to establish connection...")
-                self.connection = self.server.accept_connection()
-                self.connection_status_label.setText("FPLC connected")
-                self.connection_status_label.setStyleSheet("background-color: green; color: white; border: 1px solid black;")
-                self.connection_established.emit() #Emit signal to notify connection is established
-
-                if not hasattr(self, 'listener') or self.listener is None:
-                    self.listener = ReceiveClientSignalsAndData(self.connection)
-                    self.listener.pumpA_wash_completed_signal.connect(self.handle_pumpA_wash_completed)
-                    self.listener.pumpB_wash_completed_signal.connect(self.handle_pumpB_wash_completed)
-                    self.listener.fraction_collector_error_signal.connect(self.handle_fraction_collector_error)
-                    self.listener.fraction_collector_error_cleared_signal.connect(self.handle_fraction_collector_error_cleared)
-                    self.listener.pumpA_error_signal.connect(self.handle_PumpA_error)
-                    self.listener.pumpA_error_cleared_signal.connect(self.handle_PumpA_error_cleared)
-                    self.listener.pumpB_error_signal.connect(self.handle_PumpB_error)
-                    self.listener.pumpB_error_cleared_signal.connect(self.handle_PumpB_error_cleared)               
-                    self.listener.disconnected_signal.connect(self.handle_disconnection)
-                    self.listener.stop_save_signal.connect(self.stop_save_acquisition)
-                    self.listener.pumpA_volume_signal.connect(self.update_volume_delivered_progress)
-                    self.listener.pumpA_volume_signal.connect(self.on_pumpA_volume_update)
-                    self.listener.gradient_volume_signal.connect(self.update_volume_delivered_progress)
-                    self.listener.gradient_volume_signal.connect(self.on_gradient_volume_update)
-                    self.listener.valve_error_signal.connect(self.handle_valve_error)
-                    self.listener.valve_position_signal.connect(self.handle_valve_position)
-                    if self.worker:
-                        self.listener.data_received_signal.connect(self.worker.handle_data_received)
-
-                    self.listener.start()
-            time.sleep(5)
+    def notify_plugins_step(self, transition):
+        if self.plugins and self.current_step_index < len(self.method_sequence):
+            self.plugins.step(self.current_step_index, self.method_sequence[self.current_step_index], transition)
+
+    def connect_plugin_events(self):
+        # Plugins see the same signals the GUI handles; PluginHost.event only queues them
+        if not self.plugins:
+            return
+        for name in PLUGIN_LISTENER_EVENTS:
+            getattr(self.listener, f"{name}_signal").connect(partial(self.plugins.event, name))
+        for name in PLUGIN_LINK_EVENTS:
+            getattr(self.link, f"{name}_signal").connect(partial(self.plugins.event, name))
+
+    def connect_listener_signals(self):
+        self.listener.pumpA_wash_completed_signal.connect(self.handle_pumpA_wash_completed)
+        self.listener.pumpB_wash_completed_signal.connect(self.handle_pumpB_wash_completed)
+        self.listener.fraction_collector_error_signal.connect(self.handle_fraction_collector_error)
+        self.listener.fraction_collector_error_cleared_signal.connect(self.handle_fraction_collector_error_cleared)
+        self.listener.pumpA_error_signal.connect(self.handle_PumpA_error)
+        self.listener.pumpA_error_cleared_signal.connect(self.handle_PumpA_error_cleared)
+        self.listener.pumpB_error_signal.connect(self.handle_PumpB_error)
+        self.listener.pumpB_error_cleared_signal.connect(self.handle_PumpB_error_cleared)
+        self.listener.stop_save_signal.connect(self.stop_save_acquisition)
+        self.listener.pumpA_volume_signal.connect(self.update_volume_delivered_progress)
+        self.listener.pumpA_volume_signal.connect(self.on_pumpA_volume_update)
+        self.listener.gradient_volume_signal.connect(self.update_volume_delivered_progress)
+        self.listener.gradient_volume_signal.connect(self.on_gradient_volume_update)
+        self.listener.valve_error_signal.connect(self.handle_valve_error)
+        self.listener.valve_position_signal.connect(self.handle_valve_position)
+
+    def handle_connection(self, peer):
+        # Delivered on the GUI thread by FPLCServer.client_connected_signal
+        self.connection = self.link.connection
+        self.connection_status_label.setText("FPLC connected")
+        self.connection_status_label.setStyleSheet("background-color: green; color: white; border: 1px solid black;")
+        self.connection_established.emit() #Emit signal to notify connection is established
+        log.info("%s: FPLC client connected from %s", self.instrument_name, peer)
 
     def open_solvent_exchange_dialog(self):
         if not hasattr(self, 'solvent_exchange_dialog') or not self.solvent_exchange_dialog.isVisible():
@@ -1231,7 +1489,7 @@ class FPLCSystemApp(QMainWindow):
             self.pump_wash_button.setStyleSheet("color: gray; background-color: #2e2e2e;")
 
     def handle_pumpA_wash_completed(self):
-        print("[DEBUG] PumpA wash completed signal received")
+        log.debug("PumpA wash completed signal received")
         self.pumpA_wash_done = True
         if hasattr(self, 'solvent_exchange_dialog') and self.solvent_exchange_dialog.isVisible():
             self.solvent_exchange_dialog.pumpA_button.setText("PumpA_Wash-Completed")
@@ -1239,7 +1497,7 @@ class FPLCSystemApp(QMainWindow):
         self.check_if_wash_complete()
 
     def handle_pumpB_wash_completed(self):
-        print("[DEBUG] PumpB wash completed signal received")
+        log.debug("PumpB wash completed signal received")
         self.pumpB_wash_done = True
         if hasattr(self, 'solvent_exchange_dialog') and self.solvent_exchange_dialog.isVisible():
             self.solvent_exchange_dialog.pumpB_button.setText("PumpB_Wash-Completed")      
@@ -1247,14 +1505,14 @@ class FPLCSystemApp(QMainWindow):
         self.check_if_wash_complete()
 
     def check_if_wash_complete(self):
-        print(f"[DEBUG] pumpA_wash_started: {self.pumpA_wash_started}, pumpA_wash_done: {self.pumpA_wash_done}")
-        print(f"[DEBUG] pumpB_wash_started: {self.pumpB_wash_started}, pumpB_wash_done: {self.pumpB_wash_done}")
+        log.debug("pumpA_wash_started: %s, pumpA_wash_done: %s", self.pumpA_wash_started, self.pumpA_wash_done)
+        log.debug("pumpB_wash_started: %s, pumpB_wash_done: %s", self.pumpB_wash_started, self.pumpB_wash_done)
 
         if ((self.pumpA_wash_started and self.pumpA_wash_done) and
             (self.pumpB_wash_started and self.pumpB_wash_done)) or \
             (self.pumpA_wash_started and not self.pumpB_wash_started and self.pumpA_wash_done) or \
             (self.pumpB_wash_started and not self.pumpA_wash_started and self.pumpB_wash_done):
-            print("[DEBUG] All required washes completed. Closing dialog.")
+            log.debug("All required washes completed. Closing dialog.")
             if hasattr(self, 'solvent_exchange_dialog') and self.solvent_exchange_dialog.isVisible():
                 self.solvent_exchange_dialog.close()
             self.reset_wash_flags()
@@ -1289,82 +1547,160 @@ class FPLCSystemApp(QMainWindow):
         if self.run_volume > 0 and volume >= self.run_volume:
             self.handle_next_step()
 
-    def run_acquisition(self):
+    def run_acquisition(self, steps=None):
         if self.worker is not None and self.worker.is_running:
-            print("Acquisition already running.")
+            log.info("Acquisition already running.")
             return
         self.update_plot_title()
 
-        self.worker = Worker(self.logger.append_data_row, self, self.selected_uv_monitor, self.selected_AUFS_value, self.connection)
-        self.listener.data_received_signal.connect(self.worker.handle_data_received)
-        self.worker.data_signal.connect(self.update_plot_data)
+        self.worker = Worker(self.logger, self, self.selected_uv_monitor, self.selected_AUFS_value,
+                             self.connection, self.listener.sample_buffer, self.display_queue,
+                             self.flowrate, self.run_volume, self.run_metadata(), self.new_fraction_controller(),
+                             self.decimation, self.derived_channels, self.alarm_rules, self.plugins, steps)
+        self.display_queue.clear()
+        self.listener.sample_buffer.clear()
+        self.listener.sample_buffer.active = True
         #self.worker.finished.connect(self.enable_buttons)
+        self.worker.run_end_signal.connect(self.handle_run_end)
+        self.worker.peak_signal.connect(self.handle_peak_event)
+        self.worker.alarm_signal.connect(self.handle_alarm)
+        self.worker.step_signal.connect(self.handle_step_logged)
+        if self.plugins:
+            for name in PLUGIN_WORKER_EVENTS:
+                getattr(self.worker, f"{name}_signal").connect(partial(self.plugins.event, name))
         self.worker.error_signal.connect(self.handle_fraction_collector_error)
         self.worker.error_cleared_signal.connect(self.handle_fraction_collector_error_cleared)
         self.thread = threading.Thread(target=self.worker.run, name="WorkerThread")
         self.thread.start()
 
-    def update_plot_data(self, elapsed_time, frac_mark, Chan1, Chan1_AU280, Chan2, pumpB_percent): #added , pumpB_percent 09-27-25
-        self.elapsed_time_data.append(elapsed_time)
-        self.chan1_data.append(Chan1)
-        self.chan1_AU280_data.append(Chan1_AU280)
-        self.chan2_data.append(Chan2)
-        self.pumpB_percent_data.append(pumpB_percent)
-
-        eluate_volume = elapsed_time * (self.flowrate / 60)
-        self.eluate_volume_data.append(eluate_volume)
-
-        data_row = {
-            "Elapsed_Time (sec)": elapsed_time,
-            "Eluate_Volume (ml)": eluate_volume,
-            "Frac_Mark": frac_mark,
-            "Chan1 (volt)": Chan1,
-            "Chan1_AU280 (AU)": Chan1_AU280,
-            "Chan2": Chan2,
-            "PumpB_percent": pumpB_percent
-        }
-
-        if not self.metadata_written:
-            metadata = {
-                "RUN_VOLUME (ml)": self.run_volume,
-                "Year/Date/Time": self.RunDateTime,
-                "Column_type": self.selected_column_type,
-                "AUFS_setting": self.selected_AUFS_value,
-                "UV_monitor": self.selected_uv_monitor,
-                "UV_monitor_FS_value (Volts)": self.uv_monitor_FS_value,
-                "Flowrate (ml/min)": self.flowrate
-            }
-            
-            #full_metadata = {**data_row, **metadata, **self.user_notes}
-            self.logger.write_metadata({**data_row, **metadata}) #change to self.logger.write_metadata(full_metadata)
-            self.metadata_written = True
+    def new_fraction_controller(self):
+        if not self.peak_fraction_mode:
+            self.fraction_controller = None
         else:
-            self.logger.append_data_row(data_row)
+            self.fraction_controller = PeakFractionController(
+                self.link.send_command, live_peak_threshold(self.selected_AUFS_value), delay_volume=self.frac_delay_volume
+            )
+        return self.fraction_controller
+
+    def handle_batches(self, final=False):
+        # GUI thread, once per event-loop tick: redraw once with everything pending.
+        # final: the worker has exited, draw what it flushed even though acquisition has stopped
+        block = self.display_queue.get()
+        if block is not None and (final or not self.acquisition_stopped):
+            self.display_samples(block)
+
+    def handle_run_end(self):
+        self.handle_batches()
+        self.stop_save_acquisition()
+        # Check if the current step's End Action is "Stop"
+        method_sequence = self.method_editor.get_method_sequence()
+        if method_sequence and method_sequence[-1].get("End Action") == "Stop":
+            self.handle_method_stop()
 
-        if frac_mark == 1.0:
-            frac_mark_value = 0.1 * self.max_y_value
-        else:
-            frac_mark_value = 0.0
-        self.frac_mark_data.append(frac_mark_value)
+    def pipeline_stats(self):
+        return [self.listener.sample_buffer.stats(), self.display_queue.stats()]
+
+    def run_metadata(self):
+        return {
+            "RUN_VOLUME (ml)": self.acquisition_volume,
+            "Year/Date/Time": self.RunDateTime,
+            "Column_type": self.selected_column_type,
+            "AUFS_setting": self.selected_AUFS_value,
+            "UV_monitor": self.selected_uv_monitor,
+            "UV_monitor_FS_value (Volts)": self.uv_monitor_FS_value,
+            "Flowrate (ml/min)": self.flowrate,
+            "Sample_rate (Hz)": self.scan_rate,
+            "Decimation_filter": self.decimation.describe()
+        }
 
+    def display_samples(self, block):
+        # May be a thinned copy of what was logged (display queue policy)
+        self.run_data.append(block)
+        self.redraw_plot()
+
+    def redraw_plot(self):
+        corrected = self.show_baseline_corrected
         self.max_y_value = update_plot(
             self.plot_widget,
-            self.elapsed_time_data,
-            self.eluate_volume_data,
-            self.chan1_AU280_data,
-            self.chan2_data,
-            self.frac_mark_data,
-            self.run_volume,
+            self.run_data["elapsed_time"],
+            self.run_data["eluate_volume"],
+            self.run_data["Chan1_AU280_corrected" if corrected else "Chan1_AU280"],
+            self.run_data["Chan2"],
+            # Frac marks at 10% of the current Y range, whichever trace set it
+            np.where(self.run_data["frac_mark"] == 1.0, 0.1 * self.max_y_value, 0.0),
+            self.acquisition_volume,
             self.max_y_value,
-            self.pumpB_percent_data
+            self.run_data["pumpB_percent"],
+            self.run_data["smoothed_volume"] if self.show_smoothed_trace else None,
+            self.run_data["Chan1_AU280_smoothed_corrected" if corrected else "Chan1_AU280_smoothed"]
+            if self.show_smoothed_trace else None,
+            chan1_label="AU_280 (baseline corrected)" if corrected else "AU_280",
+            derived_data={name: self.run_data[name] for name in self.derived_channels}
         )
+        for item in self.peak_items + self.alarm_items + self.step_items:
+            self.plot_widget.addItem(item, ignoreBounds=True)
+
+    def toggle_smoothed_trace(self, checked):
+        # The worker always computes the smoothed trace, so it appears for the whole run so far
+        self.show_smoothed_trace = checked
+        if len(self.run_data) and not self.acquisition_stopped:
+            self.redraw_plot()
+
+    def toggle_baseline_correction(self, checked):
+        # Plot and autoscale the drift-corrected trace; the Y range is rebuilt from the data shown
+        self.show_baseline_corrected = checked
+        if len(self.run_data) and not self.acquisition_stopped:
+            self.max_y_value = 0.0
+            self.redraw_plot()
+
+    def handle_alarm(self, event):
+        # Every alarm is marked on the plot; pause/stop rules also act on the running method
+        if not event.raised:
+            log.info("Alarm cleared: %s", event.message)
+            start = self.alarm_raised_at.pop(event.rule, event.x)
+            item = pg.LinearRegionItem((start, event.x), movable=False, brush=pg.mkBrush(255, 0, 0, 40))
+            item.setZValue(-10)
+        else:
+            log.warning("Alarm (%s): %s", event.action, event.message)
+            self.alarm_raised_at[event.rule] = event.x
+            item = pg.InfiniteLine(event.x, pen=pg.mkPen('r', width=1), label=event.rule,
+                                   labelOpts={"position": 0.9, "color": 'r'})
+        self.alarm_items.append(item)
+        if not self.acquisition_stopped:
+            self.plot_widget.addItem(item, ignoreBounds=True)
+        acquiring = self.worker is not None and self.worker.is_running
+        if not event.raised or not acquiring or event.action == ACTION_WARN:
+            return
+        if event.action == ACTION_STOP:
+            log.warning("Alarm %s: sending safe stop", event.rule)
+            self.handle_method_stop()
+        elif event.action == ACTION_PAUSE and self.worker.pause_event.is_set():
+            log.warning("Alarm %s: pausing the method", event.rule)
+            self.handle_method_pause()
 
-        if eluate_volume >= self.run_volume:
-            self.stop_save_acquisition()
-            # Check if the current step's End Action is "Stop"
-            method_sequence = self.method_editor.get_method_sequence()
-            if method_sequence and method_sequence[-1].get("End Action") == "Stop":
-                self.handle_method_stop()
+    def handle_step_logged(self, record):
+        log.info("Step %d logged from row %d (%.2f ml)", record.number, record.start_row, record.start_volume)
+        if record.start_row:
+            item = step_marker(record.number, record.start_volume)
+            self.step_items.append(item)
+            if not self.acquisition_stopped:
+                self.plot_widget.addItem(item, ignoreBounds=True)
+
+    def handle_peak_event(self, kind, peak):
+        if kind == PEAK_APEX:
+            log.info("Peak %d: apex %.3f AU at %.2f ml", peak.number, peak.apex_y, peak.apex_x)
+            label = pg.TextItem(str(peak.number), color='w', anchor=(0.5, 1.0))
+            label.setPos(peak.apex_x, peak.apex_y)
+            self.peak_items.append(label)
+        elif kind == PEAK_END:
+            log.info("Peak %d: %.2f-%.2f ml, area %.4f AU*ml", peak.number, peak.start_x, peak.end_x, peak.area)
+            region = pg.LinearRegionItem((peak.start_x, peak.end_x), movable=False, brush=pg.mkBrush(255, 255, 255, 25))
+            region.setZValue(-10)
+            self.peak_items.append(region)
+        else:
+            return
+        if not self.acquisition_stopped:
+            self.plot_widget.addItem(self.peak_items[-1], ignoreBounds=True)
 
     def open_run_notes_dialog(self):
         dialog = NotesDialog(self)
@@ -1375,7 +1711,7 @@ class FPLCSystemApp(QMainWindow):
             #self.logger.write_run_notes(self.user_notes, self.notes_timestamp)
             #print("Run notes saved:", self.user_notes)
         else:
-            print("Run notes dialog canceled.")
+            log.info("Run notes dialog canceled.")
 
     def stop_save_acquisition(self):
         if self.acquisition_stopped:
@@ -1385,12 +1721,18 @@ class FPLCSystemApp(QMainWindow):
         if self.worker is not None and self.worker.is_running:
             self.worker.stop()
             self.worker.is_running = False
+        if self.listener is not None:
+            self.listener.sample_buffer.active = False
         if self.thread is not None:
                 self.thread.join()
                 self.thread = None
+        # The worker logged everything it had before exiting; the CSV is complete.
+        # Plot its last batches too, so the saved PNG matches the CSV
+        self.handle_batches(final=True)
+        self.display_queue.clear()
 
         self.show_save_dialog()
-        self.clear_plot_and_reset()
+        self.clear_plot_and_reset()# once, saved or not
         self.run_notes_written = False
         self.method_pause_button.setStyleSheet("")
         self.method_stop_button.setStyleSheet("")
@@ -1400,15 +1742,12 @@ class FPLCSystemApp(QMainWindow):
     def show_save_dialog(self):
         dialog = SaveDialog(self)
         dialog.accepted.connect(self.save_data)
-        dialog.rejected.connect(self.clear_plot_and_reset)
         #dialog.finished.connect(self.enable_buttons)
         dialog.exec()
 
     def save_data(self):
-        self.logger.save_final_csv_and_plot(self.plot_widget, self.RunDateTime)
-        self.clear_data()
-        self.plot_widget.clear()
-        print('Plot cleared and system reset. Ready for next acquisition.')
+        steps = self.worker.steps if self.worker is not None else None
+        self.logger.save_final_csv_and_plot(self.plot_widget, self.RunDateTime, steps)
 
     def clear_plot_and_reset(self):
         self.acquisition_stopped = False
@@ -1419,9 +1758,9 @@ class FPLCSystemApp(QMainWindow):
         if self.plot_widget.plotItem.legend:
             try:
                 self.plot_widget.plotItem.legend.clear()
-                print("Legend cleared successfully.")
+                log.debug("Legend cleared successfully.")
             except Exception as e:
-                print(f"Error clearing legend: {e}")
+                log.warning("Error clearing legend: %s", e)
 
         # Safely clear PumpB axis
         try:
@@ -1430,19 +1769,19 @@ class FPLCSystemApp(QMainWindow):
                     if self.plot_widget.right_axis.scene() is self.plot_widget.scene():
                         self.plot_widget.scene().removeItem(self.plot_widget.right_axis)
                 except Exception as e:
-                    print(f"[DEBUG] removeItem failed: {e}")
+                    log.debug("removeItem failed: %s", e)
 
                 try:
                     right_axis_obj = self.plot_widget.getPlotItem().getAxis('right')
                     if right_axis_obj is not None:
                         self.plot_widget.getPlotItem().hideAxis('right')
                 except Exception as e:
-                    print(f"[DEBUG] axis hide failed: {e}")
+                    log.debug("axis hide failed: %s", e)
 
                 try:
                     self.plot_widget.right_axis.setParentItem(None)
                 except Exception as e:
-                    print(f"[DEBUG] setParentItem(None) failed: {e}")
+                    log.debug("setParentItem(None) failed: %s", e)
 
                 # Optional: disconnect sigResized
                 try:
@@ -1451,9 +1790,9 @@ class FPLCSystemApp(QMainWindow):
                     pass  # Ignore if not connected
 
                 self.plot_widget.right_axis = None
-                print("PumpB axis cleared successfully.")
+                log.debug("PumpB axis cleared successfully.")
         except Exception as e:
-            print(f"Error clearing PumpB axis: {e}")
+            log.warning("Error clearing PumpB axis: %s", e)
        
         self.RunDateTime = None
         self.notes_timestamp = None
@@ -1461,21 +1800,20 @@ class FPLCSystemApp(QMainWindow):
         self.update_plot_title()
         self.metadata_written = False
         self.logger.clear_data()
-        print('Plot cleared and system reset. Ready for next acquisition.')
+        log.info('Plot cleared and system reset. Ready for next acquisition.')
 
     def reset_progress_bar(self):
         self.volume_delivered_progress_bar.setValue(0)
         self.volume_delivered_progress_bar.setFormat("Idle")
 
     def clear_data(self):
-        self.elapsed_time_data.clear()
-        self.eluate_volume_data.clear()
-        self.frac_mark_data.clear()
-        self.chan1_data.clear()
-        self.chan1_AU280_data.clear()
-        self.chan2_data.clear()
-        self.pumpB_percent_data.clear()
-        print('Data cleared. Ready for next acquisition.')
+        self.run_data.clear()
+        self.peak_items.clear()
+        self.alarm_items.clear()
+        self.step_items.clear()
+        self.step_record = None
+        self.alarm_raised_at.clear()
+        log.debug('Run data cleared.')
 
     #def enable_buttons(self):
         #print('Buttons enabled')
@@ -1490,40 +1828,38 @@ class FPLCSystemApp(QMainWindow):
             f"{self.selected_uv_monitor}: {self.selected_AUFS_value: .3f} AUFS"
         )
         self.plot_widget.setTitle(plot_title, size='12pt', color='w')
-        if self.selected_uv_monitor == "Pharmacia UV MII":
-            self.max_y_value = self.selected_AUFS_value
-        elif self.selected_uv_monitor == "Uvcord SII":
+        if self.selected_uv_monitor in uv_monitors.monitor_names():
             self.max_y_value = self.selected_AUFS_value
         self.plot_widget.setYRange(0, self.max_y_value)
 
 
     def open_pause_dialog(self):
         dialog = PauseDialog(self)
-        if self.connection is None or self.connection.fileno() == -1:
-            self.connection = self.server.accept_connection()
-        self.connection.sendall('PAUSE_ADC'.encode('utf-8'))
-        print("PAUSE_ADC sent to client")
+        if self.link.send_command('PAUSE_ADC') is not None:
+            log.info("PAUSE_ADC sent to client")
+        else:
+            log.warning("PAUSE_ADC not sent: client not connected")
         if self.worker is not None:
             self.worker.pause()
 
         if dialog.exec() == QDialog.DialogCode.Accepted:
-            if self.connection is None or self.connection.fileno() == -1:
-                self.connection = self.server.accept_connection()
-            self.connection.sendall('RESUME_ADC'.encode('utf-8'))
-            print("RESUME_ADC sent to client")
+            if self.link.send_command('RESUME_ADC') is not None:
+                log.info("RESUME_ADC sent to client")
+            else:
+                log.warning("RESUME_ADC not sent: client not connected")
             if self.worker is not None:
                 self.worker.resume()
                 self.update_run_button_state("running")
                 
         else:
             self.worker.pause()
-            print("Paused the acquisition")
+            log.info("Paused the acquisition")
 
     def handle_fraction_collector_error(self, error_message):
         self.update_run_button_state("error")
         if self.error_dialog_open:
             return        
-        print(f"Handling error: {error_message}")
+        log.error("Handling error: %s", error_message)
         self.error_dialog_open = True
         self.error_dialog = FractionCollectorErrorDialog(self)
         self.error_dialog.label.setText(error_message)
@@ -1568,9 +1904,9 @@ class FPLCSystemApp(QMainWindow):
             self.pump_error_dialog.accept()        
 
     def handle_fraction_collector_error_cleared(self, message):
-        print(f"Handling error cleared: {message}")
+        log.info("Handling error cleared: %s", message)
         if hasattr(self, 'error_dialog'):
-            print(f"Dialog visible: {self.error_dialog.isVisible()}")
+            log.debug("Dialog visible: %s", self.error_dialog.isVisible())
             self.error_dialog.set_error_cleared()
             self.error_dialog.exit_error_dialog()
         self.restore_run_button_state_after_error()
@@ -1580,16 +1916,82 @@ class FPLCSystemApp(QMainWindow):
         self.handle_method_stop()
 
     def handle_valve_position(self, position):
-        print(f"Valve Position: Valve successfully moved to: {position}")
+        log.info("Valve Position: Valve successfully moved to: %s", position)
         #QMessageBox.information(self, "Valve Position", f"Valve successfully moved to: {position}")
         
 
+    def handle_command_acked(self, name, cmd_id, round_trip_ms):
+        if name == "METHOD_STOP_JSON":
+            log.info("Stop acknowledged by client after %.1f ms", round_trip_ms)
+
+    def handle_command_timeout(self, name, cmd_id):
+        log.warning("%s (CMD_ID %d) was not acknowledged by the client", name, cmd_id)
+        if name == "METHOD_STOP_JSON":
+            QMessageBox.warning(self, "Stop not acknowledged",
+                                "The FPLC client did not acknowledge the stop command.<br>Check the pumps.")
+
+    def handle_link_quality(self, summary):
+        if not self.link.is_connected():
+            return
+        rtt = summary["rtt_avg_ms"]
+        self.connection_status_label.setToolTip(
+            f"Link {summary['state']}, quality {summary['score']:.0f}<br>"
+            f"RTT {rtt if rtt is not None else '-'} ms, jitter {summary['jitter_ms']} ms, "
+            f"loss {summary['loss'] * 100:.0f}%<br>Clock offset {summary['clock_offset_ms']} ms<br>"
+            + "<br>".join(f"{q['name']} queue {q['depth']}/{q['capacity']} (max {q['max_depth']}, dropped {q['dropped']})"
+                          for q in self.pipeline_stats())
+            + self.fraction_control_tooltip()
+            + self.plugin_tooltip()
+        )
+        if summary["state"] == LINK_OK:
+            self.connection_status_label.setText("FPLC connected")
+            self.connection_status_label.setStyleSheet("background-color: green; color: white; border: 1px solid black;")
+        else:
+            self.connection_status_label.setText(f"FPLC link {summary['state']}")
+            self.connection_status_label.setStyleSheet("background-color: orange; color: black; border: 1px solid black;")
+
+    def fraction_control_tooltip(self):
+        if self.fraction_controller is None:
+            return ""
+        report = self.fraction_controller.report()
+        return (f"<br>Fraction changes {report['count']}, late max {report['max_ms'] if report['max_ms'] is not None else '-'} ms "
+                f"(budget {report['budget_ms']:.0f} ms, over {report['over_budget']})")
+
+    def plugin_tooltip(self):
+        return "".join(f"<br>Plugin {r['name']} {r['state']}, over budget {r['overruns']}, dropped {r['samples_dropped']}"
+                       for r in self.plugins.report())
+
+    def handle_link_state(self, state, summary):
+        log.info("%s: link %s (quality %.0f, RTT %s ms)", self.instrument_name, state, summary['score'], summary['rtt_avg_ms'])
+        self.handle_link_quality(summary)
+        acquiring = self.worker is not None and self.worker.is_running
+        if state == LINK_OK:
+            if self.link_paused:
+                # Resume only what the link monitor paused; a user pause stays paused
+                self.link_paused = False
+                if self.link.send_command('RESUME_ADC') is not None:
+                    log.info("RESUME_ADC sent to client: link recovered")
+                if acquiring:
+                    self.worker.resume()
+                    self.update_run_button_state("running")
+            return
+        if not acquiring or self.link_degraded_action == ACTION_WARN:
+            return
+        if self.link_degraded_action == ACTION_STOP:
+            log.warning("Link degraded mid-run: sending safe stop")
+            self.handle_method_stop()
+        elif self.link_degraded_action == ACTION_PAUSE and not self.link_paused and self.worker.pause_event.is_set():
+            log.warning("Link degraded mid-run: pausing acquisition")
+            self.link_paused = True
+            self.link.send_command('PAUSE_ADC')
+            self.worker.pause()
+            self.update_run_button_state("paused")
+
     def handle_disconnection(self):
-        print("Client disconnected. Attempting to reconnect...")
-        if self.listener:
-            self.listener.stop()
-            self.listener = None
+        log.info("Client disconnected. Waiting for reconnection...")
         self.connection = None
+        self.link_paused = False
+        self.connection_status_label.setToolTip("")
         self.connection_status_label.setText("FPLC not connected")
         self.connection_status_label.setStyleSheet("background-color: red; color: white; border: 1px solid black;")
         #self.update_manual_controls()
@@ -1599,6 +2001,12 @@ class FPLCSystemApp(QMainWindow):
 
     def closeEvent(self, event):
         self.is_running = False
+        if self.worker is not None:
+            self.worker.stop()
         if self.thread is not None:
             self.thread.join()
+        self.plugins.stop()
+        self.run_data.clear()# removes the spilled history
+        if self.owns_server:
+            self.server.close()
         event.accept()
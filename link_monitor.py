@@ -0,0 +1,178 @@
+#link_monitor.py ver 0.5.0
+#heartbeat ping/pong timing and a rolling link-quality score for one instrument link
+#
+#Clients that announce "ping": true in HELLO are sent
+#  'PING:{"id": n, "t0": <server send time>}'
+#and answer
+#  'PONG:{"id": n, "t0": ..., "t1": <client receive time>, "t2": <client send time>}'
+#From t0..t3 we get NTP-style round trip and clock offset. Older clients are
+#judged from HEARTBEAT arrival regularity only.
+import json
+import time
+from collections import deque
+
+LINK_OK = "ok"
+LINK_DEGRADED = "degraded"
+LINK_LOST = "lost"
+
+# Actions the GUI can take when the link degrades during a run
+ACTION_WARN = "warn"
+ACTION_PAUSE = "pause"
+ACTION_STOP = "stop"
+
+
+class LinkMonitor:
+    def __init__(self, ping_interval=1.0, pong_timeout=3.0, heartbeat_timeout=10.0,
+                 rtt_good=0.010, rtt_bad=0.250, jitter_good=0.005, jitter_bad=0.100,
+                 degraded_score=60.0, recovered_score=75.0, window=20):
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.rtt_good = rtt_good
+        self.rtt_bad = rtt_bad
+        self.jitter_good = jitter_good
+        self.jitter_bad = jitter_bad
+        self.degraded_score = degraded_score
+        self.recovered_score = recovered_score
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.ping_enabled = False
+        self.rtt = None# seconds, last sample
+        self.rtt_avg = None# EWMA
+        self.jitter = 0.0# EWMA of |rtt change| (or heartbeat period change)
+        self.clock_offset = None# client clock - server clock, seconds
+        self.score = 100.0
+        self.state = LINK_OK
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self._next_ping_id = 1
+        self._next_ping_due = 0.0
+        self._outstanding = {}# ping id -> monotonic send time
+        self._results = deque(maxlen=self.window)# True = answered, False = lost
+        self._last_heartbeat = time.monotonic()
+        self._last_pong = 0.0
+        self._heartbeat_period = None
+
+    # --- inputs ---
+
+    def ping_due(self, now):
+        """
+        Returns a PING message if one should be sent now, else None.
+        """
+        if not self.ping_enabled or now < self._next_ping_due:
+            return None
+        self._next_ping_due = now + self.ping_interval
+        ping_id = self._next_ping_id
+        self._next_ping_id += 1
+        self._outstanding[ping_id] = now
+        self.pings_sent += 1
+        return f'PING:{json.dumps({"id": ping_id, "t0": time.time()})}'
+
+    def on_pong(self, payload):
+        """
+        Handles a PONG payload (dict). Returns the round trip in seconds or None.
+        """
+        t3 = time.time()
+        sent = self._outstanding.pop(payload.get("id"), None)
+        if sent is None:
+            return None# late (already counted lost) or unknown
+        try:
+            t0 = float(payload["t0"])
+            t1 = float(payload.get("t1", t0))
+            t2 = float(payload.get("t2", t1))
+        except (KeyError, TypeError, ValueError):
+            return None
+        rtt = max(0.0, (t3 - t0) - (t2 - t1))
+        offset = ((t1 - t0) + (t2 - t3)) / 2.0
+        self.pongs_received += 1
+        self._last_pong = time.monotonic()
+        self._results.append(True)
+        if self.rtt is not None:
+            self.jitter += (abs(rtt - self.rtt) - self.jitter) / 16.0# RFC 3550 style
+        self.rtt = rtt
+        self.rtt_avg = rtt if self.rtt_avg is None else self.rtt_avg + 0.2 * (rtt - self.rtt_avg)
+        # Offset is most trustworthy from the fastest round trips
+        if self.clock_offset is None or rtt <= self.rtt_avg:
+            self.clock_offset = offset
+        return rtt
+
+    def on_heartbeat(self, now):
+        period = now - self._last_heartbeat
+        self._last_heartbeat = now
+        if not self.ping_enabled:
+            if self._heartbeat_period is not None:
+                self.jitter += (abs(period - self._heartbeat_period) - self.jitter) / 16.0
+                self._heartbeat_period += 0.2 * (period - self._heartbeat_period)
+            else:
+                self._heartbeat_period = period
+
+    def resume(self, now):
+        """
+        The server stopped reading this link for a while (backpressure): pongs and
+        heartbeats it did not read are neither losses nor jitter.
+        """
+        self._last_heartbeat = now
+        self._outstanding.clear()
+        self._heartbeat_period = None
+
+    # --- evaluation ---
+
+    def tick(self, now):
+        """
+        Expires unanswered pings and rescores the link.
+        Returns the new state if it changed, else None.
+        """
+        for ping_id, sent in list(self._outstanding.items()):
+            if now - sent > self.pong_timeout:
+                del self._outstanding[ping_id]
+                self._results.append(False)
+        self.score = self._compute_score(now)
+        new_state = self.state
+        if self._silent_for(now) > self.heartbeat_timeout:
+            new_state = LINK_LOST
+        elif self.state == LINK_OK and self.score < self.degraded_score:
+            new_state = LINK_DEGRADED
+        elif self.state != LINK_OK and self.score >= self.recovered_score:
+            new_state = LINK_OK
+        if new_state != self.state:
+            self.state = new_state
+            return new_state
+        return None
+
+    def _silent_for(self, now):
+        # Time since the client last proved it is alive (heartbeat or pong)
+        return now - max(self._last_heartbeat, self._last_pong)
+
+    def loss_ratio(self):
+        if not self._results:
+            return 0.0
+        return self._results.count(False) / len(self._results)
+
+    def summary(self):
+        to_ms = lambda s: None if s is None else round(s * 1000.0, 2)
+        return {
+            "state": self.state, "score": round(self.score, 1), "rtt_ms": to_ms(self.rtt),
+            "rtt_avg_ms": to_ms(self.rtt_avg), "jitter_ms": to_ms(self.jitter),
+            "clock_offset_ms": to_ms(self.clock_offset), "loss": round(self.loss_ratio(), 3)
+        }
+
+    def _compute_score(self, now):
+        if self._silent_for(now) > self.heartbeat_timeout:
+            return 0.0
+        score = 100.0
+        if self.rtt_avg is not None:
+            score -= 50.0 * _ramp(self.rtt_avg, self.rtt_good, self.rtt_bad)
+        score -= 25.0 * _ramp(self.jitter, self.jitter_good, self.jitter_bad)
+        score -= 25.0 * self.loss_ratio()
+        return max(0.0, score)
+
+
+def _ramp(value, good, bad):
+    # 0 at or below `good`, 1 at or above `bad`
+    if value <= good:
+        return 0.0
+    if value >= bad:
+        return 1.0
+    return (value - good) / (bad - good)
@@ -1,8 +1,21 @@
 #listener.py ver 0.5.0
 from PySide6.QtCore import QObject, Signal
-import threading
-import socket
+import json
 import time
+from fplc_logging import get_logger, ring
+from framing import MessageFramer, LENGTH_MODE
+from acquisition import SampleBuffer
+from messages import (
+    MessageRegistry, parse_text, parse_data_sample, parse_volume_progress, parse_valve_position, parse_command_ack,
+    parse_pong
+)
+from telemetry import (
+    FORMAT_CSV, FORMAT_BINARY, FrameSequenceTracker, choose_format, decode_frame, is_sample_frame
+)
+
+HEARTBEAT_TIMEOUT = 10.0
+
+log = get_logger("listener")
 
 class ReceiveClientSignalsAndData(QObject):
     pumpA_wash_completed_signal = Signal()
@@ -13,111 +26,205 @@ class ReceiveClientSignalsAndData(QObject):
     pumpA_error_cleared_signal = Signal(str)
     pumpB_error_signal = Signal(str)
     pumpB_error_cleared_signal = Signal(str)
-    data_received_signal = Signal(str)
-    disconnected_signal = Signal()
+    samples_ready_signal = Signal()# drain sample_buffer
     stop_save_signal = Signal()
     pumpA_volume_signal = Signal(float)
     gradient_volume_signal = Signal(float)
     valve_error_signal = Signal(str)
     valve_position_signal = Signal(str)
 
-    def __init__(self, connection):
+    def __init__(self, connection=None):
         super().__init__()
         self.connection = connection
+        self.send_message = None# set by FPLCServer.register_instrument
+        self.ack_callback = None# called with each messages.CommandAck
+        self.hello_callback = None# called with the client's HELLO payload
+        self.heartbeat_callback = None# called with the monotonic arrival time of each HEARTBEAT
+        self.pong_callback = None# called with each messages.Pong
+        self.client_info = {}
         self._running = True
         self.last_heartbeat = time.time()
-        self.thread = threading.Thread(target=self.listen, daemon=True)
+        self.heartbeat_timeout = HEARTBEAT_TIMEOUT
+        self._heartbeat_warned = False
+        self.framer = MessageFramer()
+        self.terminates_lines = False# client has sent a newline: never flush its partial lines on idle
+        self.telemetry_format = FORMAT_CSV
+        self.frame_tracker = FrameSequenceTracker()
+        self.sample_buffer = SampleBuffer(self.samples_ready_signal.emit)
+        self.registry = MessageRegistry()
+        self.message_counts = self.registry.counts
+        self._register_builtin_messages()
 
     def start(self):
-        self.thread.start()
+        self._running = True
 
     def stop(self):
         self._running = False
 
-    def listen(self):
-        self.connection.settimeout(1.0)# Prevents blocking indefinitely
-        while self._running:
-            try:
-                data = self.connection.recv(1024)
-                if not data:
-                    print("[Listener] Client disconnected.")
-                    self.disconnected_signal.emit()
-                    break
-
-                message = data.decode('utf-8').strip()
-                print(f"[Listener] Received: {message}")
-
-                if "PUMP_A_WASH_COMPLETED" in message:
-                    self.pumpA_wash_completed_signal.emit()
-                    
-                elif "PUMP_B_WASH_COMPLETED" in message:
-                    self.pumpB_wash_completed_signal.emit()
-
-                elif "Fraction Collector error" in message:
-                    self.fraction_collector_error_signal.emit("Frac-200 error has occurred.<br>Clear the error before continuing....")
-
-                elif "Fraction Collector Error has been cleared" in message:
-                    self.fraction_collector_error_cleared_signal.emit(message)
-
-                elif "PumpA error" in message:
-                    self.pumpA_error_signal.emit("Pump A error has occurred.<br>Clear the error before continuing....")
-
-                elif "PumpA Error has been cleared" in message:
-                    self.pumpA_error_cleared_signal.emit(message)
-                    
-                elif "PumpB error" in message:
-                    self.pumpB_error_signal.emit("Pump B error has occurred.<br>Clear the error before continuing....")
-
-                elif "PumpB Error has been cleared" in message:
-                    self.pumpB_error_cleared_signal.emit(message)    
-
-                elif "STOP_SAVE_ACQUISITION" in message:
-                    self.stop_save_signal.emit()
-                    
-                elif message.startswith("PumpA_running"):
-                    try:
-                        volume = float(message.split()[1])
-                        self.pumpA_volume_signal.emit(volume)
-                        print(f"[Listener] PumpA_running {volume} ml")
-                    except ValueError:
-                        print(f"Invalid PumpA_running message: {message}")
-
-                elif message.startswith("Gradient_running"):
-                    try:
-                        volume = float(message.split()[1])
-                        self.gradient_volume_signal.emit(volume)
-                        print(f"[Listener] Gradient_running {volume} ml")
-                    except ValueError:
-                        print(f"Invalid Gradient_running message: {message}")
-
-                elif message == "Valve Malfunction":
-                    print("Debug: Received Valve Malfunction message")
-                    self.valve_error_signal.emit("Valve failed to reach target position.<br>Run aborted")
-
-                elif message.startswith("VALVE_POSITION:"):       
-                    print(f"Debug: Received VALVE_POSITION message with position: {message.split(':', 1)[1]}")
-                    position = message.split(":", 1)[1]
-                    self.valve_position_signal.emit(position)
-
-                elif "HEARTBEAT" in message:
-                    self.last_heartbeat = time.time()
-                    print("[Listener] Heartbeat received.")
-
-                else:
-                    self.data_received_signal.emit(message)
-
-            except socket.timeout:
-                pass 
-
-            except socket.error as e:
-                print(f"[Listener] Socket error: {e}")
-                self.disconnected_signal.emit()
-                break
-            
-            if time.time() - self.last_heartbeat > 10:
-                print("[Listener] Warning: No heartbeat received in 10 seconds.")
-                
-
-        print("[Listener] Stopped listening.")
-
-
+    def reset(self):
+        """
+        Called by FPLCServer when a new client connects.
+        """
+        self.framer.reset()
+        self.terminates_lines = False
+        self.telemetry_format = FORMAT_CSV
+        self.client_info = {}
+        self.frame_tracker.reset()
+        self.last_heartbeat = time.time()
+        self._heartbeat_warned = False
+
+    def feed(self, data):
+        """
+        Decodes received bytes. Runs on the FPLCServerLoop thread.
+        """
+        if not self._running:
+            return
+        if not self.terminates_lines and b"\n" in data:
+            self.terminates_lines = True
+        # One recv can hold several messages or only part of one
+        try:
+            frames = self.framer.feed(data)
+        except ValueError as e:
+            # Oversized frame: drop it and carry on framing in the same mode
+            self.message_counts["MALFORMED"] += 1
+            log.warning("Discarding %d buffered bytes: %s", self.framer.pending_bytes(), e)
+            self.framer.discard()
+            frames = []
+        for frame in frames:
+            self.handle_frame(frame)
+        self.sample_buffer.end_batch()
+
+    def flush_idle(self):
+        # Link idle: deliver a message sent without a trailing newline. Only for legacy clients
+        # that never send one; from any other client a partial line is just the rest still in flight.
+        if self.terminates_lines:
+            return
+        for frame in self.framer.flush():
+            self.handle_message(frame.decode('utf-8', errors='replace'))
+        self.sample_buffer.end_batch()
+
+    def check_heartbeat(self):
+        if time.time() - self.last_heartbeat > self.heartbeat_timeout:
+            if not self._heartbeat_warned:
+                log.warning("No heartbeat received in %.0f seconds.", self.heartbeat_timeout)
+                self._heartbeat_warned = True
+
+    def _register_builtin_messages(self):
+        # Registration order is also the substring-fallback order of the old if/elif chain
+        register = self.registry.register
+        register("DATA", self.sample_buffer.push_sample, parser=parse_data_sample)
+        register("PUMP_A_WASH_COMPLETED", lambda record: self.pumpA_wash_completed_signal.emit(),
+                 exact="PUMP_A_WASH_COMPLETED", contains="PUMP_A_WASH_COMPLETED")
+        register("PUMP_B_WASH_COMPLETED", lambda record: self.pumpB_wash_completed_signal.emit(),
+                 exact="PUMP_B_WASH_COMPLETED", contains="PUMP_B_WASH_COMPLETED")
+        register("FRAC_ERROR", lambda record: self.fraction_collector_error_signal.emit(
+                     "Frac-200 error has occurred.<br>Clear the error before continuing...."),
+                 prefix="Fraction Collector error", contains="Fraction Collector error")
+        register("FRAC_ERROR_CLEARED", lambda record: self.fraction_collector_error_cleared_signal.emit(record.text),
+                 prefix="Fraction Collector Error has been cleared", contains="Fraction Collector Error has been cleared")
+        register("PUMPA_ERROR", lambda record: self.pumpA_error_signal.emit(
+                     "Pump A error has occurred.<br>Clear the error before continuing...."),
+                 prefix="PumpA error", contains="PumpA error")
+        register("PUMPA_ERROR_CLEARED", lambda record: self.pumpA_error_cleared_signal.emit(record.text),
+                 prefix="PumpA Error has been cleared", contains="PumpA Error has been cleared")
+        register("PUMPB_ERROR", lambda record: self.pumpB_error_signal.emit(
+                     "Pump B error has occurred.<br>Clear the error before continuing...."),
+                 prefix="PumpB error", contains="PumpB error")
+        register("PUMPB_ERROR_CLEARED", lambda record: self.pumpB_error_cleared_signal.emit(record.text),
+                 prefix="PumpB Error has been cleared", contains="PumpB Error has been cleared")
+        register("STOP_SAVE_ACQUISITION", lambda record: self.stop_save_signal.emit(),
+                 exact="STOP_SAVE_ACQUISITION", contains="STOP_SAVE_ACQUISITION")
+        register("PumpA_running", self._on_pumpA_running, parser=parse_volume_progress, prefix="PumpA_running")
+        register("Gradient_running", self._on_gradient_running, parser=parse_volume_progress, prefix="Gradient_running")
+        register("VALVE_MALFUNCTION", self._on_valve_malfunction, exact="Valve Malfunction")
+        register("VALVE_POSITION", self._on_valve_position, parser=parse_valve_position, prefix="VALVE_POSITION:")
+        register("HEARTBEAT", self._on_heartbeat, exact="HEARTBEAT", contains="HEARTBEAT")
+        register("HELLO", self._on_hello, prefix="HELLO:")
+        register("ACK", self._on_ack, parser=parse_command_ack, prefix="ACK:")
+        register("PONG", self._on_pong, parser=parse_pong, prefix="PONG:")
+        self.registry.set_unknown_handler(self._on_unknown_message)
+
+    def register_message(self, tag, handler, parser=parse_text, exact=None, prefix=None, contains=None):
+        """
+        Adds a client message type without touching the built-in table.
+        handler is called on the listener thread with the parsed record.
+        """
+        return self.registry.register(tag, handler, parser=parser, exact=exact, prefix=prefix, contains=contains)
+
+    def handle_frame(self, frame):
+        if self.telemetry_format == FORMAT_BINARY and is_sample_frame(frame):
+            self.handle_sample_frame(frame)
+        else:
+            self.handle_message(frame.decode('utf-8', errors='replace'))
+
+    def handle_sample_frame(self, frame):
+        try:
+            sequence, samples = decode_frame(frame)
+        except ValueError as e:
+            self.message_counts["MALFORMED"] += 1
+            log.warning("Malformed sample frame: %s", e)
+            return
+        ring.trace("listener", "Sample frame %d: %d samples", sequence, len(samples))
+        lost = self.frame_tracker.update(sequence)
+        if lost:
+            log.warning("%d sample frame(s) lost before sequence %d", lost, sequence)
+        self.message_counts["SAMPLE_FRAME"] += 1
+        self.message_counts["DATA"] += len(samples)
+        if len(samples):
+            self.sample_buffer.push_block(samples)
+
+    def handle_message(self, message):
+        ring.trace("listener", "Received: %s", message)
+        self.registry.dispatch(message)
+
+    def _on_pumpA_running(self, record):
+        self.pumpA_volume_signal.emit(record.volume)
+        log.debug("PumpA_running %s ml", record.volume)
+
+    def _on_gradient_running(self, record):
+        self.gradient_volume_signal.emit(record.volume)
+        log.debug("Gradient_running %s ml", record.volume)
+
+    def _on_valve_malfunction(self, record):
+        log.error("Valve Malfunction reported by client")
+        self.valve_error_signal.emit("Valve failed to reach target position.<br>Run aborted")
+
+    def _on_valve_position(self, record):
+        log.info("Valve position: %s", record.position)
+        self.valve_position_signal.emit(record.position)
+
+    def _on_heartbeat(self, record):
+        self.last_heartbeat = time.time()
+        self._heartbeat_warned = False
+        if self.heartbeat_callback is not None:
+            self.heartbeat_callback(time.monotonic())
+        ring.trace("listener", "Heartbeat received")
+
+    def _on_hello(self, record):
+        payload = record.text.split(":", 1)[1]
+        try:
+            self.client_info = json.loads(payload)
+        except ValueError:
+            self.client_info = {}
+        if self.hello_callback is not None and isinstance(self.client_info, dict):
+            self.hello_callback(self.client_info)
+        fmt = choose_format(payload)
+        if self.send_message is None or not self.send_message(f"FORMAT:{fmt}"):
+            log.warning("Could not answer HELLO: no connection")
+            return
+        self.telemetry_format = fmt
+        self.frame_tracker.reset()
+        if fmt == FORMAT_BINARY:
+            self.framer.set_mode(LENGTH_MODE)
+        log.info("Telemetry format negotiated: %s", fmt)
+
+    def _on_ack(self, record):
+        if self.ack_callback is not None:
+            self.ack_callback(record)
+
+    def _on_pong(self, record):
+        if self.pong_callback is not None:
+            self.pong_callback(record)
+
+    def _on_unknown_message(self, record):
+        log.warning("Unhandled message: %s", record.text)
@@ -2,7 +2,17 @@
 from PySide6.QtWidgets import QApplication
 from PySide6.QtGui import QPalette, QColor
 import sys
-from gui import FPLCSystemApp
+import argparse
+from gui import FPLCSystemApp, PLOT_COLUMNS
+from network import FPLCServer
+from link_monitor import ACTION_WARN, ACTION_PAUSE, ACTION_STOP
+from fraction_controller import DEFAULT_DELAY_VOLUME
+from decimation import DecimationConfig, DEFAULT_SCAN_RATE, DECIMATION_FILTERS, FILTER_BOXCAR
+import derived_channels
+import alarm_rules
+import plugins
+from sample_store import DEFAULT_MEMORY_BUDGET
+import fplc_logging
 
 def set_dark_theme(app):
     dark_palette = QPalette()
@@ -21,10 +31,101 @@ def set_dark_theme(app):
     #app.setStyleSheet("QPushButton { border: 1px solid white; color: white; }")
 
 
+def parse_options(argv):
+    """
+    --instruments rigA,rigB=192.168.1.21 runs one window per instrument on a shared server.
+    An optional =host pins an instrument to the client at that IP address.
+    --on-link-degraded warn|pause|stop chooses what a run does when the link quality drops.
+    --log-level sets console verbosity; the ring buffer (--log-ring entries) keeps per-message
+    traces and is written to --log-dump on errors or on SIGUSR1.
+    --capture DIR records every connection's wire traffic for capture.py replay.
+    --frac-delay-volume ML is the tubing volume from the UV flow cell to the fraction
+    collector, used to time tube changes in PEAKS fraction collection.
+    --acquisition-rate HZ asks the client to oversample; the host decimates (--decimation-filter
+    boxcar|cic) to --scan-rate HZ for the run CSV and, optionally, to --display-rate HZ for the plot.
+    --derived-channels A260_A280,dA280_dV logs and plots derived channels; --derived-channel-file
+    FILE adds or overrides definitions from JSON ({name: {"expr", "units", "params"}}).
+    --alarm-rules FILE replaces the default alarm rules (AUFS saturation, missing samples)
+    with a JSON list of rule dicts (see alarm_rules.py).
+    --plugins name,path/to/file.py loads in-run plugins (see plugins.py), each allowed
+    --plugin-budget MS per call before it is demoted.
+    --memory-budget MB caps the live run history kept in RAM; older samples are spilled to
+    disk and plotted as a min/max summary.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--instruments", default="")
+    parser.add_argument("--on-link-degraded", default=ACTION_WARN, choices=[ACTION_WARN, ACTION_PAUSE, ACTION_STOP])
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--log-ring", type=int, default=fplc_logging.DEFAULT_RING_CAPACITY)
+    parser.add_argument("--log-dump", default="fplc_ring_dump.log")
+    parser.add_argument("--capture", default=None)
+    parser.add_argument("--frac-delay-volume", type=float, default=DEFAULT_DELAY_VOLUME)
+    parser.add_argument("--acquisition-rate", type=float, default=None)
+    parser.add_argument("--scan-rate", type=float, default=DEFAULT_SCAN_RATE)
+    parser.add_argument("--display-rate", type=float, default=None)
+    parser.add_argument("--decimation-filter", default=FILTER_BOXCAR, choices=DECIMATION_FILTERS)
+    parser.add_argument("--derived-channels", default="")
+    parser.add_argument("--derived-channel-file", default=None)
+    parser.add_argument("--alarm-rules", default=None)
+    parser.add_argument("--plugins", default="")
+    parser.add_argument("--plugin-budget", type=float, default=plugins.DEFAULT_BUDGET * 1000.0)
+    parser.add_argument("--memory-budget", type=float, default=DEFAULT_MEMORY_BUDGET / (1 << 20))
+    args, remaining = parser.parse_known_args(argv[1:])
+    instruments = []
+    for entry in filter(None, (e.strip() for e in args.instruments.split(","))):
+        name, _, host = entry.partition("=")
+        instruments.append((name, host or None))
+    args.decimation = DecimationConfig(args.acquisition_rate or args.scan_rate, args.scan_rate, args.display_rate,
+                                       args.decimation_filter)
+    try:
+        if args.derived_channel_file:
+            derived_channels.load_channel_file(args.derived_channel_file)
+        args.derived_channels = [name.strip() for name in args.derived_channels.split(",") if name.strip()]
+        derived_channels.DerivedChannels(args.derived_channels)# check the definitions before any run
+    except (OSError, KeyError, ValueError) as e:
+        parser.error(f"derived channels: {e}")
+    try:
+        args.alarm_rules = alarm_rules.load_rule_file(args.alarm_rules) if args.alarm_rules else alarm_rules.DEFAULT_ALARM_RULES
+        alarm_rules.AlarmEngine(args.alarm_rules, [*PLOT_COLUMNS, *args.derived_channels])# check before any run
+    except (OSError, ValueError, AttributeError) as e:
+        parser.error(f"alarm rules: {e}")
+    try:
+        args.plugins = [plugins.load_plugin(spec.strip()) for spec in args.plugins.split(",") if spec.strip()]
+    except ImportError as e:
+        parser.error(f"plugins: {e}")
+    args.plugin_budget /= 1000.0
+    args.memory_budget = int(args.memory_budget * (1 << 20))
+    fplc_logging.configure(console_level=args.log_level, ring_capacity=args.log_ring, dump_path=args.log_dump)
+    return instruments, args, argv[:1] + remaining
+
+
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    instruments, options, qt_argv = parse_options(sys.argv)
+    fplc_logging.install_dump_signal()
+    app = QApplication(qt_argv)
     set_dark_theme(app)
-    window = FPLCSystemApp()
-    window.setWindowTitle("RPI5_LC_controller")
-    window.show()
+    if not instruments:
+        window = FPLCSystemApp(link_degraded_action=options.on_link_degraded, capture_dir=options.capture,
+                               frac_delay_volume=options.frac_delay_volume, decimation=options.decimation,
+                               derived_channels=options.derived_channels, alarm_rules=options.alarm_rules,
+                               plugins=options.plugins, plugin_budget=options.plugin_budget,
+                               memory_budget=options.memory_budget)
+        window.setWindowTitle("RPI5_LC_controller")
+        window.show()
+        windows = [window]
+    else:
+        server = FPLCServer(capture_dir=options.capture)
+        windows = []
+        for name, host in instruments:
+            window = FPLCSystemApp(server=server, instrument_name=name, instrument_host=host,
+                                   link_degraded_action=options.on_link_degraded,
+                                   frac_delay_volume=options.frac_delay_volume, decimation=options.decimation,
+                                   derived_channels=options.derived_channels, alarm_rules=options.alarm_rules,
+                                   plugins=options.plugins, plugin_budget=options.plugin_budget,
+                                   memory_budget=options.memory_budget)
+            window.setWindowTitle(f"RPI5_LC_controller - {name}")
+            window.show()
+            windows.append(window)
+        server.start_server()
+        app.aboutToQuit.connect(server.close)
     sys.exit(app.exec())
@@ -0,0 +1,213 @@
+#messages.py ver 0.5.0
+#typed client messages and the tag-keyed dispatch registry used by listener.py
+import json
+from collections import Counter
+from dataclasses import dataclass
+from fplc_logging import get_logger
+
+DATA_TAG = "DATA"
+UNKNOWN_TAG = "UNKNOWN"
+MALFORMED_TAG = "MALFORMED"
+
+_DATA_START_CHARS = frozenset("0123456789-+.")
+_TOKEN_SEPARATORS = (" ", ":")
+
+log = get_logger("listener")
+
+
+@dataclass(slots=True)
+class TextMessage:
+    tag: str
+    text: str
+
+
+@dataclass(slots=True)
+class DataSample:
+    tag: str
+    chan1_counts: int
+    chan2_counts: int
+    elapsed_time: float
+    eluate_volume: float
+    frac_mark: float
+    pumpB_percent: float
+
+
+@dataclass(slots=True)
+class VolumeProgress:
+    tag: str
+    volume: float
+
+
+@dataclass(slots=True)
+class ValvePosition:
+    tag: str
+    position: str
+
+
+@dataclass(slots=True)
+class CommandAck:
+    tag: str
+    ref: object# command ID (int) or command name (str)
+
+
+@dataclass(slots=True)
+class Pong:
+    tag: str
+    payload: dict# id, t0 (echoed), t1 (client receive), t2 (client send)
+
+
+def parse_text(tag, message):
+    return TextMessage(tag, message)
+
+
+def parse_data_sample(tag, message):
+    """
+    Parses 'v1,v2,elapsed,volume,frac,pumpB' into a DataSample.
+    Raises ValueError on a malformed line.
+    """
+    values = message.split(',')
+    if len(values) != 6:
+        raise ValueError(f"expected 6 fields, got {len(values)}")
+    return DataSample(
+        tag,
+        int(values[0]),
+        int(values[1]),
+        float(values[2]),
+        float(values[3]),
+        float(values[4]),
+        float(values[5]),
+    )
+
+
+def parse_volume_progress(tag, message):
+    # 'PumpA_running 1.25' / 'Gradient_running 1.25'
+    return VolumeProgress(tag, float(message.split()[1]))
+
+
+def parse_valve_position(tag, message):
+    # 'VALVE_POSITION:INJECT'
+    return ValvePosition(tag, message.split(":", 1)[1])
+
+
+def parse_command_ack(tag, message):
+    # 'ACK:12' / 'ACK:{"CMD_ID": 12}' / 'ACK:PAUSE_ADC'
+    ref = message.split(":", 1)[1].strip()
+    if ref.isdigit():
+        return CommandAck(tag, int(ref))
+    if ref.startswith("{"):
+        try:
+            return CommandAck(tag, int(json.loads(ref)["CMD_ID"]))
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"no CMD_ID in ack: {e}")
+    return CommandAck(tag, ref)
+
+
+def parse_pong(tag, message):
+    # 'PONG:{"id": 3, "t0": ..., "t1": ..., "t2": ...}'
+    payload = json.loads(message.split(":", 1)[1])
+    if not isinstance(payload, dict) or "id" not in payload:
+        raise ValueError("PONG without id")
+    return Pong(tag, payload)
+
+
+def _leading_token(message):
+    end = len(message)
+    for sep in _TOKEN_SEPARATORS:
+        idx = message.find(sep, 0, end)
+        if idx != -1:
+            end = idx
+    return message[:end]
+
+
+class _Entry:
+    __slots__ = ("tag", "handler", "parser", "prefix")
+
+    def __init__(self, tag, handler, parser, prefix):
+        self.tag = tag
+        self.handler = handler
+        self.parser = parser
+        self.prefix = prefix
+
+
+class MessageRegistry:
+    """
+    Maps client messages to a tag, a parser and a handler.
+
+    Lookup order:
+      1. sample lines (start with a digit or sign) -> DATA, no string tests
+      2. exact message text                          -> dict lookup
+      3. leading token (text before ' ' or ':')      -> dict lookup, then startswith()
+      4. legacy substring patterns                   -> only for unmatched messages
+    Each message is parsed once into a typed record and passed to its handler.
+    Per-tag counts are kept in `counts`.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._by_token = {}
+        self._contains = []
+        self._data_entry = None
+        self._unknown_handler = None
+        self.counts = Counter()
+
+    def register(self, tag, handler, parser=parse_text, exact=None, prefix=None, contains=None):
+        """
+        Registers a message type.
+        exact: full message text; prefix: text the message starts with;
+        contains: substring fallback for messages with surrounding text.
+        """
+        entry = _Entry(tag, handler, parser, prefix)
+        if tag == DATA_TAG:
+            self._data_entry = entry
+        if exact is not None:
+            self._exact[exact] = entry
+        if prefix is not None:
+            token = _leading_token(prefix)
+            candidates = self._by_token.setdefault(token, [])
+            candidates.append(entry)
+            # longest prefix wins when two share a leading token
+            candidates.sort(key=lambda e: len(e.prefix), reverse=True)
+        if contains is not None:
+            self._contains.append((contains, entry))
+        return entry
+
+    def set_unknown_handler(self, handler):
+        self._unknown_handler = handler
+
+    def lookup(self, message):
+        if not message:
+            return None
+        if message[0] in _DATA_START_CHARS and self._data_entry is not None:
+            return self._data_entry
+        entry = self._exact.get(message)
+        if entry is not None:
+            return entry
+        candidates = self._by_token.get(_leading_token(message))
+        if candidates:
+            for entry in candidates:
+                if message.startswith(entry.prefix):
+                    return entry
+        for pattern, entry in self._contains:
+            if pattern in message:
+                return entry
+        return None
+
+    def dispatch(self, message):
+        """
+        Parses and handles one message. Returns the tag it was counted under.
+        """
+        entry = self.lookup(message)
+        if entry is None:
+            self.counts[UNKNOWN_TAG] += 1
+            if self._unknown_handler is not None:
+                self._unknown_handler(TextMessage(UNKNOWN_TAG, message))
+            return UNKNOWN_TAG
+        try:
+            record = entry.parser(entry.tag, message)
+        except (ValueError, IndexError) as e:
+            self.counts[MALFORMED_TAG] += 1
+            log.warning("Malformed %s message (%s): %s", entry.tag, e, message)
+            return MALFORMED_TAG
+        self.counts[entry.tag] += 1
+        entry.handler(record)
+        return entry.tag
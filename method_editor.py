@@ -9,6 +9,7 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QPalette, QColor, QBrush
 from pathlib import Path
+import uv_monitors
 
 
 DEFAULT_METHOD_DIR = Path("/home/sybednar/FPLC_controller_venv/FPLC_Method_Scripts")
@@ -16,14 +17,14 @@ DEFAULT_METHOD_DIR.mkdir(parents=True, exist_ok=True)
 
 
 class UVMonitorSettingsDialog(QDialog):
-    def __init__(self, parent=None, current_uv_monitor="Pharmacia UV MII", current_aufs=0.1):
+    def __init__(self, parent=None, current_uv_monitor=uv_monitors.DEFAULT_MONITOR, current_aufs=0.1):
         super().__init__(parent)
         self.setWindowTitle("UV Monitor Settings")
         self.setMinimumWidth(300)
         layout = QVBoxLayout()
 
         self.uv_monitor_combo = QComboBox()
-        self.uv_monitor_combo.addItems(["Pharmacia UV MII", "Uvcord SII"])
+        self.uv_monitor_combo.addItems(uv_monitors.monitor_names())
         self.uv_monitor_combo.setCurrentText(current_uv_monitor)
         layout.addWidget(QLabel("UV Monitor Type:"))
         layout.addWidget(self.uv_monitor_combo)
@@ -43,13 +44,9 @@ class UVMonitorSettingsDialog(QDialog):
         self.setLayout(layout)
 
     def update_aufs_items(self, current_aufs=None):
-        uv_type = self.uv_monitor_combo.currentText()
+        driver = uv_monitors.get_driver(self.uv_monitor_combo.currentText())
         self.aufs_combo.clear()
-        if uv_type == "Uvcord SII":
-            values = ["2.000", "1.000", "0.500", "0.200", "0.100", "0.050", "0.020", "0.010", "0.005"]
-        else:
-            values = ["2.000", "1.000", "0.500", "0.200", "0.100", "0.050", "0.020", "0.010", "0.005", "0.002", "0.001"]
-        self.aufs_combo.addItems(values)
+        self.aufs_combo.addItems([f"{aufs:.3f}" for aufs in driver.aufs_ranges])
 
         if current_aufs is not None:
             formatted = f"{float(current_aufs):.3f}"
@@ -267,7 +264,7 @@ class MethodEditor(QWidget):
         pumpB_max_spin.setValue(100.0)
 
         frac_combo = QComboBox()
-        frac_combo.addItems(["ON", "OFF"])
+        frac_combo.addItems(["ON", "PEAKS", "OFF"])# PEAKS: collect only detected peaks
 
         monitor_combo = QComboBox()
         monitor_combo.addItems(["UV_ON", "UV_OFF"])
@@ -292,7 +289,7 @@ class MethodEditor(QWidget):
                 monitor_settings_btn.setStyleSheet("color: gray; background-color: #2e2e2e;")
                 monitor_settings_label.setStyleSheet("color: gray;")
         # --- UV Monitor settings ---
-        uv_monitor_type = "Pharmacia UV MII"
+        uv_monitor_type = uv_monitors.DEFAULT_MONITOR
         aufs_value = 0.1
 
         def open_uv_monitor_settings():
@@ -307,7 +304,7 @@ class MethodEditor(QWidget):
                 if self.main_app:
                     self.main_app.selected_uv_monitor = uv_monitor_type
                     self.main_app.selected_AUFS_value = aufs_value
-                    self.main_app.uv_monitor_FS_value = 0.1 if uv_monitor_type == "Pharmacia UV MII" else 1.0
+                    self.main_app.uv_monitor_FS_value = uv_monitors.get_driver(uv_monitor_type).recorder_full_scale
 
         monitor_combo.currentTextChanged.connect(lambda text: open_uv_monitor_settings() if text == "UV_ON" else None)
         monitor_combo.currentTextChanged.connect(update_monitor_settings_button_state)
@@ -366,7 +363,7 @@ class MethodEditor(QWidget):
             monitor_combo.setCurrentText(step.get("Monitor", "UV_OFF"))
             divert_combo.setCurrentText(step["Diverter"])
             end_action_combo.setCurrentText(step["End Action"])
-            uv_monitor_type = step.get("UV Monitor Type", "Pharmacia UV MII")
+            uv_monitor_type = step.get("UV Monitor Type", uv_monitors.DEFAULT_MONITOR)
             aufs_value = step.get("AUFS", 0.1)
         else:
             if hasattr(self.main_app, "saved_flowrate"):
@@ -606,7 +603,7 @@ class MethodEditor(QWidget):
             if "metadata" in method_data:
                 metadata = method_data["metadata"]
                 self.main_app.selected_column_type = metadata.get("ColumnType", "Superdex-200")
-                self.main_app.selected_uv_monitor = metadata.get("UVMonitor", "Pharmacia UV MII")
+                self.main_app.selected_uv_monitor = metadata.get("UVMonitor", uv_monitors.DEFAULT_MONITOR)
                 self.main_app.selected_AUFS_value = metadata.get("AUFS", 0.1)
                 self.main_app.update_plot_title()
 
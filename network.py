@@ -1,37 +1,536 @@
 #network.py ver 0.5.0
+#single-threaded selector loop: accept, read, write and heartbeat checks for one or more FPLC clients
+import json
+import logging
+import os
+import selectors
 import socket
 import threading
+import time
+from collections import deque
+from PySide6.QtCore import QObject, Signal
+from capture import CaptureWriter, KIND_CONNECT, KIND_DISCONNECT
+from commands import CommandQueue
+from fplc_logging import get_logger
+from link_monitor import LinkMonitor, LINK_OK
 
-class FPLCServer:
-    def __init__(self, host='0.0.0.0', port=5000):
+RECV_BUFFER_SIZE = 65536
+LOOP_TICK = 0.25# seconds between housekeeping passes (heartbeat, idle flush)
+IDLE_FLUSH_AFTER = 1.0# deliver an unterminated line after this long without data (clients that never send newlines)
+IDENTIFY_TIMEOUT = 2.0# bind an anonymous client to a free instrument after this long
+QUALITY_REPORT_INTERVAL = 1.0# seconds between link_quality_signal emits
+MAX_IDENTIFY_BYTES = 4096
+DEFAULT_INSTRUMENT = "FPLC"
+
+log = get_logger("net")
+
+
+class InstrumentLink(QObject):
+    """
+    One named instrument as seen by the server: its listener, its current client
+    socket (if any) and its outbound queue. The GUI for an instrument only talks
+    to its link, so several instruments never share send queues or state.
+    """
+    connected_signal = Signal(str)# peer address
+    disconnected_signal = Signal()
+    command_acked_signal = Signal(str, int, float)# name, CMD_ID, round trip (ms)
+    command_timeout_signal = Signal(str, int)# name, CMD_ID
+    link_quality_signal = Signal(object)# LinkMonitor.summary() dict
+    link_state_signal = Signal(str, object)# new state ("ok"/"degraded"/"lost"), summary
+
+    def __init__(self, server, name, listener, host=None):
+        super().__init__()
+        self.server = server
+        self.name = name
+        self.listener = listener
+        self.host = host# optional client IP that identifies this instrument
+        self.connection = None
+        self.peer = None
+        self.last_rx = 0.0
+        self._outbox = deque()
+        self._outbox_offset = 0# bytes of _outbox[0] already written
+        self._outbox_lock = threading.Lock()
+        self.capture = None# capture.CaptureWriter while the server records traffic
+        self.read_paused = False# socket not read while the acquisition stage is over capacity
+        self._events = 0# selector events currently registered for the connection
+        self.commands = CommandQueue()
+        self.monitor = LinkMonitor(heartbeat_timeout=listener.heartbeat_timeout)
+        self._next_quality_report = 0.0
+        listener.send_message = self.send
+        listener.ack_callback = self._on_ack
+        listener.hello_callback = self._on_hello
+        listener.heartbeat_callback = self.monitor.on_heartbeat
+        listener.pong_callback = self._on_pong
+
+    def is_connected(self):
+        return self.connection is not None
+
+    def send(self, message):
+        """
+        Queues a message for this instrument. Returns False if it is not connected.
+        """
+        if self.connection is None:
+            return False
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        with self._outbox_lock:
+            self._outbox.append(message)
+        self.server._wake()
+        return True
+
+    def send_command(self, name, payload=None, timeout=None):
+        """
+        Queues a command that expects a client ACK. JSON payloads get a CMD_ID;
+        returns the commands.Command, or None if the instrument is not connected.
+        """
+        if self.connection is None:
+            return None
+        command = self.commands.submit(name, payload, timeout)
+        self.server._wake()
+        return command
+
+    def latency_report(self):
+        return self.commands.latency_report()
+
+    def link_report(self):
+        return self.monitor.summary()
+
+    def _on_ack(self, record):
+        # FPLCServerLoop thread
+        command = self.commands.acknowledge(record.ref)
+        if command is not None:
+            self.command_acked_signal.emit(command.name, command.cmd_id, command.round_trip() * 1000.0)
+
+    def _on_hello(self, info):
+        if info.get("acks"):
+            self.commands.client_acks = True
+        if info.get("ping"):
+            self.monitor.ping_enabled = True
+
+    def _on_pong(self, record):
+        self.monitor.on_pong(record.payload)
+
+
+class FPLCServer(QObject):
+    """
+    Owns the listening socket and every client connection.
+
+    All socket I/O runs on one "FPLCServerLoop" thread driven by a selector, so
+    accepting a new client never waits behind a sleep or a blocked send, and a
+    busy instrument cannot stall another. Each client is bound to a registered
+    instrument (by HELLO name, configured host address, or the first free one);
+    its bytes are fed to that instrument's listener on the loop thread.
+    InstrumentLink.send() only queues bytes and wakes the loop, so it is safe
+    and non-blocking from the GUI. Connection changes are reported through
+    the link's signals (queued to the GUI thread).
+    """
+
+    def __init__(self, host='0.0.0.0', port=5000, backlog=16, capture_dir=None):
+        super().__init__()
         self.host = host
         self.port = port
+        self.backlog = backlog
+        self.capture_dir = os.path.abspath(capture_dir) if capture_dir else None# record each connection's traffic here (see capture.py)
         self.sock = None
-        self.connection = None
+        self.links = {}
+        self._link_by_conn = {}
+        self._pending = {}# unidentified connection -> [peer, accept time, bytearray]
+        self._links_lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self._recv_buffer = bytearray(RECV_BUFFER_SIZE)
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._running = False
+        self.thread = threading.Thread(target=self.serve_forever, name="FPLCServerLoop", daemon=True)
+
+    def register_instrument(self, name, listener, host=None):
+        """
+        Adds a named instrument and returns its InstrumentLink.
+        """
+        link = InstrumentLink(self, name, listener, host)
+        listener.sample_buffer.space_callback = self._wake# resume a paused reader once drained
+        with self._links_lock:
+            self.links[name] = link
+        return link
 
     def start_server(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.bind((self.host, self.port))
-        self.sock.listen(1)
-        print("Server listening...")
-        
-
-    def accept_connection(self):
-        self.connection, addr = self.sock.accept()
-        print(f"Connected to {addr}")
-        return self.connection
+        self.sock.listen(self.backlog)
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ, self._on_accept)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, self._on_wakeup)
+        self._running = True
+        self.thread.start()
+        log.info("Server listening on %s:%d", self.host, self.port)
 
-    def send(self, message):
-        if self.connection:
-            self.connection.sendall(message.encode('utf-8'))
+    def connected_instruments(self):
+        return [link.name for link in self._link_list() if link.is_connected()]
 
-    def receive(self):
-        if self.connection:
-            return self.connection.recv(1024).decode('utf-8')
+    def _link_list(self):
+        # Windows register instruments from the GUI thread while the loop reads them: iterate over a copy
+        with self._links_lock:
+            return list(self.links.values())
 
     def close(self):
-        if self.connection:
-            self.connection.close()
+        self._running = False
+        self._wake()
+        if self.thread.is_alive() and threading.current_thread() is not self.thread:
+            self.thread.join(timeout=2.0)
+        for link in self._link_list():
+            if link.connection:
+                link.connection.close()
+                link.connection = None
+            self._stop_capture(link)
+        for connection in list(self._pending):
+            connection.close()
         if self.sock:
             self.sock.close()
+
+    def serve_forever(self):
+        while self._running:
+            for key, mask in self.selector.select(timeout=LOOP_TICK):
+                try:
+                    key.data(key.fileobj, mask)
+                except Exception:
+                    # One bad client or handler must not take the loop (and every instrument) down
+                    self._drop_failed(key.fileobj)
+            self._housekeeping(time.monotonic())
+        self.selector.close()
+
+    # --- loop callbacks (FPLCServerLoop thread only) ---
+
+    def _on_accept(self, sock, mask):
+        try:
+            connection, addr = sock.accept()
+        except BlockingIOError:
+            return
+        connection.setblocking(False)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        peer = f"{addr[0]}:{addr[1]}"
+        log.info("Connected to %s", peer)
+        link = self._link_for_host(addr[0])
+        if link is None:
+            links = self._link_list()
+            if len(links) == 1:
+                link = links[0]# single instrument: nothing to identify
+        if link is not None:
+            self._bind(connection, peer, link, b"")
+            return
+        # Wait for the first message (HELLO may name the instrument)
+        self._pending[connection] = [peer, time.monotonic(), bytearray()]
+        self.selector.register(connection, selectors.EVENT_READ, self._on_pending_io)
+
+    def _on_pending_io(self, connection, mask):
+        peer, _accepted, data = self._pending[connection]
+        try:
+            nbytes = connection.recv_into(self._recv_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            nbytes = 0
+        if not nbytes:
+            log.info("Client %s left before identifying.", peer)
+            self._discard_pending(connection)
+            return
+        data += memoryview(self._recv_buffer)[:nbytes]
+        end = data.find(b"\n")
+        if end == -1 and len(data) < MAX_IDENTIFY_BYTES:
+            return
+        name = self._hello_name(bytes(data[:end]) if end != -1 else b"")
+        self._bind_pending(connection, name)
+
+    def _bind_pending(self, connection, name):
+        peer, _accepted, data = self._pending[connection]
+        with self._links_lock:
+            link = self.links.get(name) if name else None
+        if link is None:
+            link = self._first_free_link() or self._link_for_reconnect(peer)
+        if link is None:
+            log.warning("No free instrument for client %s; closing.", peer)
+            self._discard_pending(connection)
+            return
+        del self._pending[connection]
+        self.selector.unregister(connection)
+        self._bind(connection, peer, link, bytes(data))
+
+    def _bind(self, connection, peer, link, initial_data):
+        if link.connection is not None:
+            # A client reconnecting before its old socket timed out replaces it
+            log.info("%s: new client %s replaces %s", link.name, peer, link.peer)
+            self._drop_link(link, notify=True)
+        with link._outbox_lock:
+            link._outbox.clear()
+            link._outbox_offset = 0
+        link.commands.clear()
+        link.commands.client_acks = False
+        link.monitor.reset()
+        link.connection = connection
+        link.peer = peer
+        link.last_rx = time.monotonic()
+        self._link_by_conn[connection] = link
+        link.listener.reset()
+        link.read_paused = False
+        link._events = 0
+        self._set_events(link, selectors.EVENT_READ)
+        log.info("Client %s bound to instrument %s", peer, link.name)
+        self._start_capture(link, peer)
+        link.connected_signal.emit(peer)
+        if initial_data:
+            if link.capture is not None:
+                link.capture.inbound(initial_data)
+            self._feed(link, initial_data)
+
+    def _on_client_io(self, connection, mask):
+        link = self._link_by_conn.get(connection)
+        if link is None:
+            return
+        if mask & selectors.EVENT_READ:
+            try:
+                nbytes = connection.recv_into(self._recv_buffer)
+            except (BlockingIOError, InterruptedError):
+                nbytes = None
+            except OSError as e:
+                log.warning("%s: socket error: %s", link.name, e)
+                self._drop_link(link, notify=True)
+                return
+            if nbytes == 0:
+                log.info("%s: client disconnected.", link.name)
+                self._drop_link(link, notify=True)
+                return
+            if nbytes:
+                link.last_rx = time.monotonic()
+                data = memoryview(self._recv_buffer)[:nbytes]
+                if link.capture is not None:
+                    link.capture.inbound(data)
+                if not self._feed(link, data):
+                    return
+                if link.listener.sample_buffer.over_capacity():
+                    self._pause_reading(link)
+        if mask & selectors.EVENT_WRITE and link.connection is connection:
+            self._flush_outbox(link)
+
+    def _on_wakeup(self, sock, mask):
+        try:
+            while sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        for link in list(self._link_by_conn.values()):
+            self._resume_reading_if_drained(link)
+            self._flush_outbox(link)
+
+    def _flush_outbox(self, link):
+        connection = link.connection
+        if connection is None:
+            return
+        with link._outbox_lock:
+            for command in link.commands.take_outgoing():
+                link._outbox.append(command.message)
+            while link._outbox:
+                data = link._outbox[0]
+                offset = link._outbox_offset
+                try:
+                    sent = connection.send(memoryview(data)[offset:] if offset else data)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError as e:
+                    log.warning("%s: send failed: %s", link.name, e)
+                    link._outbox.clear()
+                    link._outbox_offset = 0
+                    break
+                if offset + sent < len(data):
+                    link._outbox_offset = offset + sent
+                    break
+                link._outbox.popleft()
+                link._outbox_offset = 0
+                if link.capture is not None:
+                    link.capture.outbound(data)
+            pending = bool(link._outbox)
+        if link.connection is not connection:
+            return
+        self._set_events(link, (0 if link.read_paused else selectors.EVENT_READ) |
+                         (selectors.EVENT_WRITE if pending else 0))
+
+    def _set_events(self, link, events):
+        # The selector cannot hold a socket with no events: unregister while fully idle
+        if events == link._events:
+            return
+        if not link._events:
+            self.selector.register(link.connection, events, self._on_client_io)
+        elif not events:
+            self.selector.unregister(link.connection)
+        else:
+            self.selector.modify(link.connection, events, self._on_client_io)
+        link._events = events
+
+    def _pause_reading(self, link):
+        if link.read_paused:
+            return
+        link.read_paused = True
+        log.warning("%s: acquisition queue full (%d samples); pausing reads", link.name,
+                    link.listener.sample_buffer.depth())
+        self._set_events(link, link._events & ~selectors.EVENT_READ)
+
+    def _resume_reading_if_drained(self, link):
+        if link.read_paused and not link.listener.sample_buffer.over_capacity():
+            link.read_paused = False
+            link.last_rx = time.monotonic()
+            link.monitor.resume(link.last_rx)
+            log.info("%s: acquisition queue drained; resuming reads", link.name)
+            self._set_events(link, link._events | selectors.EVENT_READ)
+
+    def _housekeeping(self, now):
+        for connection, (peer, accepted, data) in list(self._pending.items()):
+            if now - accepted >= IDENTIFY_TIMEOUT:
+                try:
+                    self._bind_pending(connection, None)
+                except Exception:
+                    self._drop_failed(connection)
+        for connection, link in list(self._link_by_conn.items()):
+            try:
+                self._check_link(link, now)
+            except Exception:
+                self._drop_failed(connection)
+
+    def _check_link(self, link, now):
+        self._resume_reading_if_drained(link)
+        if link.read_paused:
+            return# backpressure, not silence: skip idle and heartbeat checks
+        if now - link.last_rx >= IDLE_FLUSH_AFTER:
+            link.listener.flush_idle()
+        link.listener.check_heartbeat()
+        for command in link.commands.expire(now):
+            link.command_timeout_signal.emit(command.name, command.cmd_id)
+        self._check_link_quality(link, now)
+        if link.capture is not None:
+            link.capture.flush()
+
+    def _feed(self, link, data):
+        # Listener and message handlers run here: a failure closes this link only
+        try:
+            link.listener.feed(data)
+            return True
+        except Exception:
+            log.exception("%s: error handling client data; closing the connection", link.name)
+            self._drop_link(link, notify=True)
+            return False
+
+    def _drop_failed(self, connection):
+        # Called from an except block: log it and close whatever connection it came from
+        link = self._link_by_conn.get(connection)
+        if link is not None:
+            log.exception("%s: error on the server loop; closing the connection", link.name)
+            self._drop_link(link, notify=True)
+        elif connection in self._pending:
+            log.exception("Error on the server loop; closing unidentified client %s", self._pending[connection][0])
+            self._discard_pending(connection)
+        else:
+            log.exception("Error on the server loop")
+
+    def _check_link_quality(self, link, now):
+        ping = link.monitor.ping_due(now)
+        if ping is not None:
+            with link._outbox_lock:
+                link._outbox.append(ping.encode('utf-8'))
+            self._flush_outbox(link)# stamp t0 as close to the wire as possible
+        new_state = link.monitor.tick(now)
+        if new_state is not None:
+            summary = link.monitor.summary()
+            log.log(logging.INFO if new_state == LINK_OK else logging.WARNING,
+                    "%s: link %s %s", link.name, new_state, summary)
+            link.link_state_signal.emit(new_state, summary)
+        if now >= link._next_quality_report:
+            link._next_quality_report = now + QUALITY_REPORT_INTERVAL
+            link.link_quality_signal.emit(link.monitor.summary())
+
+    def _drop_link(self, link, notify):
+        connection = link.connection
+        if connection is None:
+            return
+        link.connection = None
+        link.peer = None
+        self._link_by_conn.pop(connection, None)
+        if link._events:
+            try:
+                self.selector.unregister(connection)
+            except (KeyError, ValueError):
+                pass
+        link._events = 0
+        link.read_paused = False
+        connection.close()
+        with link._outbox_lock:
+            link._outbox.clear()
+            link._outbox_offset = 0
+        link.commands.clear()
+        self._stop_capture(link)
+        if notify:
+            link.disconnected_signal.emit()
+
+    def _start_capture(self, link, peer):
+        if not self.capture_dir:
+            return
+        os.makedirs(self.capture_dir, exist_ok=True)
+        path = os.path.join(self.capture_dir, f"{link.name}_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}.fcap")
+        try:
+            link.capture = CaptureWriter(path, {"instrument": link.name, "peer": peer})
+        except OSError as e:
+            log.warning("%s: cannot capture to %s: %s", link.name, path, e)
+            return
+        link.capture.record(KIND_CONNECT, peer.encode('utf-8'))
+        log.info("%s: capturing traffic to %s", link.name, path)
+
+    def _stop_capture(self, link):
+        if link.capture is not None:
+            link.capture.record(KIND_DISCONNECT)
+            link.capture.close()
+            link.capture = None
+
+    def _discard_pending(self, connection):
+        self._pending.pop(connection, None)
+        try:
+            self.selector.unregister(connection)
+        except (KeyError, ValueError):
+            pass
+        connection.close()
+
+    def _link_for_host(self, ip):
+        for link in self._link_list():
+            if link.host == ip:
+                return link
+        return None
+
+    def _link_for_reconnect(self, peer):
+        # Every instrument is busy: treat a client from the same host (or the
+        # only instrument) as a reconnect whose old socket has not timed out yet
+        ip = peer.rsplit(":", 1)[0]
+        links = self._link_list()
+        for link in links:
+            if link.peer and link.peer.rsplit(":", 1)[0] == ip:
+                return link
+        if len(links) == 1:
+            return links[0]
+        return None
+
+    def _first_free_link(self):
+        for link in self._link_list():
+            if not link.is_connected():
+                return link
+        return None
+
+    @staticmethod
+    def _hello_name(first_line):
+        if not first_line.startswith(b"HELLO:"):
+            return None
+        try:
+            return json.loads(first_line[6:].decode('utf-8')).get("name")
+        except (ValueError, AttributeError):
+            return None
+
+    def _wake(self):
+        try:
+            self._wakeup_send.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass# loop is already awake or shutting down
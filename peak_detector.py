@@ -0,0 +1,140 @@
+#peak_detector.py ver 0.5.0
+#incremental peak detection on the live AU280 trace (start, apex and end as they happen)
+from collections import deque
+from dataclasses import dataclass, replace
+
+PEAK_START = "start"
+PEAK_APEX = "apex"
+PEAK_END = "end"
+
+
+@dataclass(slots=True)
+class Peak:
+    number: int
+    start_x: float
+    start_y: float
+    apex_x: float
+    apex_y: float
+    end_x: float = None
+    end_y: float = None
+    area: float = None# above the straight line from start to end (AU*ml when x is volume)
+
+    @property
+    def height(self):
+        return self.apex_y - self.start_y
+
+
+class StreamingPeakDetector:
+    """
+    Hysteresis peak detector, O(1) amortised per sample.
+
+    A peak starts when the signal rises `threshold` above its minimum over the last
+    `baseline_window` samples; the start is placed at the last sample that was within
+    threshold / 2 of that minimum, i.e. where the rise began. The apex is
+    reported once the signal has fallen `threshold` below it, and the peak ends when
+    the signal drops back to within max(threshold / 2, end_fraction * height) of its
+    start level, or at a valley once the signal rises `threshold` out of it again
+    (overlapping peaks: the next peak starts at the valley). Noise smaller than
+    `threshold` never starts or splits a peak.
+
+    update() / feed() return (kind, Peak) events; each Peak is a snapshot copy.
+    """
+
+    def __init__(self, threshold, baseline_window=2000, end_fraction=0.05):
+        self.threshold = threshold
+        self.baseline_window = baseline_window
+        self.end_fraction = end_fraction
+        self.reset()
+
+    def reset(self):
+        self.peaks = []# completed peaks
+        self.current = None
+        self._count = 0
+        self._index = 0
+        self._minima = deque()# (index, x, y) with increasing y: rolling minimum
+        self._last_low = None# last (x, y) near the rolling minimum
+        self._apex_reported = False
+        self._valley = None
+        self._area = 0.0
+        self._valley_area = 0.0# _area up to the valley, for a peak that ends there
+        self._last = None
+
+    def update(self, x, y):
+        events = []
+        if self._last is not None and self.current is not None:
+            # Trapezoid area under the trace while a peak is open
+            last_x, last_y = self._last
+            self._area += (x - last_x) * (y + last_y) / 2
+        self._last = (x, y)
+        index = self._index
+        self._index += 1
+
+        if self.current is None:
+            minima = self._minima
+            while minima and minima[-1][2] >= y:
+                minima.pop()
+            minima.append((index, x, y))
+            while minima[0][0] <= index - self.baseline_window:
+                minima.popleft()
+            min_y = minima[0][2]
+            if y - min_y < self.threshold / 2 or self._last_low is None:
+                self._last_low = (x, y)
+            elif y - min_y >= self.threshold:
+                self._start(*self._last_low, x, y, events)
+            return events
+
+        peak = self.current
+        if y > peak.apex_y and not self._apex_reported:
+            peak.apex_x, peak.apex_y = x, y
+            self._set_valley(x, y)
+            return events
+        if y < self._valley[1]:
+            self._set_valley(x, y)
+        if not self._apex_reported:
+            if peak.apex_y - y >= self.threshold:
+                self._apex_reported = True
+                events.append((PEAK_APEX, replace(peak)))
+            return events
+        valley_x, valley_y = self._valley
+        if y - valley_y >= self.threshold:
+            # Rising out of a valley: close this peak there and open the next one
+            self._end(valley_x, valley_y, events)
+            self._start(valley_x, valley_y, x, y, events)
+        elif y - peak.start_y <= max(self.threshold / 2, self.end_fraction * peak.height):
+            self._end(x, y, events)
+            self._minima.clear()
+            self._minima.append((index, x, y))
+            self._last_low = (x, y)
+        return events
+
+    def feed(self, xs, ys):
+        # NaN samples (e.g. before a smoothing filter's first full window) are skipped
+        events = []
+        for x, y in zip(xs, ys):
+            if x == x and y == y:
+                events.extend(self.update(x, y))
+        return events
+
+    def _start(self, start_x, start_y, x, y, events):
+        self._count += 1
+        self.current = Peak(self._count, start_x, start_y, x, y)
+        self._apex_reported = False
+        # Area from the start point to here, approximated as one trapezoid
+        self._area = (x - start_x) * (y + start_y) / 2
+        self._set_valley(x, y)
+        events.append((PEAK_START, replace(self.current)))
+
+    def _set_valley(self, x, y):
+        self._valley = (x, y)
+        self._valley_area = self._area
+
+    def _end(self, end_x, end_y, events):
+        peak = self.current
+        peak.end_x, peak.end_y = end_x, end_y
+        if self._last is not None and end_x != self._last[0]:
+            # Ended at an earlier valley: take back the area accumulated since
+            self._area = self._valley_area
+        peak.area = self._area - (end_x - peak.start_x) * (peak.start_y + end_y) / 2
+        self.peaks.append(peak)
+        self.current = None
+        events.append((PEAK_END, replace(peak)))
@@ -1,7 +1,10 @@
 #plotting.py ver 0.5.0
 #adding plotting of pumpB percent
+import numpy as np
 import pyqtgraph as pg
 
+DERIVED_CHANNEL_COLORS = ('g', (255, 165, 0), (100, 149, 237), (255, 105, 180), 'w')# cycled
+
 def create_plot_widget(parent):
     """
     Initializes and returns a pyqtgraph PlotWidget with default labels and ranges.
@@ -15,11 +18,21 @@ def create_plot_widget(parent):
     plot_widget.setStyleSheet("border: 1px solid white;")
     return plot_widget
 
+def step_marker(number, volume):
+    # Dashed line where a method step starts, for plot_widget.addItem
+    return pg.InfiniteLine(volume, pen=pg.mkPen('w', width=1, style=pg.QtCore.Qt.DashLine), label=f"Step {number}",
+                           labelOpts={"position": 0.95, "color": 'w'})
+
 def update_plot(plot_widget, elapsed_time_data, eluate_volume_data,
         chan1_AU280_data, chan2_data, frac_mark_data,
-        run_volume, max_y_value, pumpB_percent_data=None):
+        run_volume, max_y_value, pumpB_percent_data=None, smoothed_volume_data=None, smoothed_data=None,
+        chan1_label='AU_280', derived_data=None):
     """
     Updates the plot with new data and autoscales the Y-axis if needed.
+    Data may be lists or NumPy arrays (arrays are plotted without copying).
+    smoothed_volume_data/smoothed_data add the live smoothed AU_280 curve (NaN gaps allowed).
+    The Y-axis autoscales to chan1_AU280_data, so a baseline-corrected trace sets its own range.
+    derived_data: {name: values} derived channels, drawn against eluate volume like Chan2.
     """
     plot_widget.clear()
 
@@ -27,9 +40,18 @@ def update_plot(plot_widget, elapsed_time_data, eluate_volume_data,
     pen_chan2 = pg.mkPen(color='y', width=2)# Yellow
     pen_frac_mark = pg.mkPen(color='m', width=2)# Magenta
 
-    curve1 = plot_widget.plot(eluate_volume_data, chan1_AU280_data, pen=pen_chan1_AU280, name='AU_280')
+    curve1 = plot_widget.plot(eluate_volume_data, chan1_AU280_data, pen=pen_chan1_AU280, connect='finite', name=chan1_label)
     curve2 = plot_widget.plot(eluate_volume_data, chan2_data, pen=pen_chan2, name='Chan2')
     curve3 = plot_widget.plot(eluate_volume_data, frac_mark_data, pen=pen_frac_mark, name='Fraction')
+    derived_curves = []
+    for i, (name, values) in enumerate((derived_data or {}).items()):
+        pen_derived = pg.mkPen(color=DERIVED_CHANNEL_COLORS[i % len(DERIVED_CHANNEL_COLORS)], width=1)
+        derived_curves.append((plot_widget.plot(eluate_volume_data, values, pen=pen_derived, connect='finite', name=name), name))
+    curve_smoothed = None
+    if smoothed_data is not None and len(smoothed_data):
+        pen_smoothed = pg.mkPen(color='w', width=2)# White
+        curve_smoothed = plot_widget.plot(smoothed_volume_data, smoothed_data, pen=pen_smoothed,
+                                          connect='finite', name='Smoothed')
 
     # Add legend if not already present
     #if not plot_widget.plotItem.legend:
@@ -45,17 +67,21 @@ def update_plot(plot_widget, elapsed_time_data, eluate_volume_data,
     else:
         plot_widget.plotItem.legend.clear()  # ✅ Prevent duplicate entries
 
-    plot_widget.plotItem.legend.addItem(curve1, 'AU_280')
+    plot_widget.plotItem.legend.addItem(curve1, chan1_label)
     plot_widget.plotItem.legend.addItem(curve2, 'Chan2')
     plot_widget.plotItem.legend.addItem(curve3, 'Fraction')
+    if curve_smoothed is not None:
+        plot_widget.plotItem.legend.addItem(curve_smoothed, 'Smoothed')
+    for curve, name in derived_curves:
+        plot_widget.plotItem.legend.addItem(curve, name)
 
 
     # Set X-axis range
     plot_widget.setXRange(0, run_volume)
 
     # Autoscale Y-axis based on max AU_280 value
-    if chan1_AU280_data:
-        max_chan1 = max(chan1_AU280_data)
+    if len(chan1_AU280_data) and np.isfinite(chan1_AU280_data).any():
+        max_chan1 = float(np.nanmax(chan1_AU280_data))
         new_max_y = max_chan1 * 1.1# Add 10% headroom
         if new_max_y > max_y_value:
             max_y_value = new_max_y
@@ -63,7 +89,7 @@ def update_plot(plot_widget, elapsed_time_data, eluate_volume_data,
     
     
     # Secondary Y-axis for PumpB %
-    if pumpB_percent_data and any(p > 0 for p in pumpB_percent_data):
+    if pumpB_percent_data is not None and len(pumpB_percent_data) and np.any(np.asarray(pumpB_percent_data) > 0):
         try:
             if not hasattr(plot_widget, 'right_axis') or plot_widget.right_axis is None:
                 right_axis = pg.ViewBox()
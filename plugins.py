@@ -0,0 +1,251 @@
+#plugins.py ver 0.5.0
+#in-run plugins: hooks on the sample stream, method step transitions and listener events
+#
+#A plugin is a module (--plugins name or path/to/file.py) with create_plugin(), which returns
+#an object with any of the hook methods below (subclassing Plugin is optional). Each plugin
+#runs on its own thread: the acquisition worker and the GUI only enqueue for it, so a slow or
+#stuck plugin can't hold up acquisition or logging. Samples reach it through a coalescing
+#StageQueue (a lagging plugin gets the newest samples, merged), events through a bounded deque.
+#
+#Every call is timed against the plugin's budget. DEMOTE_AFTER overruns in a row demote it:
+#on_samples is then called at most every DEMOTED_INTERVAL seconds with everything since the
+#last call. DISABLE_AFTER more overruns, an exception count of ERROR_LIMIT, or one call running
+#longer than HANG_TIMEOUT disable it. Python can't interrupt a call, so budgets are enforced by
+#calling less often, not by cutting a call short.
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from collections import deque
+from acquisition import StageQueue, POLICY_COALESCE
+from commands import LatencyStats
+from fplc_logging import get_logger
+
+HOOK_SAMPLES = "on_samples"# (block): dict of read-only column arrays, as logged (derived, smoothed, corrected too)
+HOOK_STEP = "on_step"# (index, step, transition): method step dict from the method editor
+HOOK_EVENT = "on_event"# (name, args): listener, link and worker signals, see gui.PLUGIN_*_EVENTS
+HOOKS = (HOOK_SAMPLES, HOOK_STEP, HOOK_EVENT)
+
+STEP_START = "start"# step sent to the client
+STEP_END = "end"# step's run volume delivered
+STEP_PAUSE = "pause"
+STEP_STOP = "stop"
+
+PLUGIN_ACTIVE = "active"
+PLUGIN_DEMOTED = "demoted"
+PLUGIN_DISABLED = "disabled"
+
+DEFAULT_BUDGET = 0.02# seconds per call
+DEMOTE_AFTER = 3
+DISABLE_AFTER = 10
+DEMOTED_INTERVAL = 1.0# seconds
+HANG_TIMEOUT = 5.0# seconds
+ERROR_LIMIT = 5
+SAMPLE_QUEUE_CAPACITY = 1 << 14# samples a plugin may fall behind before the oldest are dropped
+EVENT_QUEUE_CAPACITY = 256
+
+log = get_logger("plugins")
+
+
+class Plugin:
+    # Optional base class: every hook does nothing
+    name = None# defaults to the module name
+    budget = None# seconds per call; None uses the host's budget
+
+    def on_samples(self, block):
+        pass
+
+    def on_step(self, index, step, transition):
+        pass
+
+    def on_event(self, name, args):
+        pass
+
+
+def load_plugin(spec):
+    """
+    Imports a plugin module by name or .py path and returns (name, create_plugin).
+    Raises ImportError if there is no such module or it has no create_plugin().
+    """
+    if spec.endswith(".py"):
+        name = os.path.splitext(os.path.basename(spec))[0]
+        module_spec = importlib.util.spec_from_file_location(f"fplc_plugin_{name}", spec)
+        if module_spec is None:
+            raise ImportError(f"Plugin {spec}: not a Python file")
+        module = importlib.util.module_from_spec(module_spec)
+        try:
+            module_spec.loader.exec_module(module)
+        except FileNotFoundError:
+            raise ImportError(f"Plugin {spec}: file not found") from None
+    else:
+        name = spec.rpartition(".")[2]
+        module = importlib.import_module(spec)
+    factory = getattr(module, "create_plugin", None)
+    if not callable(factory):
+        raise ImportError(f"Plugin {spec}: no create_plugin()")
+    return name, factory
+
+
+class PluginRunner:
+    """
+    One plugin, its thread and its queues. Hooks the plugin doesn't define are never queued.
+    """
+
+    def __init__(self, plugin, name, budget=DEFAULT_BUDGET):
+        self.plugin = plugin
+        self.name = getattr(plugin, "name", None) or name
+        self.budget = getattr(plugin, "budget", None) or budget
+        self.hooks = {hook: getattr(plugin, hook) for hook in HOOKS if callable(getattr(plugin, hook, None))}
+        self.state = PLUGIN_ACTIVE
+        self.samples = StageQueue(f"plugin {self.name}", SAMPLE_QUEUE_CAPACITY, POLICY_COALESCE, self._wake_up)
+        self.events = deque(maxlen=EVENT_QUEUE_CAPACITY)
+        self.events_dropped = 0
+        self.timing = {hook: LatencyStats() for hook in self.hooks}
+        self.overruns = 0
+        self.strikes = 0# overruns in a row while active, overruns in all while demoted
+        self.errors = 0
+        self.busy_since = None# monotonic start of the call in progress
+        self._next_samples = 0.0# demoted: no on_samples call before this
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=f"Plugin-{self.name}", daemon=True)
+
+    @property
+    def enabled(self):
+        return self.state != PLUGIN_DISABLED
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def put_samples(self, block):
+        if HOOK_SAMPLES in self.hooks and self.enabled:
+            self.samples.put(block, wait=False)
+
+    def put_event(self, hook, args):
+        if hook in self.hooks and self.enabled:
+            if len(self.events) == self.events.maxlen:
+                self.events_dropped += 1
+            self.events.append((hook, args))
+            self._wake.set()
+
+    def check_hung(self, now):
+        # Producer side: a call that never returns can't report its own overrun
+        started = self.busy_since
+        if started is not None and self.enabled and now - started > HANG_TIMEOUT:
+            self._disable(f"call running for {now - started:.1f} s")
+
+    def report(self):
+        return {
+            "name": self.name, "state": self.state, "budget_ms": self.budget * 1000.0, "overruns": self.overruns,
+            "errors": self.errors, "samples_dropped": self.samples.dropped, "events_dropped": self.events_dropped,
+            **{hook: stats.as_dict() for hook, stats in self.timing.items()}
+        }
+
+    def _wake_up(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping and self.enabled:
+            timeout = None
+            if self.state == PLUGIN_DEMOTED and self.samples.depth():
+                timeout = max(0.0, self._next_samples - time.monotonic())
+            self._wake.wait(timeout)
+            self._wake.clear()
+            while self.events and self.enabled and not self._stopping:
+                hook, args = self.events.popleft()
+                self._call(hook, *args)
+            if self.state == PLUGIN_DEMOTED and time.monotonic() < self._next_samples:
+                continue
+            block = self.samples.get()
+            if block is not None and self.enabled and not self._stopping:
+                self._call(HOOK_SAMPLES, block)
+                self._next_samples = time.monotonic() + DEMOTED_INTERVAL
+
+    def _call(self, hook, *args):
+        started = self.busy_since = time.monotonic()
+        try:
+            self.hooks[hook](*args)
+        except Exception:
+            self.errors += 1
+            log.exception("Plugin %s: %s failed", self.name, hook)
+            if self.errors >= ERROR_LIMIT:
+                self._disable(f"{self.errors} errors")
+        finally:
+            self.busy_since = None
+        elapsed = time.monotonic() - started
+        self.timing[hook].add(elapsed)
+        if elapsed <= self.budget:
+            if self.state == PLUGIN_ACTIVE:
+                self.strikes = 0
+            return
+        self.overruns += 1
+        self.strikes += 1
+        log.debug("Plugin %s: %s took %.1f ms, budget %.1f ms", self.name, hook, elapsed * 1000.0, self.budget * 1000.0)
+        if self.state == PLUGIN_ACTIVE and self.strikes >= DEMOTE_AFTER:
+            self.state = PLUGIN_DEMOTED
+            self.strikes = 0
+            log.warning("Plugin %s demoted: %d calls over its %.1f ms budget; samples now every %.1f s",
+                        self.name, DEMOTE_AFTER, self.budget * 1000.0, DEMOTED_INTERVAL)
+        elif self.state == PLUGIN_DEMOTED and self.strikes >= DISABLE_AFTER:
+            self._disable(f"{DISABLE_AFTER} more calls over budget while demoted")
+
+    def _disable(self, reason):
+        if self.state == PLUGIN_DISABLED:
+            return
+        self.state = PLUGIN_DISABLED
+        self.samples.clear()
+        self.events.clear()
+        self._wake.set()
+        log.warning("Plugin %s disabled: %s", self.name, reason)
+
+
+class PluginHost:
+    """
+    The plugins of one instrument window. samples() is called by the acquisition worker,
+    step() and event() by the GUI (or any thread): all of them only enqueue.
+    """
+
+    def __init__(self, plugins=(), budget=DEFAULT_BUDGET):
+        # plugins: (name, create_plugin) pairs from load_plugin; each window gets its own instances
+        self.runners = [PluginRunner(factory(), name, budget) for name, factory in plugins]
+        for runner in self.runners:
+            runner.start()
+
+    def __bool__(self):
+        return bool(self.runners)
+
+    def samples(self, block):
+        if not self.runners:
+            return
+        now = time.monotonic()
+        # Views, so a plugin can't write into the worker's arrays
+        view = {}
+        for name, column in block.items():
+            view[name] = column.view()
+            view[name].flags.writeable = False
+        for runner in self.runners:
+            runner.check_hung(now)
+            runner.put_samples(view)
+
+    def step(self, index, step, transition):
+        for runner in self.runners:
+            runner.put_event(HOOK_STEP, (index, dict(step), transition))
+
+    def event(self, name, *args):
+        now = time.monotonic()
+        for runner in self.runners:
+            runner.check_hung(now)
+            runner.put_event(HOOK_EVENT, (name, args))
+
+    def report(self):
+        return [runner.report() for runner in self.runners]
+
+    def stop(self):
+        for runner in self.runners:
+            runner.stop()
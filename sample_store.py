@@ -0,0 +1,211 @@
+#sample_store.py ver 0.5.0
+#growable column store for run data (one NumPy array per channel instead of Python lists)
+import os
+import shutil
+import tempfile
+import numpy as np
+from acquisition import block_length, slice_block
+
+# Plotted/analysed run columns. Times and volumes keep float64 so hours-long runs
+# stay precise; the signal channels are float32 (the ADC has 16 bits).
+RUN_COLUMNS = {
+    "elapsed_time": np.float64,
+    "eluate_volume": np.float64,
+    "frac_mark": np.float32,
+    "Chan1": np.float32,
+    "Chan1_AU280": np.float32,
+    "Chan2": np.float32,
+    "pumpB_percent": np.float32,
+}
+DEFAULT_MEMORY_BUDGET = 32 << 20# bytes of live run history kept in RAM
+SUMMARY_BUCKET = 8# samples per min/max pair when history is first spilled
+
+
+class ColumnStore:
+    """
+    Equal-length columns in preallocated arrays that double when full, so appends
+    are amortised O(1) and readers get zero-copy views of the filled part.
+    Views stay valid until the next append that grows the store or clear().
+    """
+
+    def __init__(self, columns=RUN_COLUMNS, capacity=4096):
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self._initial_capacity = capacity
+        self._size = 0
+        self._arrays = {name: np.empty(capacity, dtype) for name, dtype in self.dtypes.items()}
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, name):
+        return self._arrays[name][:self._size]
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    @property
+    def capacity(self):
+        return len(next(iter(self._arrays.values())))
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def append(self, block):
+        """
+        Appends a dict of equal-length arrays. Columns missing from block are zero-filled;
+        extra keys are ignored.
+        """
+        count = len(next(iter(block.values()))) if block else 0
+        if not count:
+            return
+        end = self._size + count
+        if end > self.capacity:
+            self._grow(end)
+        for name, array in self._arrays.items():
+            if name in block:
+                array[self._size:end] = block[name]
+            else:
+                array[self._size:end] = 0
+        self._size = end
+
+    def columns(self):
+        return {name: self[name] for name in self._arrays}
+
+    def clear(self, release=True):
+        # release=False keeps the grown buffers for the next run of similar length
+        self._size = 0
+        if release:
+            self._arrays = {name: np.empty(self._initial_capacity, dtype) for name, dtype in self.dtypes.items()}
+
+    def _grow(self, needed):
+        capacity = max(self.capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        for name, array in self._arrays.items():
+            grown = np.empty(capacity, array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._arrays[name] = grown
+
+
+def envelope_block(block, bucket, key, peak_columns=()):
+    """
+    Min/max decimation: from every `bucket` rows keeps the two where `key` is lowest
+    and highest, in their original order, so peaks and dips survive at any zoom.
+    Columns in peak_columns take the largest value of the bucket instead.
+    """
+    count = block_length(block)
+    if bucket <= 2 or not count:
+        return block
+    starts = np.arange(0, count, bucket)
+    values = block[key]
+    full = count // bucket * bucket
+    lows = [values[:full].reshape(-1, bucket).argmin(axis=1)]
+    highs = [values[:full].reshape(-1, bucket).argmax(axis=1)]
+    if full < count:
+        lows.append([values[full:].argmin()])
+        highs.append([values[full:].argmax()])
+    low, high = np.concatenate(lows) + starts, np.concatenate(highs) + starts
+    rows = np.stack((np.minimum(low, high), np.maximum(low, high)), axis=1).ravel()
+    out = slice_block(block, rows)
+    for name in peak_columns:
+        if name in block:
+            out[name] = np.repeat(np.maximum.reduceat(block[name], starts), 2)
+    return out
+
+
+class SpillingColumnStore(ColumnStore):
+    """
+    ColumnStore with a fixed memory budget, for runs of any length. The columns hold a
+    min/max summary of older samples (envelope_block) followed by the newest samples at
+    full resolution. When full, the oldest quarter of the full-resolution part is written
+    to per-column files in a temporary directory under spill_dir and summarised; when the
+    summary is full it is re-thinned 2:1. self[name] stays a zero-copy view (summary, then
+    recent samples), so plotting cost is bounded too; history() reads the spilled samples
+    back at full resolution through np.memmap.
+    """
+
+    def __init__(self, columns=RUN_COLUMNS, budget=DEFAULT_MEMORY_BUDGET, spill_dir=None,
+                 key="Chan1_AU280", peak_columns=("frac_mark",)):
+        row_bytes = sum(np.dtype(dtype).itemsize for dtype in columns.values())
+        capacity = max(1 << 12, budget // row_bytes)
+        super().__init__(columns, capacity)
+        self.summary_capacity = capacity // 4 * 2# even: pairs of rows
+        self.spill_dir = spill_dir
+        self.key = key
+        self.peak_columns = peak_columns
+        self._reset_spill()
+
+    def _reset_spill(self):
+        self.bucket = SUMMARY_BUCKET
+        self.spilled = 0# samples written to disk
+        self._summary_size = 0# rows of summary at the start of each column
+        self._spill_path = None
+
+    @property
+    def samples(self):
+        # Everything appended this run, spilled or not
+        return self.spilled + self._size - self._summary_size
+
+    def append(self, block):
+        count = block_length(block)
+        chunk = (self.capacity - self.summary_capacity) // 4
+        for start in range(0, count, chunk):
+            part = slice_block(block, slice(start, start + chunk)) if count > chunk else block
+            while self._size + block_length(part) > self.capacity:
+                self._spill()
+            super().append(part)
+
+    def history(self, name, start=0, stop=None):
+        """
+        Samples start..stop of the run at full resolution (a copy).
+        """
+        stop = self.samples if stop is None else min(stop, self.samples)
+        parts = []
+        if start < self.spilled:
+            spilled = np.memmap(os.path.join(self._spill_path, name), self.dtypes[name], mode='r', shape=(self.spilled,))
+            parts.append(np.array(spilled[start:min(stop, self.spilled)]))
+        recent = self[name][self._summary_size:]
+        parts.append(recent[max(0, start - self.spilled):max(0, stop - self.spilled)])
+        return np.concatenate(parts)
+
+    def clear(self, release=True):
+        # Keeps the preallocated columns: their size is the budget
+        super().clear(release=False)
+        if self._spill_path is not None:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
+        self._reset_spill()
+
+    def _spill(self):
+        hot_start = self._summary_size
+        hot = self._size - hot_start
+        count = max(self.bucket, hot // 4 // self.bucket * self.bucket)
+        rows = {name: array[hot_start:hot_start + count] for name, array in self._arrays.items()}
+        self._write_spill(rows)
+        while self._summary_size + 2 * -(-count // self.bucket) > self.summary_capacity:
+            self._rethin()
+        summary = envelope_block(rows, self.bucket, self.key, self.peak_columns)
+        start, end = self._summary_size, self._summary_size + block_length(summary)
+        for name, array in self._arrays.items():
+            array[start:end] = summary[name]
+            array[end:end + hot - count] = array[hot_start + count:self._size]
+        self._summary_size = end
+        self._size = end + hot - count
+
+    def _rethin(self):
+        # Pairs of two neighbouring buckets -> one pair for the doubled bucket; the rows
+        # after the summary are left where they are, _spill moves them
+        summary = {name: array[:self._summary_size] for name, array in self._arrays.items()}
+        thinned = envelope_block(summary, 4, self.key, self.peak_columns)
+        self._summary_size = block_length(thinned)
+        for name, array in self._arrays.items():
+            array[:self._summary_size] = thinned[name]
+        self.bucket *= 2
+
+    def _write_spill(self, rows):
+        if self._spill_path is None:
+            self._spill_path = tempfile.mkdtemp(prefix="run_history_", dir=self.spill_dir)
+        for name, column in rows.items():
+            with open(os.path.join(self._spill_path, name), 'ab') as f:
+                np.ascontiguousarray(column).tofile(f)
+        self.spilled += block_length(rows)
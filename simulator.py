@@ -0,0 +1,458 @@
+#simulator.py ver 0.5.0
+#simulated FPLC client (pumps, valves, ADC, fraction collector) for load and integration testing
+#
+#  python simulator.py --host 127.0.0.1 --rate 100 --speed 10
+#  python simulator.py --rate 1000 --format bin1 --inject pumpA@30:5,valve@120
+#
+#Connects to FPLCServer like the Raspberry Pi client, answers method packets and
+#streams a synthetic chromatogram while the ADC is on. --speed runs the simulated
+#clock (pump volumes, elapsed_time, wash and error timers) faster than real time;
+#--rate is samples per simulated second (default: the SCAN_RATE the host asks for).
+import argparse
+import json
+import select
+import socket
+import time
+import numpy as np
+from framing import encode_length_prefixed
+from telemetry import FORMAT_CSV, FORMAT_BINARY, SAMPLE_DTYPE, SUPPORTED_FORMATS, MAX_SAMPLES_PER_FRAME, encode_frame
+
+FULL_SCALE_COUNTS = 32767
+DEFAULT_RATE = 10.0# samples per simulated second when the host sends no SCAN_RATE
+TICK = 0.01# seconds of wall time between scheduler passes
+VALVE_TRAVEL_TIME = 0.5# simulated seconds
+JSON_COMMANDS = (
+    "ISOCRATIC_RUN_METHOD_JSON", "GRADIENT_RUN_METHOD_JSON", "METHOD_STOP_JSON", "WASH_PUMPS_JSON",
+    "FRAC_CONTROL_JSON", "PING"
+)
+PLAIN_COMMANDS = ("PAUSE_ADC", "RESUME_ADC")
+# position in the step (fraction of its volume), height (fraction of full scale), width (fraction of its volume)
+DEFAULT_PEAKS = ((0.30, 0.15, 0.010), (0.45, 0.60, 0.015), (0.62, 0.35, 0.020), (0.80, 0.08, 0.030))
+
+ERROR_MESSAGES = {
+    "pumpA": ("PumpA error", "PumpA Error has been cleared"),
+    "pumpB": ("PumpB error", "PumpB Error has been cleared"),
+    "frac": ("Fraction Collector error", "Fraction Collector Error has been cleared"),
+    "valve": ("Valve Malfunction", None),
+}
+
+
+def split_commands(buffer):
+    """
+    Splits server output into (name, payload) pairs. The server writes commands
+    back to back without a delimiter, so each one is recognised by its name and,
+    for JSON commands, by decoding exactly one JSON object after 'NAME:'.
+    Returns (commands, unconsumed text).
+    """
+    decoder = json.JSONDecoder()
+    commands = []
+    while buffer:
+        for name in JSON_COMMANDS:
+            if buffer.startswith(name + ":"):
+                try:
+                    payload, end = decoder.raw_decode(buffer, len(name) + 1)
+                except ValueError:
+                    if _next_command_at(buffer, 1) == -1:
+                        return commands, buffer# incomplete, wait for more
+                    payload, end = None, _next_command_at(buffer, 1)
+                commands.append((name, payload))
+                buffer = buffer[end:]
+                break
+        else:
+            if buffer.startswith("FORMAT:"):
+                fmt = next((f for f in SUPPORTED_FORMATS if buffer.startswith(f, 7)), None)
+                if fmt is None:
+                    return commands, buffer
+                commands.append(("FORMAT", fmt))
+                buffer = buffer[7 + len(fmt):]
+                continue
+            name = next((n for n in PLAIN_COMMANDS if buffer.startswith(n)), None)
+            if name is not None:
+                commands.append((name, None))
+                buffer = buffer[len(name):]
+                continue
+            if any(token.startswith(buffer) for token in _tokens()):
+                return commands, buffer# partial command name
+            end = _next_command_at(buffer, 1)
+            print(f"[Simulator] Ignoring unknown server output: {buffer[:end] if end != -1 else buffer!r}")
+            buffer = buffer[end:] if end != -1 else ""
+    return commands, buffer
+
+
+def _tokens():
+    return [name + ":" for name in JSON_COMMANDS] + list(PLAIN_COMMANDS) + ["FORMAT:"]
+
+
+def _next_command_at(buffer, start):
+    found = [i for i in (buffer.find(token, start) for token in _tokens()) if i != -1]
+    return min(found) if found else -1
+
+
+def parse_injections(spec):
+    """
+    'pumpA@30:5,valve@120' -> [(30.0, "pumpA", 5.0), (120.0, "valve", None)]
+    Times are simulated seconds after connecting; ':N' clears the error N seconds later.
+    """
+    injections = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        kind, _, when = entry.partition("@")
+        if kind not in ERROR_MESSAGES or not when:
+            raise argparse.ArgumentTypeError(f"bad injection '{entry}' (kinds: {', '.join(ERROR_MESSAGES)})")
+        at, _, duration = when.partition(":")
+        injections.append((float(at), kind, float(duration) if duration else None))
+    return sorted(injections)
+
+
+class SimClock:
+    """
+    Simulated seconds since start, running `speed` times faster than the wall clock.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self._start = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self._start) * self.speed
+
+
+class Chromatogram:
+    """
+    Synthetic UV trace: Gaussian peaks on a drifting baseline with noise, in ADC counts.
+    """
+
+    def __init__(self, peaks=DEFAULT_PEAKS, baseline=0.01, drift=0.02, noise=0.002, seed=None):
+        self.peaks = np.array(peaks, dtype=np.float64).reshape(-1, 3)
+        self.baseline = baseline
+        self.drift = drift
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+    def counts(self, fraction):
+        """
+        fraction: array of positions through the step (eluate volume / step volume).
+        """
+        centre, height, width = self.peaks[:, 0:1], self.peaks[:, 1:2], self.peaks[:, 2:3]
+        signal = (height * np.exp(-0.5 * ((fraction - centre) / width) ** 2)).sum(axis=0)
+        signal += self.baseline + self.drift * fraction
+        signal += self.rng.normal(0.0, self.noise, len(fraction))
+        return np.clip(signal * FULL_SCALE_COUNTS, -FULL_SCALE_COUNTS, FULL_SCALE_COUNTS).astype(np.int32)
+
+
+class Step:
+    __slots__ = ("gradient", "flowrate", "volume", "started", "pumpB_min", "pumpB_max", "delivered", "done")
+
+    def __init__(self, packet, gradient, now):
+        self.gradient = gradient
+        self.flowrate = float(packet.get("FLOWRATE", 0.0))
+        self.volume = float(packet.get("VOLUME", 0.0))
+        self.pumpB_min = float(packet.get("PumpB_min_percent", 0.0))
+        self.pumpB_max = float(packet.get("PumpB_max_percent", 0.0))
+        self.started = now
+        self.delivered = 0.0
+        self.done = False
+
+    def pumpB_percent(self, volume):
+        if not self.gradient or self.volume <= 0:
+            return np.zeros_like(volume)
+        return self.pumpB_min + (self.pumpB_max - self.pumpB_min) * np.clip(volume / self.volume, 0.0, 1.0)
+
+
+class SimulatedFPLCClient:
+    def __init__(self, host="127.0.0.1", port=5000, name=None, rate=None, speed=1.0, fmt=FORMAT_CSV,
+                 hello=True, heartbeat=5.0, progress_interval=1.0, wash_time=30.0, frac_volume=0.5,
+                 injections=(), chromatogram=None, verbose=False):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.fixed_rate = rate# None: follow the host's SCAN_RATE
+        self.rate = rate or DEFAULT_RATE
+        self.clock = SimClock(speed)
+        self.requested_format = fmt
+        self.hello = hello
+        self.heartbeat = heartbeat
+        self.progress_interval = progress_interval
+        self.wash_time = wash_time
+        self.frac_volume = frac_volume
+        self.injections = list(injections)
+        self.chromatogram = chromatogram or Chromatogram()
+        self.verbose = verbose
+        self.sock = None
+        self.format = FORMAT_CSV
+        self._format_seen = False
+        self.running = False
+        self._rx = ""
+        self._sequence = 0
+        self._timers = []# (simulated time, callable)
+        self.step = None
+        self.adc_on = False
+        self.adc_paused = False
+        self.frac_on = False
+        self._adc_started = 0.0
+        self._adc_pause_total = 0.0
+        self._adc_paused_at = None
+        self._samples_sent = 0
+        self._last_tube = 0.0
+        self._tube_origin = 0.0# eluate volume where tube counting starts (None: at the next sample)
+        self._next_progress = 0.0
+        self._next_heartbeat = 0.0
+        self.samples_total = 0
+
+    # --- connection ---
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print(f"[Simulator] Connected to {self.host}:{self.port}")
+        if self.hello:
+            hello = {"formats": [self.requested_format], "acks": True, "ping": True}
+            if self.name:
+                hello["name"] = self.name
+            self.sock.sendall(f"HELLO:{json.dumps(hello)}\n".encode('utf-8'))
+            self._wait_for_format()
+        for at, kind, duration in self.injections:
+            self._schedule(at, lambda kind=kind: self._raise_error(kind))
+            if duration is not None and ERROR_MESSAGES[kind][1] is not None:
+                self._schedule(at + duration, lambda kind=kind: self.send_text(ERROR_MESSAGES[kind][1]))
+
+    def _wait_for_format(self, timeout=5.0):
+        # Nothing else may be sent until the server has chosen the format
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._receive(deadline - time.monotonic()) is None or self._format_seen:
+                return
+        print("[Simulator] No FORMAT reply; continuing with csv")
+
+    def close(self):
+        self.running = False
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def run(self, duration=None):
+        self.running = True
+        wall_end = None if duration is None else time.monotonic() + duration
+        try:
+            while self.running and (wall_end is None or time.monotonic() < wall_end):
+                if self._receive(TICK) is None:
+                    print("[Simulator] Server closed the connection")
+                    break
+                self._tick(self.clock.now())
+        except (BrokenPipeError, ConnectionResetError) as e:
+            print(f"[Simulator] Connection lost: {e}")
+        finally:
+            self.close()
+
+    # --- sending ---
+
+    def send_text(self, message):
+        if self.verbose:
+            print(f"[Simulator] -> {message}")
+        data = message.encode('utf-8')
+        if self.format == FORMAT_BINARY:
+            self.sock.sendall(encode_length_prefixed(data))
+        else:
+            self.sock.sendall(data + b"\n")
+
+    def send_samples(self, samples):
+        if self.format == FORMAT_BINARY:
+            parts = []
+            for start in range(0, len(samples), MAX_SAMPLES_PER_FRAME):
+                parts.append(encode_length_prefixed(encode_frame(self._sequence, samples[start:start + MAX_SAMPLES_PER_FRAME])))
+                self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+            self.sock.sendall(b"".join(parts))
+        else:
+            lines = [
+                f"{c1},{c2},{t:.3f},{v:.4f},{f:.1f},{b:.2f}\n"
+                for c1, c2, t, v, f, b in samples.tolist()
+            ]
+            self.sock.sendall("".join(lines).encode('utf-8'))
+        self.samples_total += len(samples)
+
+    # --- receiving ---
+
+    def _receive(self, timeout):
+        """
+        Handles whatever the server sent within `timeout`. Returns None on EOF.
+        """
+        readable, _, _ = select.select([self.sock], [], [], max(0.0, timeout))
+        if not readable:
+            return 0
+        data = self.sock.recv(65536)
+        if not data:
+            return None
+        self._rx += data.decode('utf-8', errors='replace')
+        commands, self._rx = split_commands(self._rx)
+        for name, payload in commands:
+            self.handle_command(name, payload)
+        return len(data)
+
+    def handle_command(self, name, payload):
+        if self.verbose or name not in ("PING",):
+            print(f"[Simulator] <- {name} {payload if payload is not None else ''}")
+        now = self.clock.now()
+        if name == "FORMAT":
+            self.format = payload
+            self._format_seen = True
+            return
+        if name == "PING":
+            if isinstance(payload, dict):
+                t1 = time.time()
+                self.send_text(f"PONG:{json.dumps(dict(payload, t1=t1, t2=time.time()))}")
+            return
+        self._ack(name, payload)
+        if name in ("ISOCRATIC_RUN_METHOD_JSON", "GRADIENT_RUN_METHOD_JSON") and isinstance(payload, dict):
+            self._start_step(payload, name == "GRADIENT_RUN_METHOD_JSON", now)
+        elif name == "METHOD_STOP_JSON" and isinstance(payload, dict):
+            self._stop_method(payload, now)
+        elif name == "WASH_PUMPS_JSON" and isinstance(payload, dict):
+            for pump in payload.get("WASH_PUMPS", []):
+                self._schedule(now + self.wash_time, lambda pump=pump: self.send_text(f"PUMP_{pump}_WASH_COMPLETED"))
+        elif name == "FRAC_CONTROL_JSON" and isinstance(payload, dict):
+            self.frac_on = bool(payload.get("COLLECT"))
+            if self.frac_on:
+                # New tube from the next sample on
+                self._tube_origin = None
+                self._last_tube = -1.0
+        elif name == "PAUSE_ADC" and self.adc_on and not self.adc_paused:
+            self.adc_paused = True
+            self._adc_paused_at = now
+        elif name == "RESUME_ADC" and self.adc_paused:
+            self.adc_paused = False
+            self._adc_pause_total += now - self._adc_paused_at
+
+    def _ack(self, name, payload):
+        if isinstance(payload, dict) and "CMD_ID" in payload:
+            self.send_text(f"ACK:{payload['CMD_ID']}")
+        else:
+            self.send_text(f"ACK:{name}")
+
+    # --- instrument model ---
+
+    def _start_step(self, packet, gradient, now):
+        self.step = Step(packet, gradient, now)
+        self._next_progress = now
+        if "System_Valve_Position" in packet:
+            self._move_valve(packet["System_Valve_Position"], now)
+        if packet.get("START_ADC") and not self.adc_on:
+            if self.fixed_rate is None:
+                self.rate = float(packet.get("SCAN_RATE", DEFAULT_RATE))
+            self.adc_on = True
+            self.adc_paused = False
+            self._adc_started = now
+            self._adc_pause_total = 0.0
+            self._samples_sent = 0
+            self._last_tube = 0.0
+        if packet.get("START_FRAC"):
+            # FRAC_MODE PEAKS: start on waste, the host switches tubes with FRAC_CONTROL_JSON
+            self.frac_on = packet.get("FRAC_MODE") != "PEAKS"
+            self._tube_origin = 0.0
+
+    def _stop_method(self, packet, now):
+        self.step = None
+        if packet.get("STOP_ADC"):
+            self.adc_on = False
+        if packet.get("STOP_FRAC"):
+            self.frac_on = False
+        if "System_Valve_Position" in packet:
+            self._move_valve(packet["System_Valve_Position"], now)
+
+    def _move_valve(self, position, now):
+        self._schedule(now + VALVE_TRAVEL_TIME, lambda: self.send_text(f"VALVE_POSITION:{position}"))
+
+    def _raise_error(self, kind):
+        message = ERROR_MESSAGES[kind][0]
+        self.send_text(message)
+        if kind == "valve":
+            self.step = None
+
+    def _schedule(self, at, action):
+        self._timers.append((at, action))
+        self._timers.sort(key=lambda timer: timer[0])
+
+    def _tick(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            _at, action = self._timers.pop(0)
+            action()
+        wall = time.monotonic()
+        if self.heartbeat and wall >= self._next_heartbeat:
+            self._next_heartbeat = wall + self.heartbeat
+            self.send_text("HEARTBEAT")
+        step = self.step
+        if step is not None and not step.done:
+            step.delivered = min(step.volume, (now - step.started) * step.flowrate / 60.0)
+            if step.delivered >= step.volume:
+                step.done = True
+            if step.done or now >= self._next_progress:
+                self._next_progress = now + self.progress_interval
+                label = "Gradient_running" if step.gradient else "PumpA_running"
+                self.send_text(f"{label} {step.delivered:.3f}")
+        if self.adc_on and not self.adc_paused:
+            self._emit_samples(now)
+
+    def _emit_samples(self, now):
+        elapsed_now = now - self._adc_started - self._adc_pause_total
+        due = int(elapsed_now * self.rate)
+        count = due - self._samples_sent
+        if count <= 0:
+            return
+        index = np.arange(self._samples_sent + 1, due + 1, dtype=np.float64)
+        self._samples_sent = due
+        samples = np.zeros(count, dtype=SAMPLE_DTYPE)
+        elapsed = index / self.rate
+        step = self.step
+        flowrate = step.flowrate if step is not None else 0.0
+        volume = elapsed * flowrate / 60.0
+        samples["elapsed_time"] = elapsed
+        samples["eluate_volume"] = volume
+        step_volume = step.volume if step is not None and step.volume > 0 else 1.0
+        samples["chan1_counts"] = self.chromatogram.counts(volume / step_volume)
+        pumpB = step.pumpB_percent(volume) if step is not None else np.zeros(count)
+        samples["pumpB_percent"] = pumpB
+        samples["chan2_counts"] = (pumpB / 100.0 * FULL_SCALE_COUNTS * 0.5).astype(np.int32)
+        if self.frac_on and self.frac_volume > 0:
+            # Mark the first sample of each new tube
+            if self._tube_origin is None:
+                self._tube_origin = volume[0]
+            tube = np.floor((volume - self._tube_origin) / self.frac_volume)
+            samples["frac_mark"] = np.diff(tube, prepend=self._last_tube) > 0
+            self._last_tube = tube[-1]
+        self.send_samples(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated FPLC client for testing the controller GUI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--name", default=None, help="instrument name sent in HELLO")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="samples per simulated second (10-1000), default: the host's SCAN_RATE")
+    parser.add_argument("--speed", type=float, default=1.0, help="simulated seconds per wall-clock second")
+    parser.add_argument("--format", default=FORMAT_CSV, choices=SUPPORTED_FORMATS)
+    parser.add_argument("--no-hello", action="store_true", help="behave like a client without HELLO (CSV only)")
+    parser.add_argument("--heartbeat", type=float, default=5.0, help="seconds between HEARTBEATs, 0 for none")
+    parser.add_argument("--wash-time", type=float, default=30.0, help="simulated seconds per pump wash")
+    parser.add_argument("--frac-volume", type=float, default=0.5, help="ml per fraction tube")
+    parser.add_argument("--inject", type=parse_injections, default=[],
+                        help="errors to raise, e.g. pumpA@30:5,frac@60:10,valve@120")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--duration", type=float, default=None, help="wall-clock seconds to run")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    client = SimulatedFPLCClient(
+        args.host, args.port, name=args.name, rate=args.rate, speed=args.speed, fmt=args.format,
+        hello=not args.no_hello, heartbeat=args.heartbeat, wash_time=args.wash_time,
+        frac_volume=args.frac_volume, injections=args.inject, chromatogram=Chromatogram(seed=args.seed),
+        verbose=args.verbose
+    )
+    client.connect()
+    try:
+        client.run(args.duration)
+    except KeyboardInterrupt:
+        client.close()
+    print(f"[Simulator] Sent {client.samples_total} samples")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#step_index.py ver 0.5.0
+#which logged rows of a run belong to which method step
+#
+#A run logs every UV-monitored step of a method that follows on ("Continue") from the one
+#before. StepIndex keeps, per step, its parameters, its row and byte range in the run CSV,
+#its elapsed time and eluate volume range and when it started and ended (wall clock). It is
+#saved next to the run CSV as <run>_steps.csv, so one step is read back with a seek
+#(read_step) instead of a scan of the whole file.
+import csv
+import io
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+STEP_FIELDS = ("Flowrate (ml/min)", "Run Volume (ml)", "Pump Mode", "System Valve", "Diverter", "Monitor",
+               "Frac Collect", "End Action", "PumpB_min_percent", "PumpB_max_percent")
+STEP_INDEX_FIELDNAMES = [
+    "Step", "Start_Row", "End_Row", "Start_Byte", "End_Byte", "Start_Time (sec)", "End_Time (sec)",
+    "Start_Volume (ml)", "End_Volume (ml)", "Started_At", "Ended_At", *STEP_FIELDS
+]
+
+
+def step_parameters(step):
+    # Method editor step dict -> STEP_FIELDS values
+    gradient = step.get("PumpB Gradient", {}) if step.get("Pump Mode") == "Gradient" else {}
+    params = {name: step.get(name, "") for name in STEP_FIELDS[:8]}
+    params["PumpB_min_percent"] = gradient.get("Min", 0.0)
+    params["PumpB_max_percent"] = gradient.get("Max", 0.0)
+    return params
+
+
+@dataclass(slots=True)
+class StepRecord:
+    number: int# 1-based, as in the method editor
+    params: dict
+    final: bool = True# the run ends with this step
+    started_at: str = ""# step sent to the client
+    ended_at: str = ""
+    start_time: float = None# elapsed seconds (client clock)
+    end_time: float = None
+    start_volume: float = None# ml
+    end_volume: float = None
+    start_row: int = None# data rows of the run CSV
+    end_row: int = None
+    start_byte: int = None# offsets in the run CSV
+    end_byte: int = None
+    flowrate: float = field(init=False)
+    run_volume: float = field(init=False)
+
+    def __post_init__(self):
+        self.flowrate = float(self.params.get("Flowrate (ml/min)") or 0.0)
+        self.run_volume = float(self.params.get("Run Volume (ml)") or 0.0)
+
+    @property
+    def rows(self):
+        # Slice of the run's data rows (e.g. DataFrame.iloc, or arrays in logged order)
+        return slice(self.start_row, self.end_row)
+
+    @property
+    def volume_limit(self):
+        return self.start_volume + self.run_volume
+
+    def volume(self, elapsed_time):
+        # Pumps stop once the step volume is delivered; only the final step runs past it (the run end cuts it)
+        volume = self.start_volume + np.maximum(elapsed_time - self.start_time, 0.0) * (self.flowrate / 60)
+        return volume if self.final else np.minimum(volume, self.volume_limit)
+
+    def as_row(self):
+        return {
+            "Step": self.number, "Start_Row": self.start_row, "End_Row": self.end_row,
+            "Start_Byte": self.start_byte, "End_Byte": self.end_byte,
+            "Start_Time (sec)": self.start_time, "End_Time (sec)": self.end_time,
+            "Start_Volume (ml)": self.start_volume, "End_Volume (ml)": self.end_volume,
+            "Started_At": self.started_at, "Ended_At": self.ended_at, **self.params
+        }
+
+
+class StepIndex:
+    """
+    Steps of one run. begin() is called by the GUI as each step is sent; the acquisition
+    worker then activates it at the next sample batch (activate/volume: eluate volume
+    runs on across steps at each step's flowrate) and locates its first logged row
+    (locate/mark_start). finish() closes the last step when the run ends.
+    """
+
+    def __init__(self):
+        self.records = []# activated steps, in order
+        self._pending = deque()# begun by the GUI, not yet seen by the worker
+        self._unlocated = deque()# activated, first logged row not yet known
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.records[-1] if self.records else None
+
+    def begin(self, number, step, final=True):
+        record = StepRecord(number, step_parameters(step), final, started_at=datetime.now().isoformat(timespec="milliseconds"))
+        with self._lock:
+            self._pending.append(record)
+        return record
+
+    def activate(self, elapsed_time):
+        """
+        Starts steps begun since the last batch at elapsed_time (the batch's first sample).
+        The first step of a run starts at 0, where the client's elapsed time starts.
+        """
+        with self._lock:
+            pending, self._pending = list(self._pending), deque()
+        for record in pending:
+            previous = self.active
+            if previous is None:
+                record.start_time, record.start_volume = 0.0, 0.0
+            else:
+                record.start_time = float(elapsed_time)
+                record.start_volume = float(previous.volume(np.array([record.start_time]))[0])
+                previous.ended_at = record.started_at
+            self.records.append(record)
+            self._unlocated.append(record)
+
+    def volume(self, elapsed_time):
+        return self.active.volume(elapsed_time)
+
+    def run_end_volume(self):
+        # None while the run continues into a following step
+        active = self.active
+        return active.volume_limit if active is not None and active.final else None
+
+    def locate(self, elapsed_time):
+        """
+        Positions in a logged block (elapsed_time in logged order) where an activated step's
+        first row falls, as (index, record), in order.
+        """
+        cuts = []
+        while self._unlocated:
+            record = self._unlocated[0]
+            index = int(np.searchsorted(elapsed_time, record.start_time))
+            if index >= len(elapsed_time):
+                break
+            cuts.append((index, self._unlocated.popleft()))
+        return cuts
+
+    def mark_start(self, record, row, byte, elapsed_time, volume):
+        # First logged row of record; the step before it ends where it starts
+        record.start_row, record.start_byte = row, byte
+        previous = self.records[self.records.index(record) - 1] if record is not self.records[0] else None
+        if previous is not None:
+            previous.end_row, previous.end_byte = row, byte
+            previous.end_time, previous.end_volume = elapsed_time, volume
+
+    def finish(self, row, byte, elapsed_time, volume):
+        ended_at = datetime.now().isoformat(timespec="milliseconds")
+        for record in self.records:
+            if record.start_row is None:
+                # Activated but no row logged for it: an empty range at the end of the run
+                record.start_row, record.start_byte = row, byte
+                record.start_time, record.start_volume = elapsed_time, volume
+        self._unlocated.clear()
+        if self.records:
+            last = self.records[-1]
+            last.end_row, last.end_byte = row, byte
+            last.end_time, last.end_volume = elapsed_time, volume
+            last.ended_at = last.ended_at or ended_at
+            for record, following in zip(self.records, self.records[1:]):
+                if record.end_row is None:
+                    record.end_row, record.end_byte = following.start_row, following.start_byte
+                    record.end_time, record.end_volume = following.start_time, following.start_volume
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=STEP_INDEX_FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(record.as_row() for record in self.records)
+
+
+def steps_path(csv_path):
+    root, ext = os.path.splitext(csv_path)
+    return f"{root}_steps{ext}"
+
+
+def read_step_index(csv_path):
+    """
+    Step table saved with a run CSV as a DataFrame (one row per step), or None if the
+    run has none (runs logged before step indexing).
+    """
+    path = steps_path(csv_path)
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+
+def read_step(csv_path, number, steps=None):
+    """
+    The rows of step `number` of a run CSV as a DataFrame, read from the step's byte range.
+    """
+    steps = read_step_index(csv_path) if steps is None else steps
+    if steps is None:
+        raise ValueError(f"{csv_path}: no step index")
+    row = steps[steps["Step"] == number]
+    if row.empty:
+        raise ValueError(f"{csv_path}: no step {number}")
+    start, end = int(row["Start_Byte"].iloc[0]), int(row["End_Byte"].iloc[0])
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        f.seek(start)
+        data = f.read(end - start)
+    return pd.read_csv(io.BytesIO(header + data))
@@ -0,0 +1,93 @@
+#streaming_filters.py ver 0.5.0
+#filters applied to the live sample stream one batch at a time
+import numpy as np
+from scipy.ndimage import minimum_filter1d
+from scipy.signal import savgol_coeffs, lfilter
+
+
+class StreamingSavgol:
+    """
+    Savitzky-Golay smoothing of an unbounded stream with precomputed convolution
+    coefficients. Each process() call keeps the last window_length - 1 samples, so
+    successive batches give exactly what savgol_filter would give on the whole trace
+    (away from its ends).
+
+    The smoothed value for a sample needs `delay` = window_length // 2 later samples:
+    process() returns one output per input, each belonging to the sample `delay`
+    positions earlier (NaN until the first window is full). Pass the positions (e.g.
+    eluate volume) as x to get the position each output belongs to.
+    """
+
+    def __init__(self, window_length=51, polyorder=3):
+        if window_length % 2 == 0 or polyorder >= window_length:
+            raise ValueError("window_length must be odd and greater than polyorder")
+        self.window_length = window_length
+        self.polyorder = polyorder
+        self.delay = window_length // 2
+        self.coeffs = savgol_coeffs(window_length, polyorder)
+        self.reset()
+
+    def reset(self):
+        self._tail = np.empty(0)
+        self._x_tail = np.empty(0)
+
+    def process(self, values, x=None):
+        """
+        Returns smoothed values (same length as values), or (x_delayed, smoothed) when x is given.
+        """
+        count = len(values)
+        if not count:
+            return (np.empty(0), np.empty(0)) if x is not None else np.empty(0)
+        data = np.concatenate((self._tail, values))
+        self._tail = data[-(self.window_length - 1):] if self.window_length > 1 else data[:0]
+        smoothed = np.full(count, np.nan)
+        if len(data) >= self.window_length:
+            out = np.convolve(data, self.coeffs, mode='valid')
+            smoothed[count - len(out):] = out# never more outputs than inputs: the tail is window_length - 1
+        if x is None:
+            return smoothed
+        positions = np.concatenate((self._x_tail, x))
+        self._x_tail = positions[-(self.window_length - 1):] if self.window_length > 1 else positions[:0]
+        x_delayed = np.full(count, np.nan)
+        available = positions[:len(positions) - self.delay] if self.delay else positions
+        x_delayed[count - min(count, len(available)):] = available[-count:] if len(available) >= count else available
+        return x_delayed, smoothed
+
+
+class StreamingBaseline:
+    """
+    Live baseline (drift) estimate: the minimum over the last `window` samples,
+    smoothed by an exponential average over `span` samples. Peaks narrower than the
+    window never lift it, and each process() call costs O(window + batch) however
+    long the run, unlike re-solving AsLS on the whole trace.
+
+    On a rising drift the estimate trails by about `window` samples' worth of drift, so
+    the window should be only a little wider than the broadest peak. Feed it a smoothed
+    trace: the minimum of a noisy one sits at the bottom of the noise.
+    NaN inputs give NaN outputs and are otherwise skipped.
+    """
+
+    def __init__(self, window=2000, span=200):
+        self.window = window
+        self.alpha = 2.0 / (span + 1)
+        self.reset()
+
+    def reset(self):
+        self._tail = np.empty(0)
+        self._state = None# exponential average filter state
+
+    def process(self, values):
+        baseline = np.full(len(values), np.nan)
+        finite = ~np.isnan(values)
+        new = np.asarray(values, dtype=np.float64)[finite]
+        if not len(new):
+            return baseline
+        data = np.concatenate((self._tail, new))
+        self._tail = data[-(self.window - 1):] if self.window > 1 else data[:0]
+        # Trailing window: origin shifts the filter so sample j sees j - window + 1 .. j
+        minima = minimum_filter1d(data, self.window, origin=(self.window - 1) // 2, mode='nearest')[-len(new):]
+        if self._state is None:
+            self._state = np.array([(1 - self.alpha) * minima[0]])
+        smoothed, self._state = lfilter([self.alpha], [1, self.alpha - 1], minima, zi=self._state)
+        baseline[finite] = smoothed
+        return baseline
@@ -0,0 +1,107 @@
+#telemetry.py ver 0.5.0
+#packed binary sample frames, negotiated at connect time as an alternative to CSV text lines
+#
+#Handshake (client initiated, so clients that never send HELLO keep the CSV text format):
+#  client -> server  'HELLO:{"formats": ["bin1", "csv"]}\n'   (newline framed)
+#  server -> client  'FORMAT:bin1'                            (or 'FORMAT:csv')
+#The client must wait for the FORMAT reply before sending anything else. After 'FORMAT:bin1'
+#every message in both directions of the client->server stream is length-prefixed
+#(framing.LENGTH_MODE): sample frames start with FRAME_MAGIC, anything else is a UTF-8 text message.
+import json
+import struct
+import numpy as np
+
+FORMAT_CSV = "csv"
+FORMAT_BINARY = "bin1"
+SUPPORTED_FORMATS = (FORMAT_BINARY, FORMAT_CSV)# server preference order
+
+FRAME_MAGIC = b"FB"
+FRAME_VERSION = 1
+# magic, version, flags, sequence number, sample count
+FRAME_HEADER = struct.Struct("<2sBBIH")
+
+SAMPLE_DTYPE = np.dtype([
+    ("chan1_counts", "<i4"),
+    ("chan2_counts", "<i4"),
+    ("elapsed_time", "<f8"),
+    ("eluate_volume", "<f8"),
+    ("frac_mark", "<f4"),
+    ("pumpB_percent", "<f4"),
+])
+
+MAX_SAMPLES_PER_FRAME = 0xFFFF
+
+
+def choose_format(hello_payload):
+    """
+    Picks the wire format from a HELLO payload (JSON text after 'HELLO:').
+    Falls back to CSV if the payload is unreadable or nothing matches.
+    """
+    try:
+        offered = json.loads(hello_payload).get("formats", [])
+    except (ValueError, AttributeError):
+        return FORMAT_CSV
+    for fmt in SUPPORTED_FORMATS:
+        if fmt in offered:
+            return fmt
+    return FORMAT_CSV
+
+
+def is_sample_frame(payload):
+    return payload[:2] == FRAME_MAGIC
+
+
+def encode_frame(sequence, samples):
+    """
+    Packs a SAMPLE_DTYPE array (or anything convertible to one) into a frame payload.
+    """
+    samples = np.asarray(samples, dtype=SAMPLE_DTYPE)
+    if len(samples) > MAX_SAMPLES_PER_FRAME:
+        raise ValueError(f"At most {MAX_SAMPLES_PER_FRAME} samples per frame")
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, sequence & 0xFFFFFFFF, len(samples))
+    return header + samples.tobytes()
+
+
+def decode_frame(payload):
+    """
+    Returns (sequence, samples) where samples is a read-only SAMPLE_DTYPE view
+    of the payload (no per-sample parsing). Raises ValueError on a bad frame.
+    """
+    if len(payload) < FRAME_HEADER.size:
+        raise ValueError("Frame shorter than header")
+    magic, version, _flags, sequence, count = FRAME_HEADER.unpack_from(payload)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame {magic!r} v{version}")
+    expected = FRAME_HEADER.size + count * SAMPLE_DTYPE.itemsize
+    if len(payload) != expected:
+        raise ValueError(f"Frame length {len(payload)} != {expected} for {count} samples")
+    samples = np.frombuffer(payload, dtype=SAMPLE_DTYPE, count=count, offset=FRAME_HEADER.size)
+    return sequence, samples
+
+
+class FrameSequenceTracker:
+    """
+    Counts frames lost or reordered between the client and the server.
+    """
+
+    def __init__(self):
+        self.expected = None
+        self.frames = 0
+        self.lost_frames = 0
+
+    def update(self, sequence):
+        """
+        Returns the number of frames missing before this one (0 if in order).
+        """
+        self.frames += 1
+        gap = 0
+        if self.expected is not None and sequence != self.expected:
+            gap = (sequence - self.expected) & 0xFFFFFFFF
+            if gap > 0x7FFFFFFF:# stale or duplicate frame
+                gap = 0
+            self.lost_frames += gap
+        self.expected = (sequence + 1) & 0xFFFFFFFF
+        return gap
+
+    def reset(self):
+        self.expected = None
@@ -0,0 +1,126 @@
+#test_framing.py ver 0.5.0
+#framing and listener decoding over a real socket: messages split across recv() calls at
+#arbitrary points must come out whole, in order, at the rate a fast client sends them
+import os
+import socket
+import sys
+import threading
+import time
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from framing import MessageFramer, LINE_MODE, LENGTH_MODE, encode_length_prefixed
+
+MESSAGES = 50_000
+MIN_RATE = 10_000# messages per second
+CHUNK_SIZES = (1, 7, 13, 1023, 4093)# odd, so message boundaries land everywhere in a chunk
+
+
+def sample_line(i):
+    # chan1, chan2, elapsed time, eluate volume, frac mark, pumpB percent
+    return f"{i},{-i},{i * 0.1:.1f},{i * 0.001:.3f},{i % 7},{i % 100}"
+
+
+def send_chunked(sock, data):
+    # Sends data in odd-sized pieces, cycling through CHUNK_SIZES
+    sizes = np.resize(CHUNK_SIZES, len(data))
+    offset = 0
+    for size in sizes:
+        if offset >= len(data):
+            break
+        sock.sendall(data[offset:offset + size])
+        offset += size
+    sock.shutdown(socket.SHUT_WR)
+
+
+def pump(data, feed):
+    """
+    Sends data through a socketpair from a second thread and feeds each recv() to feed.
+    Returns the seconds from first send to last byte received.
+    """
+    sender, receiver = socket.socketpair()
+    try:
+        thread = threading.Thread(target=send_chunked, args=(sender, data), daemon=True)
+        started = time.perf_counter()
+        thread.start()
+        while True:
+            chunk = receiver.recv(65536)
+            if not chunk:
+                break
+            feed(chunk)
+        elapsed = time.perf_counter() - started
+        thread.join()
+    finally:
+        sender.close()
+        receiver.close()
+    return elapsed
+
+
+@pytest.mark.parametrize("mode", [LINE_MODE, LENGTH_MODE])
+def test_framer_over_socketpair(mode):
+    payloads = [sample_line(i).encode() for i in range(MESSAGES)]
+    if mode == LINE_MODE:
+        data = b"".join(payload + b"\n" for payload in payloads)
+    else:
+        data = b"".join(encode_length_prefixed(payload) for payload in payloads)
+    framer = MessageFramer(mode=mode)
+    frames = []
+    elapsed = pump(data, lambda chunk: frames.extend(framer.feed(chunk)))
+    frames.extend(framer.flush())
+
+    assert frames == payloads
+    assert framer.pending_bytes() == 0
+    assert MESSAGES / elapsed >= MIN_RATE, f"{MESSAGES / elapsed:.0f} msg/s"
+
+
+def test_listener_over_socketpair():
+    from listener import ReceiveClientSignalsAndData
+
+    listener = ReceiveClientSignalsAndData()
+    listener.sample_buffer.active = True
+    heartbeats = []
+    listener.heartbeat_callback = heartbeats.append
+    lines = [sample_line(i) for i in range(MESSAGES)]
+    lines[MESSAGES // 2:MESSAGES // 2] = ["HEARTBEAT"]# a control message in the middle of the stream
+    data = "".join(line + "\n" for line in lines).encode()
+    elapsed = pump(data, listener.feed)
+    samples = listener.sample_buffer.drain()
+
+    i = np.arange(MESSAGES)
+    assert len(samples) == MESSAGES
+    assert np.array_equal(samples["chan1_counts"], i)
+    assert np.array_equal(samples["chan2_counts"], -i)
+    assert np.allclose(samples["elapsed_time"], np.round(i * 0.1, 1))
+    assert np.allclose(samples["eluate_volume"], np.round(i * 0.001, 3))
+    assert np.array_equal(samples["frac_mark"], i % 7)
+    assert np.array_equal(samples["pumpB_percent"], i % 100)
+    assert len(heartbeats) == 1
+    assert listener.message_counts["DATA"] == MESSAGES
+    assert MESSAGES / elapsed >= MIN_RATE, f"{MESSAGES / elapsed:.0f} msg/s"
+
+
+@pytest.mark.parametrize("mode", [LINE_MODE, LENGTH_MODE])
+def test_listener_survives_oversized_frame(mode):
+    from listener import ReceiveClientSignalsAndData
+
+    listener = ReceiveClientSignalsAndData()
+    listener.sample_buffer.active = True
+    listener.framer.set_mode(mode)
+    max_size = listener.framer.max_frame_size
+    if mode == LINE_MODE:
+        oversized = b"x" * (2 * max_size)# no newline
+        following = b"x" * 1000 + b"\n" + sample_line(1).encode() + b"\n"# rest of the oversized line, then a sample
+    else:
+        oversized = encode_length_prefixed(b"x" * (max_size + 1))[:1 << 16]
+        following = encode_length_prefixed(sample_line(1).encode())
+    listener.feed(oversized)# must not raise on the server loop thread
+    assert listener.message_counts["MALFORMED"] == 1
+    assert listener.framer.pending_bytes() == 0
+    assert listener.framer.mode == mode
+    listener.feed(following)
+    samples = listener.sample_buffer.drain()
+    assert list(samples["chan1_counts"]) == [1]
+    assert listener.message_counts["UNKNOWN"] == 0
@@ -0,0 +1,66 @@
+#test_sample_store.py ver 0.5.0
+#SpillingColumnStore: bounded memory, and history() gives back every sample exactly
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sample_store import SpillingColumnStore, RUN_COLUMNS
+
+SAMPLES = 200_000
+BUDGET = 1 << 20# bytes: small, so the run spills and the summary is re-thinned
+
+
+def run_block(start, stop):
+    i = np.arange(start, stop)
+    signal = np.where(i % 25_000 == 12_500, 1.0, 0.01 * np.sin(i / 50.0))# one-sample peaks
+    return {
+        "elapsed_time": i * 0.1,
+        "eluate_volume": i * 0.001,
+        "frac_mark": (i % 1000 == 0).astype(np.float32),
+        "Chan1": signal.astype(np.float32) * 3,
+        "Chan1_AU280": signal.astype(np.float32),
+        "Chan2": np.zeros(len(i), np.float32),
+        "pumpB_percent": (i % 100).astype(np.float32),
+    }
+
+
+def fill(store):
+    rng = np.random.default_rng(1)
+    start = 0
+    while start < SAMPLES:
+        stop = min(SAMPLES, start + int(rng.integers(1, 5000)))
+        store.append(run_block(start, stop))
+        start = stop
+
+
+def test_history_is_exact(tmp_path):
+    store = SpillingColumnStore(budget=BUDGET, spill_dir=tmp_path)
+    nbytes = store.nbytes
+    fill(store)
+    expected = run_block(0, SAMPLES)
+
+    assert store.spilled > 0
+    assert store.samples == SAMPLES
+    assert store.nbytes == nbytes
+    for name in RUN_COLUMNS:
+        assert np.array_equal(store.history(name), expected[name].astype(RUN_COLUMNS[name]))
+    # Ranges across the spilled / in-memory boundary
+    for start, stop in ((0, 10), (store.spilled - 5, store.spilled + 5), (SAMPLES - 7, None), (150_000, 10 ** 9)):
+        end = SAMPLES if stop is None else min(stop, SAMPLES)
+        assert np.array_equal(store.history("elapsed_time", start, stop), expected["elapsed_time"][start:end])
+
+
+def test_summary_keeps_peaks_and_clear_removes_spill(tmp_path):
+    store = SpillingColumnStore(budget=BUDGET, spill_dir=tmp_path)
+    fill(store)
+
+    # The plotted view is bounded but still shows every one-sample peak and fraction mark
+    assert len(store) <= store.capacity
+    assert np.count_nonzero(store["Chan1_AU280"] == 1.0) == SAMPLES // 25_000
+    assert store["frac_mark"].sum() > 0
+    assert os.listdir(tmp_path)
+    store.clear()
+    assert store.samples == 0
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,108 @@
+#test_step_index.py ver 0.5.0
+#StepIndex row/byte ranges against a run CSV logged the way the acquisition worker logs it
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_logger import DataLogger
+from step_index import StepIndex, read_step, read_step_index, steps_path
+
+DATA_FIELDNAMES = ["Time (sec)", "Volume (ml)", "Value"]
+METADATA_FIELDNAMES = ["RUN_VOLUME (ml)"]
+STEPS = [# method editor steps chained by "Continue"; the last one ends the run
+    {"Flowrate (ml/min)": 6.0, "Run Volume (ml)": 1.0, "Pump Mode": "Isocratic", "End Action": "Continue"},
+    {"Flowrate (ml/min)": 3.0, "Run Volume (ml)": 0.5, "Pump Mode": "Gradient", "End Action": "Continue",
+     "PumpB Gradient": {"Min": 0.0, "Max": 50.0}},
+    {"Flowrate (ml/min)": 12.0, "Run Volume (ml)": 2.0, "Pump Mode": "Isocratic", "End Action": "Stop"},
+]
+STEP_STARTS = (0.0, 10.0, 20.0)# elapsed seconds each step is sent at
+RATE = 10.0# Hz
+BATCH = 7# samples per worker batch
+
+
+class RunLogger:
+    # The parts of gui.Worker.log_samples / write_rows that place step boundaries
+    def __init__(self, logger, steps):
+        self.logger = logger
+        self.steps = steps
+        self.rows = 0
+        self.last = None
+
+    def log(self, block):
+        start = 0
+        for index, record in self.steps.locate(block["time"]):
+            self.write(block, start, index)
+            self.steps.mark_start(record, self.rows, self.logger.tell(), float(block["time"][index]),
+                                  float(block["volume"][index]))
+            start = index
+        self.write(block, start, len(block["time"]))
+
+    def write(self, block, start, stop):
+        columns = [block["time"][start:stop], block["volume"][start:stop], block["value"][start:stop]]
+        if not len(columns[0]):
+            return
+        if not self.logger.metadata_written:
+            first = dict(zip(DATA_FIELDNAMES, (float(column[0]) for column in columns)))
+            self.logger.write_metadata({**first, "RUN_VOLUME (ml)": 3.5})
+            self.logger.append_data_columns([column[1:] for column in columns])
+        else:
+            self.logger.append_data_columns(columns)
+        self.rows += len(columns[0])
+        self.last = (float(columns[0][-1]), float(columns[1][-1]))
+
+
+@pytest.fixture
+def run_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)# DataLogger changes directory into its log folder
+    logger = DataLogger(str(tmp_path), METADATA_FIELDNAMES, DATA_FIELDNAMES)
+    steps = StepIndex()
+    run = RunLogger(logger, steps)
+    time = np.arange(0, 30.0, 1 / RATE)
+    sent = 0
+    for start in range(0, len(time), BATCH):
+        batch = time[start:start + BATCH]
+        while sent < len(STEPS) and STEP_STARTS[sent] <= batch[0]:
+            steps.begin(sent + 1, STEPS[sent], final=sent == len(STEPS) - 1)
+            sent += 1
+        steps.activate(batch[0])
+        volume = steps.volume(batch)
+        run.log({"time": batch, "volume": volume, "value": np.sin(batch)})
+    steps.finish(run.rows, logger.tell(), *run.last)
+    csv_path = os.path.join(tmp_path, "run.csv")
+    os.replace(logger.temp_path, csv_path)
+    steps.write(steps_path(csv_path))
+    return csv_path, steps
+
+
+def test_step_ranges_cover_the_run(run_csv):
+    csv_path, steps = run_csv
+    data = pd.read_csv(csv_path)
+    records = steps.records
+
+    assert [record.number for record in records] == [1, 2, 3]
+    assert records[0].start_row == 0 and records[-1].end_row == len(data)
+    for record, following in zip(records, records[1:]):
+        assert record.end_row == following.start_row
+        assert record.end_byte == following.start_byte
+    # Volume runs on across steps, each step capped at its run volume until the next starts
+    volume = data["Volume (ml)"].to_numpy()
+    assert np.all(np.diff(volume) >= 0)
+    assert volume[records[1].start_row - 1] <= records[0].volume_limit + 1e-9
+
+
+def test_read_step_matches_full_read(run_csv):
+    csv_path, steps = run_csv
+    data = pd.read_csv(csv_path)
+    index = read_step_index(csv_path)
+
+    assert list(index["Step"]) == [1, 2, 3]
+    for record in steps.records:
+        step = read_step(csv_path, record.number, index)
+        pd.testing.assert_frame_equal(step, data.iloc[record.rows].reset_index(drop=True), check_dtype=False)
+        assert step["Time (sec)"].iloc[0] == pytest.approx(record.start_time)
+    with pytest.raises(ValueError):
+        read_step(csv_path, 4)
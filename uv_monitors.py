@@ -0,0 +1,92 @@
+#uv_monitors.py ver 0.5.0
+#UV monitor drivers: ADC input range, AUFS settings and the counts -> volts -> AU280 transfer
+#
+#Adding a detector is a new entry in MONITOR_SPECS (or a register_driver() call): the
+#settings dialog, the plot range and the acquisition worker all read from this registry.
+import numpy as np
+
+ADC_MIN_COUNTS = -32768# signed 16-bit ADC codes
+ADC_MAX_COUNTS = 32767
+AU_FLOOR = 0.001# AU280 never reported below this (keeps log plots and peak ratios sane)
+AU_DECIMALS = 4
+
+# name: ADC full-scale input (V), recorder output at full AUFS deflection (V), AUFS settings offered
+MONITOR_SPECS = {
+    "Pharmacia UV MII": {
+        "adc_full_scale": 0.256,
+        "recorder_full_scale": 0.1,
+        "aufs_ranges": (2.0, 1.0, 0.5, 0.2, 0.1, 0.05, 0.02, 0.01, 0.005, 0.002, 0.001),
+    },
+    "Uvcord SII": {
+        "adc_full_scale": 1.024,
+        "recorder_full_scale": 1.0,
+        "aufs_ranges": (2.0, 1.0, 0.5, 0.2, 0.1, 0.05, 0.02, 0.01, 0.005),
+    },
+}
+DEFAULT_MONITOR = "Pharmacia UV MII"
+
+
+def linear_transfer(volts, aufs, recorder_full_scale):
+    # Recorder output is proportional to absorbance: full_scale volts == aufs AU
+    return np.maximum(AU_FLOOR, np.round(volts * (aufs / recorder_full_scale), AU_DECIMALS))
+
+
+class UVMonitorDriver:
+    """
+    One detector model. Volts are an affine transform of the ADC counts; AU280 comes
+    from a table with one entry per 16-bit ADC code, built once per AUFS setting, so
+    the rounding and floor of the transfer function cost nothing per sample.
+    transfer(volts, aufs, recorder_full_scale) -> AU280; None reports volts unchanged.
+    """
+
+    def __init__(self, name, adc_full_scale, recorder_full_scale=None, aufs_ranges=(), transfer=linear_transfer):
+        self.name = name
+        self.adc_full_scale = adc_full_scale
+        self.recorder_full_scale = recorder_full_scale
+        self.aufs_ranges = tuple(aufs_ranges)
+        self.transfer = transfer if recorder_full_scale else None
+        self.volts_per_count = adc_full_scale / 32768.0
+        self._au_tables = {}
+
+    def au_table(self, aufs):
+        key = float(aufs)
+        if key not in self._au_tables:
+            volts = np.arange(ADC_MIN_COUNTS, ADC_MAX_COUNTS + 1) * self.volts_per_count
+            self._au_tables[key] = self.transfer(volts, key, self.recorder_full_scale) if self.transfer is not None else volts
+        return self._au_tables[key]
+
+    def convert(self, chan1_counts, chan2_counts, aufs):
+        """
+        Returns (Chan1 volts, Chan1 AU280, Chan2 volts) for arrays of ADC counts.
+        """
+        # Out-of-range codes saturate at the table ends (mode='clip'), as the ADC itself would
+        au = np.take(self.au_table(aufs), chan1_counts.astype(np.intp) - ADC_MIN_COUNTS, mode='clip')
+        return chan1_counts * self.volts_per_count, au, chan2_counts * self.volts_per_count
+
+
+_drivers = {}
+
+
+def register_driver(name, **spec):
+    driver = UVMonitorDriver(name, **spec)
+    _drivers[name] = driver
+    return driver
+
+
+def get_driver(name):
+    """
+    Returns the driver for a monitor name. Unknown names (e.g. from an old method file)
+    get a pass-through driver on the default ADC range that reports volts as AU.
+    """
+    driver = _drivers.get(name)
+    if driver is None:
+        driver = UVMonitorDriver(name, MONITOR_SPECS[DEFAULT_MONITOR]["adc_full_scale"])
+    return driver
+
+
+def monitor_names():
+    return list(_drivers)
+
+
+for _name, _spec in MONITOR_SPECS.items():
+    register_driver(_name, **_spec)